@@ -0,0 +1,417 @@
+"""
+/***************************************************************************
+Name                 : Batch Document Renderer
+Description          : Renders documents from user-defined templates in a
+                       pool of worker processes.
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import json
+import logging
+import os
+import sys
+import tempfile
+from multiprocessing import cpu_count
+
+from PyQt4.QtGui import (
+    QApplication,
+    QDesktopServices
+)
+from PyQt4.QtCore import (
+    pyqtSignal,
+    QCoreApplication,
+    QObject,
+    QProcess,
+    QProcessEnvironment
+)
+
+from qgis.core import QgsApplication
+
+LOGGER = logging.getLogger('stdm')
+
+#Environment variable used to pass the database password to the workers
+DB_PASSWORD_ENV = 'STDM_RENDER_DB_PASSWORD'
+
+#Module run by each worker process
+WORKER_MODULE = 'stdm.composer.batch_renderer'
+
+
+def worker_count():
+    """
+    :return: Returns the default number of worker processes, which is
+    equal to the number of processors in the machine.
+    :rtype: int
+    """
+    try:
+        return max(cpu_count(), 1)
+
+    except NotImplementedError:
+        return 1
+
+
+def split_chunks(values, num_chunks):
+    """
+    Splits the values into contiguous chunks of near-equal size.
+    :param values: Values to be split.
+    :type values: list
+    :param num_chunks: Maximum number of chunks.
+    :type num_chunks: int
+    :return: Returns a list of chunks, no chunk is empty.
+    :rtype: list
+    """
+    num_chunks = max(1, min(num_chunks, len(values)))
+    size, remainder = divmod(len(values), num_chunks)
+
+    chunks = []
+    start = 0
+    for i in range(num_chunks):
+        end = start + size + (1 if i < remainder else 0)
+        if end > start:
+            chunks.append(values[start:end])
+        start = end
+
+    return chunks
+
+
+def python_executable():
+    """
+    :return: Returns the path to the Python interpreter used to start the
+    worker processes. Within QGIS, sys.executable usually points to the
+    QGIS executable hence the interpreter is resolved from the prefix.
+    :rtype: str
+    """
+    if sys.platform.startswith('win'):
+        return os.path.join(sys.exec_prefix, 'python.exe')
+
+    exe = sys.executable
+    if exe and os.path.basename(exe).lower().startswith('python'):
+        return exe
+
+    return 'python'
+
+
+def configuration_file_path():
+    """
+    :return: Returns the path to the configuration file loaded by the
+    workers.
+    :rtype: str
+    """
+    return QDesktopServices.storageLocation(
+        QDesktopServices.HomeLocation
+    ) + '/.stdm/configuration.stc'
+
+
+class BatchDocumentRenderer(QObject):
+    """
+    Splits the records into chunks and renders each chunk in a separate
+    process with its own QgsApplication and database connection. Results
+    are reported back per record through the signals.
+    """
+    #Number of processed records and total number of records
+    progress = pyqtSignal(int, int)
+
+    #Value of the record that failed and the error message
+    record_failed = pyqtSignal(object, str)
+
+    #Emitted once all workers have exited, False if cancelled
+    completed = pyqtSignal(bool)
+
+    def __init__(self, db_connection, config_path=None, parent=None):
+        """
+        :param db_connection: Connection of the current user.
+        :type db_connection: DatabaseConnection
+        :param config_path: Path to the configuration file, uses the
+        default configuration file if not specified.
+        :type config_path: str
+        """
+        QObject.__init__(self, parent)
+        self._db_connection = db_connection
+        self._config_path = config_path or configuration_file_path()
+
+        self._processes = []
+        self._jobs = {}
+        self._num_records = 0
+        self._num_processed = 0
+        self._cancelled = False
+
+    def is_running(self):
+        """
+        :return: True if there are workers that have not exited.
+        :rtype: bool
+        """
+        return any(p.state() != QProcess.NotRunning for p in self._processes)
+
+    def render(self, template_path, entity_field_name, entity_field_values,
+               output_mode, **kwargs):
+        """
+        Starts the worker processes. Arguments are similar to those in
+        DocumentGenerator.run_batch.
+        :param num_workers: Number of worker processes, defaults to the
+        number of processors.
+        :type num_workers: int
+        """
+        num_workers = kwargs.get('num_workers', None) or worker_count()
+
+        self._processes = []
+        self._jobs = {}
+        self._num_records = len(entity_field_values)
+        self._num_processed = 0
+        self._cancelled = False
+
+        db_conn = self._db_connection
+
+        env = QProcessEnvironment.systemEnvironment()
+        env.insert('PYTHONPATH', os.pathsep.join([p for p in sys.path if p]))
+        env.insert(DB_PASSWORD_ENV, unicode(db_conn.User.Password))
+
+        for chunk in split_chunks(list(entity_field_values), num_workers):
+            job = {
+                'template_path': template_path,
+                'entity_field_name': entity_field_name,
+                'entity_field_values': chunk,
+                'output_mode': output_mode,
+                'data_fields': kwargs.get('dataFields', []),
+                'file_extension': kwargs.get('fileExtension', ''),
+                'data_source': kwargs.get('data_source', ''),
+                'host': db_conn.Host,
+                'port': db_conn.Port,
+                'database': db_conn.Database,
+                'user': db_conn.User.UserName,
+                'config_path': self._config_path,
+                'prefix_path': QgsApplication.prefixPath(),
+                'organization': QCoreApplication.organizationName(),
+                'application': QCoreApplication.applicationName()
+            }
+
+            fd, job_path = tempfile.mkstemp(prefix='stdm_render_',
+                                            suffix='.json')
+            with os.fdopen(fd, 'w') as job_file:
+                json.dump(job, job_file)
+
+            process = QProcess(self)
+            process.setProcessEnvironment(env)
+            process.readyReadStandardOutput.connect(
+                lambda p=process: self._on_ready_read(p)
+            )
+            process.finished[int, QProcess.ExitStatus].connect(
+                lambda code, status, p=process: self._on_worker_finished(
+                    p, code
+                )
+            )
+
+            self._jobs[process] = {
+                'path': job_path,
+                'values': chunk,
+                'reported': set(),
+                'buffer': ''
+            }
+            self._processes.append(process)
+
+        for process in self._processes:
+            process.start(python_executable(),
+                          ['-m', WORKER_MODULE, self._jobs[process]['path']])
+
+    def cancel(self):
+        """
+        Stops the worker processes. Records already written are retained.
+        """
+        self._cancelled = True
+
+        for process in self._processes:
+            if process.state() != QProcess.NotRunning:
+                process.kill()
+
+    def _on_ready_read(self, process):
+        job = self._jobs[process]
+        job['buffer'] += str(process.readAllStandardOutput())
+
+        lines = job['buffer'].split('\n')
+        job['buffer'] = lines.pop()
+
+        for line in lines:
+            line = line.strip()
+            if not line:
+                continue
+
+            try:
+                result = json.loads(line)
+
+            except ValueError:
+                #Not a result line
+                LOGGER.debug(line)
+
+                continue
+
+            self._report(job, result['index'], result['status'],
+                         result['msg'])
+
+    def _report(self, job, index, status, msg):
+        if index in job['reported']:
+            return
+
+        job['reported'].add(index)
+        self._num_processed += 1
+
+        if not status:
+            self.record_failed.emit(job['values'][index], msg)
+
+        self.progress.emit(self._num_processed, self._num_records)
+
+    def _on_worker_finished(self, process, exit_code):
+        #Read any remaining results
+        self._on_ready_read(process)
+
+        job = self._jobs[process]
+
+        #Records that were not reported have not been generated
+        if not self._cancelled:
+            err_msg = unicode(str(process.readAllStandardError()),
+                              'utf-8', 'replace').strip()
+            if not err_msg:
+                err_msg = QApplication.translate(
+                    'BatchDocumentRenderer',
+                    'Worker process exited with code {0}.'
+                ).format(exit_code)
+
+            for i in range(len(job['values'])):
+                self._report(job, i, False, err_msg)
+
+        try:
+            os.remove(job['path'])
+
+        except OSError as ose:
+            LOGGER.debug(u'Could not remove render job file. {0}'.format(ose))
+
+        if not self.is_running():
+            self.completed.emit(not self._cancelled)
+
+
+class HeadlessInterface(object):
+    """
+    Provides the map canvas functionality of the QGIS interface that is
+    used by the DocumentGenerator when rendering outside QGIS.
+    """
+    def __init__(self, map_canvas):
+        self._map_canvas = map_canvas
+
+    def mapCanvas(self):
+        return self._map_canvas
+
+    def legendInterface(self):
+        return self
+
+    def setLayerVisible(self, layer, visible):
+        #There is no legend in headless mode
+        pass
+
+
+def _write_result(index, status, msg):
+    sys.stdout.write(json.dumps({
+        'index': index,
+        'status': status,
+        'msg': unicode(msg)
+    }) + '\n')
+    sys.stdout.flush()
+
+
+def render_job(job):
+    """
+    Renders the documents in the job. Executed in the worker process.
+    :param job: Job properties written by the BatchDocumentRenderer.
+    :type job: dict
+    :return: Returns True if the session could be created.
+    :rtype: bool
+    """
+    from qgis.core import (
+        QgsLayerTreeRegistryBridge,
+        QgsProject
+    )
+    from qgis.gui import (
+        QgsLayerTreeMapCanvasBridge,
+        QgsMapCanvas
+    )
+
+    app = QgsApplication([], True)
+    QCoreApplication.setOrganizationName(job['organization'])
+    QCoreApplication.setApplicationName(job['application'])
+    QgsApplication.setPrefixPath(job['prefix_path'], True)
+    QgsApplication.initQgis()
+
+    import stdm.data
+    from stdm.data.connection import DatabaseConnection
+    from stdm.security.user import User
+    from stdm.settings.config_serializer import ConfigurationFileSerializer
+    from stdm.composer.document_generator import DocumentGenerator
+
+    root = QgsProject.instance().layerTreeRoot()
+    registry_bridge = QgsLayerTreeRegistryBridge(root, QgsProject.instance())
+    canvas = QgsMapCanvas()
+    canvas_bridge = QgsLayerTreeMapCanvasBridge(root, canvas)
+
+    db_conn = DatabaseConnection(job['host'], job['port'], job['database'])
+    db_conn.User = User(job['user'], os.environ.get(DB_PASSWORD_ENV, ''))
+    stdm.data.app_dbconn = db_conn
+
+    ConfigurationFileSerializer(job['config_path']).load()
+
+    values = job['entity_field_values']
+    reported = set()
+
+    def on_record_generated(index, count, status, msg):
+        reported.add(index)
+        _write_result(index, status, msg)
+
+        return True
+
+    try:
+        generator = DocumentGenerator(HeadlessInterface(canvas))
+        status, msg = generator.run_batch(
+            job['template_path'],
+            job['entity_field_name'],
+            values,
+            job['output_mode'],
+            dataFields=job['data_fields'],
+            fileExtension=job['file_extension'],
+            data_source=job['data_source'],
+            feedback=on_record_generated
+        )
+
+    except Exception as ex:
+        status, msg = False, unicode(ex)
+
+    if not status:
+        for i in range(len(values)):
+            if not i in reported:
+                _write_result(i, False, msg)
+
+    QgsApplication.exitQgis()
+
+    return status
+
+
+def main(argv):
+    if len(argv) < 2:
+        sys.stderr.write('Usage: batch_renderer.py <job file>\n')
+
+        return 2
+
+    with open(argv[1]) as job_file:
+        job = json.load(job_file)
+
+    return 0 if render_job(job) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
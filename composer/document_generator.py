@@ -16,6 +16,7 @@ email                : gkahiu@gmail.com
  *                                                                         *
  ***************************************************************************/
 """
+import os
 import uuid
 import logging
 from datetime import date, datetime
@@ -69,6 +70,7 @@ from stdm.settings.registryconfig import RegistryConfig
 from stdm.data.pg_utils import (
     geometryType,
     pg_table_exists,
+    qgsgeometry_from_wkbelement,
     vector_layer
 )
 from stdm.data.database import STDMDb
@@ -91,6 +93,119 @@ from .table_configuration import TableConfigurationCollection
 LOGGER = logging.getLogger('stdm')
 
 
+class DocumentGenerationSession(object):
+    """
+    Holds the parsed template, composer data source, configuration
+    collections and composition that are shared by all the records in a
+    document generation batch.
+    """
+    def __init__(self, template_path, template_doc, composer_ds):
+        self.template_path = template_path
+        self.template_doc = template_doc
+        self.composer_ds = composer_ds
+
+        self.spatial_fields_config = SpatialFieldsConfiguration.create(
+            template_doc
+        )
+        self.composer_ds.setSpatialFieldsConfig(self.spatial_fields_config)
+
+        #TODO: Need to automatically register custom configuration collections
+        self.photo_config_collection = PhotoConfigurationCollection.create(
+            template_doc
+        )
+        self.table_config_collection = TableConfigurationCollection.create(
+            template_doc
+        )
+        self.chart_config_collection = ChartConfigurationCollection.create(
+            template_doc
+        )
+
+        self.composition = None
+        self.table_handlers = []
+        self.chart_handlers = []
+
+        self._composer_items = {}
+        self._label_texts = {}
+        self._picture_files = {}
+        self._spatial_field_types = {}
+
+    def spatial_field_type(self, spatial_field):
+        """
+        :param spatial_field: Name of the geometry column in the data source.
+        :type spatial_field: str
+        :return: Returns a tuple containing the geometry type and SRID of
+        the spatial field, which are only read once per session.
+        :rtype: tuple
+        """
+        if not spatial_field in self._spatial_field_types:
+            self._spatial_field_types[spatial_field] = geometryType(
+                self.composer_ds.name(),
+                spatial_field
+            )
+
+        return self._spatial_field_types[spatial_field]
+
+    def set_composition(self, composition, query_handler):
+        """
+        Sets the composition loaded from the template, creates the value
+        handlers of the table and chart items and captures the original
+        values of the items that are set using record values.
+        :param composition: Composition loaded from the template.
+        :type composition: QgsComposition
+        :param query_handler: Function for executing sub-queries required
+        by the value handlers.
+        :type query_handler: object
+        """
+        self.composition = composition
+        self._composer_items = {}
+
+        self.table_handlers = [
+            conf.create_handler(composition, query_handler)
+            for conf in self.table_config_collection.items().values()
+        ]
+        self.chart_handlers = [
+            conf.create_handler(composition, query_handler)
+            for conf in self.chart_config_collection.items().values()
+        ]
+
+        self._label_texts = {}
+        for composer_id in self.composer_ds.dataFieldMappings().reverse:
+            item = self.composer_item(composer_id)
+            if isinstance(item, QgsComposerLabel):
+                self._label_texts[composer_id] = item.text()
+
+        self._picture_files = {}
+        for conf in self.photo_config_collection.items().values():
+            item = self.composer_item(conf.item_id())
+            if isinstance(item, QgsComposerPicture):
+                self._picture_files[conf.item_id()] = item.pictureFile()
+
+    def composer_item(self, composer_id):
+        """
+        :param composer_id: Id of the composer item.
+        :type composer_id: str
+        :return: Returns the composer item with the given id in the
+        composition or None if not found.
+        :rtype: QgsComposerItem
+        """
+        if not composer_id in self._composer_items:
+            self._composer_items[composer_id] = \
+                self.composition.getComposerItemById(composer_id)
+
+        return self._composer_items[composer_id]
+
+    def reset_item_values(self):
+        """
+        Restores the label text and picture files defined in the template
+        so that the values of the previous record are not carried over.
+        """
+        for composer_id, text in self._label_texts.iteritems():
+            self.composer_item(composer_id).setText(text)
+
+        for composer_id, pic_file in self._picture_files.iteritems():
+            self.composer_item(composer_id).setPictureFile(pic_file)
+
+
 class DocumentGenerator(QObject):
     """
     Generates documents from user-defined templates.
@@ -126,6 +241,10 @@ class DocumentGenerator(QObject):
         #Value formatter for output files
         self._file_name_value_formatter = None
 
+        #Tables reflected in the current generation session
+        self._meta = None
+        self._reflected_tables = {}
+
     def link_field(self):
         """
         :return: The field name in the data source that should also exist
@@ -232,6 +351,57 @@ class DocumentGenerator(QObject):
 
         return composer_ds, ""
         
+    def create_session(self, template_path, data_source='', data_fields=None):
+        """
+        Parses the template, reflects the data source and loads the
+        composition so that they can be reused when generating documents
+        for several records.
+        :param template_path: The file path to the user-defined template.
+        :type template_path: str
+        :param data_source: Name of the data source table or view whose
+        row values will be used to name output files.
+        :type data_source: str
+        :param data_fields: Field names whose values will be used to name
+        the output files.
+        :type data_fields: list
+        :return: A tuple containing the generation session and error
+        message where applicable.
+        :rtype: tuple
+        """
+        template_doc, err_msg = self.template_document(template_path)
+        if template_doc is None:
+            return None, err_msg
+
+        composer_ds, err_msg = self.composer_data_source(template_doc)
+        if composer_ds is None:
+            return None, err_msg
+
+        #Reflect the tables afresh for each session
+        self._reset_reflected_tables()
+
+        #Set file name value formatter
+        self._file_name_value_formatter = EntityValueFormatter(
+            name=data_source
+        )
+
+        #Register field names to be used for file naming
+        if data_fields:
+            self._file_name_value_formatter.register_columns(data_fields)
+
+        session = DocumentGenerationSession(template_path, template_doc,
+                                            composer_ds)
+
+        #Load the layers required by the table composer items
+        self._table_mem_layers = load_table_layers(
+            session.table_config_collection
+        )
+
+        composition = QgsComposition(self._map_renderer)
+        composition.loadFromTemplate(template_doc)
+        session.set_composition(composition, self._exec_query)
+
+        return session, ""
+
     def run(self, *args, **kwargs):
         """
         :param templatePath: The file path to the user-defined template.
@@ -257,192 +427,295 @@ class DocumentGenerator(QObject):
         dataFields = kwargs.get("dataFields", [])
         fileExtension = kwargs.get("fileExtension", "")
         data_source = kwargs.get("data_source", "")
-        
-        templateFile = QFile(templatePath)
-        
-        if not templateFile.open(QIODevice.ReadOnly):
+
+        session, msg = self.create_session(templatePath, data_source,
+                                           dataFields)
+        if session is None:
+            return False, msg
+
+        output_dir, msg = self._output_directory(filePath, dataFields)
+        if msg:
+            return False, msg
+
+        #Execute query
+        dsTable,records = self._exec_query(session.composer_ds.name(),
+                                           entityFieldName, entityFieldValue)
+
+        if records is None or len(records) == 0:
             return False, QApplication.translate("DocumentGenerator",
-                                            "Cannot read template file.")
+                                                "No matching records in the database")
 
-        templateDoc = QDomDocument()
-        
-        if templateDoc.setContent(templateFile):
-            composerDS = ComposerDataSource.create(templateDoc)
-            spatialFieldsConfig = SpatialFieldsConfiguration.create(templateDoc)
-            composerDS.setSpatialFieldsConfig(spatialFieldsConfig)
+        name_records = self._file_name_records(session, data_source,
+                                               entityFieldName,
+                                               [entityFieldValue],
+                                               dataFields)
 
-            #Check if data source exists and return if it doesn't
-            if not self.data_source_exists(composerDS):
-                msg = QApplication.translate("DocumentGenerator",
-                                             u"'{0}' data source does not exist in the database."
-                                             u"\nPlease contact your database "
-                                             u"administrator.".format(composerDS.name()))
+        """
+        Iterate through records where a single file output will be generated for each matching record.
+        """
+        for rec in records:
+            name_rec = self._file_name_record(name_records, rec,
+                                              entityFieldValue)
+            status, msg = self._generate_record(session, rec, outputMode,
+                                                filePath, dataFields,
+                                                fileExtension, name_rec,
+                                                output_dir)
+            if not status:
                 return False, msg
 
-            #Set file name value formatter
-            self._file_name_value_formatter = EntityValueFormatter(
-                name=data_source
-            )
+        return True, "Success"
+
+    def run_batch(self, template_path, entity_field_name,
+                  entity_field_values, output_mode, **kwargs):
+        """
+        Generates documents for several records in a single session. The
+        template is parsed and the data source reflected once, the
+        matching records are fetched in one query and only the values of
+        the composer items are reset between the outputs.
+        :param template_path: The file path to the user-defined template.
+        :type template_path: str
+        :param entity_field_name: The name of the column which must exist
+        in the data source view or table.
+        :type entity_field_name: str
+        :param entity_field_values: Values for filtering the records in the
+        data source. A document is generated for each value.
+        :type entity_field_values: list
+        :param output_mode: Whether the output compositions should be
+        images or PDFs.
+        :type output_mode: int
+        :param feedback: Function called after each value has been
+        processed with the index of the value, the number of values, the
+        status and message. Generation is aborted if it returns False.
+        :type feedback: function
+        Other keyword arguments are similar to the ones in 'run'.
+        :return: A tuple containing the status and message. The status is
+        False if the session could not be created or generation was aborted.
+        :rtype: tuple
+        """
+        file_path = kwargs.get("filePath", None)
+        data_fields = kwargs.get("dataFields", [])
+        file_extension = kwargs.get("fileExtension", "")
+        data_source = kwargs.get("data_source", "")
+        feedback = kwargs.get("feedback", None)
 
-            #Register field names to be used for file naming
-            self._file_name_value_formatter.register_columns(dataFields)
+        session, msg = self.create_session(template_path, data_source,
+                                           data_fields)
+        if session is None:
+            return False, msg
 
-            #TODO: Need to automatically register custom configuration collections
-            #Photo config collection
-            ph_config_collection = PhotoConfigurationCollection.create(templateDoc)
+        output_dir, msg = self._output_directory(file_path, data_fields)
+        if msg:
+            return False, msg
 
-            #Table configuration collection
-            table_config_collection = TableConfigurationCollection.create(templateDoc)
+        ds_table, records = self._exec_query_values(
+            session.composer_ds.name(),
+            entity_field_name,
+            entity_field_values
+        )
+        ds_records = self._group_records(records, entity_field_name)
 
-            #Create chart configuration collection object
-            chart_config_collection = ChartConfigurationCollection.create(templateDoc)
+        name_records = self._file_name_records(session, data_source,
+                                               entity_field_name,
+                                               entity_field_values,
+                                               data_fields)
 
-            #Load the layers required by the table composer items
-            self._table_mem_layers = load_table_layers(table_config_collection)
-            
-            #Execute query
-            dsTable,records = self._exec_query(composerDS.name(), entityFieldName, entityFieldValue)
+        num_values = len(entity_field_values)
 
-            if records is None or len(records) == 0:
-                return False, QApplication.translate("DocumentGenerator",
-                                                    "No matching records in the database")
-            
-            """
-            Iterate through records where a single file output will be generated for each matching record.
-            """
-
-            for rec in records:
-                composition = QgsComposition(self._map_renderer)
-                composition.loadFromTemplate(templateDoc)
-                ref_layer = None
-                #Set value of composer items based on the corresponding db values
-                for composerId in composerDS.dataFieldMappings().reverse:
-                    #Use composer item id since the uuid is stripped off
-                    composerItem = composition.getComposerItemById(composerId)
-                    if not composerItem is None:
-                        fieldName = composerDS.dataFieldName(composerId)
-                        fieldValue = getattr(rec,fieldName)
-                        self._composeritem_value_handler(composerItem, fieldValue)
-
-                # Extract photo information
-                self._extract_photo_info(composition, ph_config_collection, rec)
-
-                # Set table item values based on configuration information
-                self._set_table_data(composition, table_config_collection, rec)
-
-                # Refresh non-custom map composer items
-                self._refresh_composer_maps(composition,
-                                            spatialFieldsConfig.spatialFieldsMapping().keys())
-
-                # Create memory layers for spatial features and add them to the map
-                for mapId,spfmList in spatialFieldsConfig.spatialFieldsMapping().iteritems():
-
-                    map_item = composition.getComposerItemById(mapId)
-
-                    if not map_item is None:
-                        # #Clear any previous map memory layer
-                        #self.clear_temporary_map_layers()
-
-                        for spfm in spfmList:
-                            #Use the value of the label field to name the layer
-                            lbl_field = spfm.labelField()
-                            spatial_field = spfm.spatialField()
-
-                            if not spatial_field:
-                                continue
-
-                            if lbl_field:
-                                if hasattr(rec, spfm.labelField()):
-                                    layerName = getattr(rec, spfm.labelField())
-
-                                else:
-                                    layerName = self._random_feature_layer_name(spatial_field)
-                            else:
-                                layerName = self._random_feature_layer_name(spatial_field)
-
-                            #Extract the geometry using geoalchemy spatial capabilities
-                            geom_value = getattr(rec, spatial_field)
-                            if geom_value is None:
-                                continue
-
-                            geom_func = geom_value.ST_AsText()
-                            geomWKT = self._dbSession.scalar(geom_func)
-
-                            #Get geometry type
-                            geom_type, srid = geometryType(composerDS.name(),
-                                                          spatial_field)
-
-                            #Create reference layer with feature
-                            ref_layer = self._build_vector_layer(layerName, geom_type, srid)
-
-                            if ref_layer is None or not ref_layer.isValid():
-                                continue
-                            #Add feature
-                            bbox = self._add_feature_to_layer(ref_layer, geomWKT)
-                            bbox.scale(spfm.zoomLevel())
-
-                            #Workaround for zooming to single point extent
-                            if ref_layer.wkbType() == QGis.WKBPoint:
-                                canvas_extent = self._iface.mapCanvas().fullExtent()
-                                cnt_pnt = bbox.center()
-                                canvas_extent.scale(1.0/32, cnt_pnt)
-                                bbox = canvas_extent
-
-                            #Style layer based on the spatial field mapping symbol layer
-                            symbol_layer = spfm.symbolLayer()
-                            if not symbol_layer is None:
-                                ref_layer.rendererV2().symbols()[0].changeSymbolLayer(0,spfm.symbolLayer())
-                            '''
-                            Add layer to map and ensure its always added at the top
-                            '''
-                            self.map_registry.addMapLayer(ref_layer)
-                            self._iface.mapCanvas().setExtent(bbox)
-                            self._iface.mapCanvas().refresh()
-                            # Add layer to map memory layer list
-                            self._map_memory_layers.append(ref_layer.id())
-                            self._hide_layer(ref_layer)
-                        '''
-                        Use root layer tree to get the correct ordering of layers
-                        in the legend
-                        '''
-                        self._refresh_map_item(map_item)
-
-                #Extract chart information and generate chart
-                self._generate_charts(composition, chart_config_collection, rec)
-
-                #Build output path and generate composition
-                if not filePath is None and len(dataFields) == 0:
-                    self._write_output(composition, outputMode, filePath)
-                    
-                elif filePath is None and len(dataFields) > 0:
-                    docFileName = self._build_file_name(data_source, entityFieldName,
-                                                      entityFieldValue, dataFields, fileExtension)
-
-                    # Replace unsupported characters in Windows file naming
-                    docFileName = docFileName.replace('/', '_').replace \
-                        ('\\', '_').replace(':', '_').strip('*?"<>|')
-
-
-                    if not docFileName:
-                        return (False, QApplication.translate("DocumentGenerator",
-                                    "File name could not be generated from the data fields."))
-                        
-                    outputDir = self._composer_output_path()
-                    if outputDir is None:
-                        return (False, QApplication.translate("DocumentGenerator",
-                            "System could not read the location of the output directory in the registry."))
-                    
-                    qDir = QDir()
-                    if not qDir.exists(outputDir):
-                        return (False, QApplication.translate("DocumentGenerator",
-                                "Output directory does not exist"))
+        try:
+            for i, value in enumerate(entity_field_values):
+                value_records = ds_records.get(value, [])
+
+                if len(value_records) == 0:
+                    status = False
+                    msg = QApplication.translate("DocumentGenerator",
+                                                 "No matching records in the database")
+
+                for rec in value_records:
+                    name_rec = self._file_name_record(name_records, rec,
+                                                      value)
+                    status, msg = self._generate_record(
+                        session, rec, output_mode, file_path, data_fields,
+                        file_extension, name_rec, output_dir
+                    )
+
+                    #Memory layers are only required by the current output
+                    self.clear_temporary_map_layers()
+
+                    if not status:
+                        break
+
+                if not feedback is None:
+                    if feedback(i, num_values, status, msg) is False:
+                        return False, QApplication.translate(
+                            "DocumentGenerator",
+                            "Document generation was aborted."
+                        )
+
+        finally:
+            self.clear_temporary_layers()
+
+        return True, "Success"
+
+    def _generate_record(self, session, rec, outputMode, filePath,
+                         dataFields, fileExtension, name_rec, output_dir):
+        """
+        Sets the values of the composer items in the session's composition
+        using the record values then writes the composition to file.
+        :return: A tuple containing the status and message.
+        :rtype: tuple
+        """
+        composition = session.composition
+        composerDS = session.composer_ds
+        spatialFieldsConfig = session.spatial_fields_config
+
+        #Restore the item values set by the previous record
+        session.reset_item_values()
+
+        ref_layer = None
+        #Set value of composer items based on the corresponding db values
+        for composerId in composerDS.dataFieldMappings().reverse:
+            #Use composer item id since the uuid is stripped off
+            composerItem = session.composer_item(composerId)
+            if not composerItem is None:
+                fieldName = composerDS.dataFieldName(composerId)
+                fieldValue = getattr(rec,fieldName)
+                self._composeritem_value_handler(composerItem, fieldValue)
+
+        # Extract photo information
+        self._extract_photo_info(composition, session.photo_config_collection,
+                                 rec)
+
+        # Set table item values based on configuration information
+        for table_handler in session.table_handlers:
+            table_handler.set_data_source_record(rec)
+
+        # Refresh non-custom map composer items
+        self._refresh_composer_maps(composition,
+                                    spatialFieldsConfig.spatialFieldsMapping().keys())
+
+        # Create memory layers for spatial features and add them to the map
+        for mapId,spfmList in spatialFieldsConfig.spatialFieldsMapping().iteritems():
+
+            map_item = session.composer_item(mapId)
+
+            if not map_item is None:
+                # #Clear any previous map memory layer
+                #self.clear_temporary_map_layers()
+
+                for spfm in spfmList:
+                    #Use the value of the label field to name the layer
+                    lbl_field = spfm.labelField()
+                    spatial_field = spfm.spatialField()
+
+                    if not spatial_field:
+                        continue
+
+                    if lbl_field:
+                        if hasattr(rec, spfm.labelField()):
+                            layerName = getattr(rec, spfm.labelField())
+
+                        else:
+                            layerName = self._random_feature_layer_name(spatial_field)
+                    else:
+                        layerName = self._random_feature_layer_name(spatial_field)
 
-                    absDocPath = u"{0}/{1}".format(outputDir, docFileName)
-                    self._write_output(composition, outputMode, absDocPath)
+                    #Geometry columns are selected as WKB by geoalchemy
+                    geom_value = getattr(rec, spatial_field)
+                    if geom_value is None:
+                        continue
 
-            return True, "Success"
+                    geom = qgsgeometry_from_wkbelement(geom_value)
+                    if geom is None:
+                        continue
 
-        return False, "Document composition could not be generated"
+                    #Get geometry type
+                    geom_type, srid = session.spatial_field_type(
+                        spatial_field
+                    )
+
+                    #Create reference layer with feature
+                    ref_layer = self._build_vector_layer(layerName, geom_type, srid)
+
+                    if ref_layer is None or not ref_layer.isValid():
+                        continue
+                    #Add feature
+                    bbox = self._add_feature_to_layer(ref_layer, geom)
+                    bbox.scale(spfm.zoomLevel())
+
+                    #Workaround for zooming to single point extent
+                    if ref_layer.wkbType() == QGis.WKBPoint:
+                        canvas_extent = self._iface.mapCanvas().fullExtent()
+                        cnt_pnt = bbox.center()
+                        canvas_extent.scale(1.0/32, cnt_pnt)
+                        bbox = canvas_extent
+
+                    #Style layer based on the spatial field mapping symbol layer
+                    symbol_layer = spfm.symbolLayer()
+                    if not symbol_layer is None:
+                        ref_layer.rendererV2().symbols()[0].changeSymbolLayer(0,spfm.symbolLayer())
+                    '''
+                    Add layer to map and ensure its always added at the top
+                    '''
+                    self.map_registry.addMapLayer(ref_layer)
+                    self._iface.mapCanvas().setExtent(bbox)
+                    self._iface.mapCanvas().refresh()
+                    # Add layer to map memory layer list
+                    self._map_memory_layers.append(ref_layer.id())
+                    self._hide_layer(ref_layer)
+                '''
+                Use root layer tree to get the correct ordering of layers
+                in the legend
+                '''
+                self._refresh_map_item(map_item)
+
+        #Extract chart information and generate chart
+        for chart_handler in session.chart_handlers:
+            chart_handler.set_data_source_record(rec)
+
+        #Build output path and generate composition
+        if not filePath is None and len(dataFields) == 0:
+            self._write_output(composition, outputMode, filePath)
+
+        elif filePath is None and len(dataFields) > 0:
+            docFileName = self._build_file_name(name_rec, dataFields,
+                                                fileExtension)
+
+            # Replace unsupported characters in Windows file naming
+            docFileName = docFileName.replace('/', '_').replace \
+                ('\\', '_').replace(':', '_').strip('*?"<>|')
+
+
+            if not docFileName:
+                return (False, QApplication.translate("DocumentGenerator",
+                            "File name could not be generated from the data fields."))
+
+            absDocPath = u"{0}/{1}".format(output_dir, docFileName)
+            self._write_output(composition, outputMode, absDocPath)
+
+        return True, "Success"
+
+    def _output_directory(self, file_path, data_fields):
+        """
+        Reads and validates the composer output directory, which is only
+        required when the output files are named using the data fields.
+        :return: A tuple containing the output directory and error message
+        where applicable.
+        :rtype: tuple
+        """
+        if not (file_path is None and len(data_fields) > 0):
+            return None, ""
+
+        outputDir = self._composer_output_path()
+        if outputDir is None:
+            return None, QApplication.translate("DocumentGenerator",
+                "System could not read the location of the output directory in the registry.")
+
+        qDir = QDir()
+        if not qDir.exists(outputDir):
+            return None, QApplication.translate("DocumentGenerator",
+                    "Output directory does not exist")
+
+        return outputDir, ""
 
     def _random_feature_layer_name(self, sp_field):
         return u"{0}-{1}".format(sp_field, str(uuid.uuid4())[0:8])
@@ -493,7 +766,7 @@ class DocumentGenerator(QObject):
         if layers is None:
             return
         try:
-            for lyr_id in layers:
+            for lyr_id in list(layers):
                 self.map_registry.removeMapLayer(lyr_id)
                 layers.remove(lyr_id)
 
@@ -558,44 +831,6 @@ class DocumentGenerator(QObject):
 
         self.map_registry.addMapLayers(v_layers, False)
 
-    def _set_table_data(self, composition, config_collection, record):
-        #TODO: Clean up code to adopt this design.
-        """
-        Set table data by applying appropriate filter using information
-        from the config item and the record value.
-        :param composition: Map composition.
-        :type composition: QgsComposition
-        :param config_collection: Table configuration collection specified in
-        template file.
-        :type config_collection: TableConfigurationCollection
-        :param record: Matching record from the result set.
-        :type record: object
-        """
-        table_configs = config_collection.items().values()
-
-        for conf in table_configs:
-            table_handler = conf.create_handler(composition, self._exec_query)
-            table_handler.set_data_source_record(record)
-
-    def _generate_charts(self, composition, config_collection, record):
-        """
-        Extract chart information and use it to generate charts, which are
-        exported as images then embedded in the composition as pictures.
-        :param composition: Map composition
-        :type composition: QgsComposition
-        :param config_collection: Chart configuration collection specified
-        in template file.
-        :type config_collection: ChartConfigurationCollection
-        :param record: Matching record from the result set.
-        :type record: object
-        """
-
-        chart_configs = config_collection.items().values()
-
-        for cc in chart_configs:
-            chart_handler = cc.create_handler(composition, self._exec_query)
-            chart_handler.set_data_source_record(record)
-
     def _extract_photo_info(self, composition, config_collection, record):
         """
         Extracts the photo information from the config using the record value
@@ -713,7 +948,7 @@ class DocumentGenerator(QObject):
         if QFile.exists(abs_path):
             self._composeritem_value_handler(pic_item, abs_path)
     
-    def _add_feature_to_layer(self, vlayer, geom_wkb):
+    def _add_feature_to_layer(self, vlayer, g):
         """
         Create feature and add it to the vector layer.
         Return the extents of the geometry.
@@ -723,7 +958,6 @@ class DocumentGenerator(QObject):
         dp = vlayer.dataProvider()
         
         feat = QgsFeature()
-        g = QgsGeometry.fromWkt(geom_wkb)
         feat.setGeometry(g)
         
         dp.addFeatures([feat])
@@ -758,41 +992,110 @@ class DocumentGenerator(QObject):
                 raise Exception(msg)
 
             if p == 0:
-                state = img.save(file_path)
+                page_path = file_path
 
             else:
                 fi = QFileInfo(file_path)
-                file_path = u"{0}/{1}_{2}.{3}".format(fi.absolutePath(),
+                page_path = u"{0}/{1}_{2}.{3}".format(fi.absolutePath(),
                                                              fi.baseName(),
                     (p+1), fi.suffix())
-                state = img.save(file_path)
+
+            tmp_path = self._temporary_output_path(page_path)
+            state = img.save(tmp_path)
 
             if not state:
                 msg = QApplication.translate("DocumentGenerator",
-                                        u"Error creating {0}.".format(file_path))
+                                        u"Error creating {0}.".format(page_path))
                 raise Exception(msg)
 
+            self._replace_output(tmp_path, page_path)
+
     def _export_composition_as_pdf(self, composition, file_path):
         """
         Render the composition as a PDF file.
         """
-        status = composition.exportAsPDF(file_path)
+        tmp_path = self._temporary_output_path(file_path)
+        status = composition.exportAsPDF(tmp_path)
         if not status:
             msg = QApplication.translate("DocumentGenerator",
                                         u"Error creating {0}".format(file_path))
 
             raise Exception(msg)
+
+        self._replace_output(tmp_path, file_path)
+
+    def _temporary_output_path(self, file_path):
+        """
+        :return: Returns a path in the same directory as the output file
+        where the composition is first written so that incomplete files
+        are never left in place of the output file. The suffix is retained
+        since it determines the image format.
+        :rtype: str
+        """
+        fi = QFileInfo(file_path)
+
+        return u"{0}/.{1}.{2}.tmp.{3}".format(fi.absolutePath(),
+                                              fi.completeBaseName(),
+                                              str(uuid.uuid4())[0:8],
+                                              fi.suffix())
+
+    def _replace_output(self, tmp_path, file_path):
+        """
+        Moves the temporary file to the output file location, replacing
+        any existing file.
+        """
+        try:
+            if os.name == 'nt' and os.path.exists(file_path):
+                os.remove(file_path)
+
+            os.rename(tmp_path, file_path)
+
+        except OSError as ose:
+            msg = QApplication.translate("DocumentGenerator",
+                                        u"Error creating {0}: {1}".format(
+                                            file_path, ose))
+
+            raise Exception(msg)
     
-    def _build_file_name(self, data_source, fieldName, fieldValue, data_fields,
-                         fileExtension):
+    def _file_name_records(self, session, data_source, field_name,
+                           field_values, data_fields):
         """
-        Build a file name based on the values of the specified data fields.
+        Fetches, in one query, the records in the data source used for
+        naming the output files.
+        :return: Returns the matching records grouped by the value of
+        the field or None if the records in the composer data source should
+        be used for naming the files.
+        :rtype: dict
+        """
+        if len(data_fields) == 0 or not data_source or \
+                data_source == session.composer_ds.name():
+            return None
+
+        table, results = self._exec_query_values(data_source, field_name,
+                                                 field_values)
+
+        return self._group_records(results, field_name)
+
+    def _file_name_record(self, name_records, rec, field_value):
+        """
+        :return: Returns the record whose values will be used to name the
+        output file for the given composer data source record.
+        :rtype: object
         """
-        table, results = self._exec_query(data_source,fieldName, fieldValue)
+        if name_records is None:
+            return rec
+
+        value_records = name_records.get(field_value, [])
+        if len(value_records) == 0:
+            return None
 
-        if len(results) > 0:
-            rec = results[0]
+        return value_records[0]
 
+    def _build_file_name(self, rec, data_fields, fileExtension):
+        """
+        Build a file name based on the values of the specified data fields.
+        """
+        if not rec is None:
             ds_values = []
 
             for dt in data_fields:
@@ -810,14 +1113,65 @@ class DocumentGenerator(QObject):
             
         return ""
 
+    def _reset_reflected_tables(self):
+        """
+        Discards the tables reflected in the previous generation session.
+        """
+        self._meta = MetaData(bind=STDMDb.instance().engine)
+        self._reflected_tables = {}
+
+    def _reflect_table(self, name):
+        """
+        :param name: Name of the table or view.
+        :type name: str
+        :return: Returns the reflected table, which is only reflected once
+        per generation session.
+        :rtype: Table
+        """
+        if self._meta is None:
+            self._reset_reflected_tables()
+
+        if not name in self._reflected_tables:
+            self._reflected_tables[name] = Table(name, self._meta,
+                                                 autoload=True)
+
+        return self._reflected_tables[name]
+
+    def _group_records(self, records, field_name):
+        """
+        :return: Returns the records grouped by the value of the field.
+        :rtype: dict
+        """
+        grouped = {}
+        for rec in records:
+            grouped.setdefault(getattr(rec, field_name), []).append(rec)
+
+        return grouped
+
+    def _exec_query_values(self, dataSourceName, queryField, queryValues):
+        """
+        Fetches the records whose query field matches any of the specified
+        values in one query.
+        Returns a tuple containing the reflected table and results of the query.
+        """
+        dsTable = self._reflect_table(dataSourceName)
+        try:
+            results = self._dbSession.query(dsTable).filter(
+                dsTable.c[queryField].in_(queryValues)
+            ).all()
+
+            return dsTable, results
+        except SQLAlchemyError as ex:
+            self._dbSession.rollback()
+            raise ex
+
     def _exec_query(self, dataSourceName, queryField, queryValue):
         """
         Reflects the data source then execute the query using the specified
         query parameters.
         Returns a tuple containing the reflected table and results of the query.
         """
-        meta = MetaData(bind=STDMDb.instance().engine)
-        dsTable = Table(dataSourceName, meta, autoload=True)
+        dsTable = self._reflect_table(dataSourceName)
         try:
             if not queryField and not queryValue:
                 #Return all the rows; this is currently limited to 100 rows
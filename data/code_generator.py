@@ -18,10 +18,175 @@ email                : stdm@unhabitat.org
  *                                                                         *
  ***************************************************************************/
 """
+import logging
 import re
-from stdm.data.configuration import entity_model
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.sql import (
+    column,
+    table,
+    text
+)
+
+from stdm.data.configuration.auto_generate_code import (
+    COUNTER_TABLE_SUFFIX,
+    create_code_counter_table
+)
+from stdm.data.database import STDMDb
+from stdm.data.pg_utils import pg_table_exists
 from stdm.settings import current_profile
 
+LOGGER = logging.getLogger('stdm')
+
+#Characters with a special meaning in PostgreSQL regular expressions
+_PG_REGEX_SPECIAL = re.compile(r'([\\^$.|?*+()\[\]{}])')
+
+#Counter tables known to exist in the database
+_counter_tables = set()
+
+
+def format_code(prefix, separator, leading_zero, serial):
+    """
+    :param prefix: The code prefix in front of the serial number.
+    :type prefix: String
+    :param separator: The separator between the prefix and serial number.
+    :type separator: String
+    :param leading_zero: The leading zeros to be added in front of
+    serial number.
+    :type leading_zero: String
+    :param serial: Serial number.
+    :type serial: int
+    :return: Returns the code and the formatted serial number.
+    :rtype: tuple
+    """
+    # Add 1 to append correct number of leading zero at the beginning.
+    leading_zero_len = len(leading_zero) + 1
+    formatted_serial = "%0{}d".format(leading_zero_len) % (serial,)
+
+    return u'{0}{1}{2}'.format(prefix, separator, formatted_serial), \
+        formatted_serial
+
+
+def serial_pattern(code_prefix):
+    """
+    :param code_prefix: The prefix and separator in front of the serial
+    number.
+    :type code_prefix: String
+    :return: Returns the regular expression matching the codes with the
+    given prefix, whose first group is the serial number.
+    :rtype: String
+    """
+    return u'^{0}([0-9]+)$'.format(
+        _PG_REGEX_SPECIAL.sub(r'\\\1', code_prefix)
+    )
+
+
+class CodeAllocator(object):
+    """
+    Allocates serial numbers from a counter table containing the last
+    serial number of each code prefix. The counter row is locked by the
+    update hence concurrent users are given different serial numbers and
+    allocation does not depend on the number of existing codes. The
+    counter table is created by the schema update or, for databases that
+    have not been updated, when a code is first allocated. A counter is
+    seeded from the existing codes the first time its prefix is used.
+    """
+    def __init__(self, code_table):
+        """
+        :param code_table: Name of the table containing generated codes.
+        :type code_table: String
+        """
+        self.code_table = code_table
+        self.counter_table = u'{0}{1}'.format(code_table, COUNTER_TABLE_SUFFIX)
+
+    def _ensure_counter_table(self):
+        if self.counter_table in _counter_tables:
+            return
+
+        if not pg_table_exists(self.counter_table, False):
+            create_code_counter_table(
+                STDMDb.instance().engine, self.code_table
+            )
+
+        _counter_tables.add(self.counter_table)
+
+    def _increment(self, conn, code_prefix, count):
+        sql = text(
+            u'UPDATE {0} SET last_serial = last_serial + :count '
+            u'WHERE code_prefix = :code_prefix '
+            u'RETURNING last_serial;'.format(self.counter_table)
+        )
+        row = conn.execute(sql, count=count, code_prefix=code_prefix).first()
+
+        return None if row is None else row[0]
+
+    def _seed(self, conn, code_prefix):
+        #Numeric maximum of the serial numbers in the existing codes
+        sql = text(
+            u'INSERT INTO {0} (code_prefix, last_serial) '
+            u'SELECT :code_prefix, COALESCE(MAX(CAST(SUBSTRING(code FROM '
+            u':pattern) AS bigint)), 0) FROM {1} '
+            u'WHERE code ~ :pattern;'.format(
+                self.counter_table, self.code_table
+            )
+        )
+        savepoint = conn.begin_nested()
+        try:
+            conn.execute(sql, code_prefix=code_prefix,
+                         pattern=serial_pattern(code_prefix))
+            savepoint.commit()
+
+        except IntegrityError:
+            #Seeded by another user in the meantime
+            savepoint.rollback()
+
+    def allocate(self, code_prefix, count=1, code_formatter=None):
+        """
+        Reserves a block of consecutive serial numbers for the prefix. If
+        specified, the codes are saved in the code table in the same
+        transaction.
+        :param code_prefix: The prefix and separator in front of the serial
+        number.
+        :type code_prefix: String
+        :param count: Number of serial numbers to reserve.
+        :type count: int
+        :param code_formatter: Function returning the code of a serial
+        number which is saved in the code table.
+        :type code_formatter: callable
+        :return: Returns the reserved serial numbers.
+        :rtype: list
+        """
+        self._ensure_counter_table()
+
+        conn = STDMDb.instance().engine.connect()
+        trans = conn.begin()
+        try:
+            last_serial = self._increment(conn, code_prefix, count)
+            if last_serial is None:
+                self._seed(conn, code_prefix)
+                last_serial = self._increment(conn, code_prefix, count)
+
+            serials = range(last_serial - count + 1, last_serial + 1)
+
+            if not code_formatter is None:
+                code_table = table(self.code_table, column('code'))
+                conn.execute(
+                    code_table.insert(),
+                    [{'code': code_formatter(s)} for s in serials]
+                )
+
+            trans.commit()
+
+            return serials
+
+        except Exception:
+            trans.rollback()
+            raise
+
+        finally:
+            conn.close()
+
+
 class CodeGenerator(object):
     """
     Generate unique code for a column using prefix, separator and leading zero
@@ -40,15 +205,14 @@ class CodeGenerator(object):
         self.current_profile = current_profile()
         self.code_entity = self.current_profile.auto_generate_code
 
-        self.code_model = entity_model(self.code_entity)
-
-        self.code_model_obj = self.code_model()
+        # Codes are unique per prefix within the profile's code table
+        self.allocator = CodeAllocator(self.code_entity.name)
         self.column = column
 
     def generate(self, prefix, separator, leading_zero, hide_prefix=False):
         """
-        Generates the next unique code by checking what is saved in the
-        database for a specific column.
+        Generates the next unique code for the prefix and saves it in the
+        database.
         :param prefix: The code prefix in front of the serial number.
         :type prefix: String
         :param separator: The separator used to separate code prefixes and
@@ -60,135 +224,30 @@ class CodeGenerator(object):
         :return: Returns the next unique code for the column
         :rtype: String
         """
-        matches = self.search_similar_code(prefix, separator)
-        # matches is list with tuple items.
-        # To access them 0 index is used
-        record_match = []
-
-        for item in matches:
-
-            if len(item) > 0:
-                try:
-                    # for code with prefix
-                    if prefix == item[0].rsplit(separator, 1)[0]:
-                        record_match.append(item[0])
-                    # for serial number code
-                    if prefix == '':
-                        record_match.append(item[0])
-                # if the separator is empty - '', escape the value error
-                # and append.
-                except ValueError:
-                    record_match.append(item[0])
-
-        # if no match found, start with 1
-        if len(record_match) == 0:
-            code = '{0}{1}{2}1'.format(prefix, separator, leading_zero)
-            self.save_code(code)
-            if hide_prefix:
-                code = '{0}1'.format(leading_zero)
-
-            return code
-
-        else:
-            last_serial = None
-
-            if prefix == '':
-                # get the serial number
-                last_serial = record_match[len(record_match) - 1]
-            else:
-                last_code = []
-                # get the serial number
-                try:
-                    last_code = record_match[0].rsplit(separator, 1)
-                  # if the separator is empty - '', split by numbers and letters.
-                    if len(last_code) > 1:
-                        last_serial = last_code[1]
-
-                except ValueError:
-                    if separator == '':
-                        last_serial = record_match[0].replace(prefix, '')
-
-                    else:
-                        prefix_and_serial = record_match[0].split(separator)
-                        if len(prefix_and_serial) > 0:
-                            last_serial = prefix_and_serial[len(prefix_and_serial)-1]
-
-                    # match = re.match(
-                    #     r'([a-zA-Z]+)([0-9]+)', record_match[0], re.I
-                    # )
-                #     if match:
-                #         text_numbers = match.groups()
-                #         if len(text_numbers) == 2:
-                #             last_code = text_numbers
-                #
-
-
-            if last_serial is None:
-                # print last_serial, 'last '
-                return None
-
-            # convert to integer and add 1
-            next_serial = int(last_serial) + 1
-            # Add 1 to append correct number of leading zero at the beginning.
-            leading_zero_len = len(leading_zero) + 1
-            # format again with leading 0
-            formatted_serial = "%0{}d".format(leading_zero_len) % (next_serial,)
+        return self.reserve(prefix, separator, leading_zero, 1, hide_prefix)[0]
 
-            code = '{0}{1}{2}'.format(prefix, separator, formatted_serial)
-            self.save_code(code)
-
-            if hide_prefix:
-                code = formatted_serial
-
-            # add new code with the formatted number
-            return code
-
-    def save_code(self, code):
-        """
-        Saves the code to the code table.
-        :param code: The unique code generated.
-        :type code: String
-        :return:
-        :rtype:
-        """
-        self.code_model_obj.code = code
-        self.code_model_obj.save()
-
-    def search_similar_code(self, prefix, separator):
+    def reserve(self, prefix, separator, leading_zero, count,
+                hide_prefix=False):
         """
-        Queries the database on the column to get all the values matching
-        the supplied prefix.
-        :param prefix: The code prefix in front of the serial number.
-        :type prefix: String
-        :param separator: The separator used to separate code prefixes and
-        serial numbers within a code.
-        :type separator: String
-        :return: Matching database result
-        :rtype: SQLAlchemy result proxy
+        Generates a block of unique codes in one transaction, for use when
+        importing records in bulk.
+        :param count: Number of codes to generate.
+        :type count: int
+        :return: Returns the codes, without the prefix and separator if
+        hide_prefix is True.
+        :rtype: list
         """
-        column_obj = getattr(self.code_model, 'code')
-        matches = self.code_model_obj.queryObject([column_obj]
-                                                ).filter(
-            column_obj.op('~')(u'^{}{}[0-9]'.format(prefix, separator))
-            ).order_by(column_obj.desc()).all()
-
-        return matches
-    #
-    # def search_code(self, code):
-    #     """
-    #     Queries the database on the column to get all the values matching
-    #     the supplied prefix.
-    #     :param code: The code generated.
-    #     :type code: String
-    #     :return: Matching database result
-    #     :rtype: SQLAlchemy result proxy
-    #     """
-    #
-    #     column_obj = getattr(self.code_model, 'code')
-    #     matches = self.code_model_obj.queryObject([column_obj]
-    #                                             ).filter(
-    #         column_obj.op('~')(u'^{}'.format(code))
-    #         ).order_by(column_obj.desc()).all()
-    #
-    #     return matches
-    #
+        serials = self.allocator.allocate(
+            u'{0}{1}'.format(prefix, separator),
+            count,
+            lambda s: format_code(prefix, separator, leading_zero, s)[0]
+        )
+
+        codes = [
+            format_code(prefix, separator, leading_zero, s)
+            for s in serials
+        ]
+        if hide_prefix:
+            return [c[1] for c in codes]
+
+        return [c[0] for c in codes]
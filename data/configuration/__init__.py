@@ -18,6 +18,16 @@ from stdm.data.database import (
 )
 
 
+#Mapped classes keyed by entity name, entity_only and supporting document flags
+_entity_model_cache = {}
+
+#Number of entity_model calls served from, or missed by, the cache
+_entity_model_cache_stats = {
+    'hits': 0,
+    'misses': 0
+}
+
+
 def _bind_metadata(metadata):
     # Ensures there is a connectable set in the metadata
     if metadata.bind is None:
@@ -51,6 +61,9 @@ def entity_model(entity, entity_only=False, with_supporting_document=False):
     object. Entities of 'EntitySupportingDocument' type are not supported
     since they are already mapped from their parent classes, a TypeError will
     be raised.
+    Mapped classes are cached for the lifetime of the database connection,
+    use 'clear_entity_model_cache' to reflect the tables afresh after the
+    schema has changed.
     :param entity: Entity
     :type entity: Entity
     :param entity_only: True to only reflect the table corresponding to the
@@ -64,6 +77,30 @@ def entity_model(entity, entity_only=False, with_supporting_document=False):
         raise TypeError('<EntitySupportingDocument> type not supported. '
                         'Please use the parent entity.')
 
+    # Supporting document model is only returned for the full model
+    with_supporting_document = with_supporting_document and not entity_only
+    cache_key = (entity.name, entity_only, with_supporting_document)
+
+    if cache_key in _entity_model_cache:
+        _entity_model_cache_stats['hits'] += 1
+
+        return _entity_model_cache[cache_key]
+
+    _entity_model_cache_stats['misses'] += 1
+
+    model = _reflect_entity_model(entity, entity_only,
+                                  with_supporting_document)
+
+    # Do not cache if the table has not yet been created
+    mapped_cls = model[0] if with_supporting_document else model
+    if not mapped_cls is None:
+        _entity_model_cache[cache_key] = model
+
+    return model
+
+
+def _reflect_entity_model(entity, entity_only, with_supporting_document):
+    # Reflects the tables of the entity and maps them using automap.
     rf_entities = [entity.name]
 
     if not entity_only:
@@ -125,12 +162,34 @@ def entity_model(entity, entity_only=False, with_supporting_document=False):
         generate_relationship=_gen_relationship
     )
 
-    if with_supporting_document and not entity_only:
+    if with_supporting_document:
         return getattr(Base.classes, entity.name, None), supporting_doc_model
 
     return getattr(Base.classes, entity.name, None)
 
 
+def clear_entity_model_cache():
+    """
+    Removes all mapped classes in the entity model cache. Should be called
+    whenever the database schema or configuration has been updated, or the
+    database connection has changed.
+    """
+    _entity_model_cache.clear()
+
+
+def entity_model_cache_info():
+    """
+    :return: Returns diagnostic information on the entity model cache i.e.
+    the number of hits, misses and mapped classes currently in the cache.
+    :rtype: dict
+    """
+    return {
+        'hits': _entity_model_cache_stats['hits'],
+        'misses': _entity_model_cache_stats['misses'],
+        'size': len(_entity_model_cache)
+    }
+
+
 def configure_supporting_documents_inheritance(entity_supporting_docs_t,
                                                profile_supporting_docs_t,
                                                base, parent_entity):
@@ -210,4 +269,4 @@ def profile_foreign_keys(profile):
                 fk_name = fk['name']
                 fks.append(fk_name)
 
-    return fks
\ No newline at end of file
+    return fks
\ No newline at end of file
@@ -79,6 +79,7 @@ class AssociationEntity(Entity):
     @first_parent.setter
     def first_parent(self, parent):
         self.first_reference_column = self._set_parent(parent)
+        self._reset_profile_index()
 
         # Add column to the collection
         if self.first_reference_column:
@@ -87,10 +88,16 @@ class AssociationEntity(Entity):
     @second_parent.setter
     def second_parent(self, parent):
         self.second_reference_column = self._set_parent(parent)
+        self._reset_profile_index()
 
         if self.second_reference_column:
             self.add_column(self.second_reference_column)
 
+    def _reset_profile_index(self):
+        # Profile association index is keyed by the parent names
+        if not self.profile is None:
+            self.profile.reset_association_index()
+
     def _set_parent(self, parent):
         parent_entity = self._obj_from_str(parent)
 
@@ -20,14 +20,79 @@ email                : stdm@unhabitat.org
 """
 import logging
 
+from sqlalchemy.sql.expression import text
+
 from stdm.data.configuration.entity import Entity
 from stdm.data.configuration.columns import (
     ForeignKeyColumn,
     VarCharColumn
 )
+from stdm.data.pg_utils import pg_table_exists
 
 LOGGER = logging.getLogger('stdm')
 
+#Suffix of the table containing the last serial number of each prefix
+COUNTER_TABLE_SUFFIX = '_counter'
+
+
+def _quote_role(role):
+    #Role names are quoted as identifiers, PUBLIC is a keyword
+    if role.upper() == 'PUBLIC':
+        return 'PUBLIC'
+
+    return u'"{0}"'.format(role.replace('"', '""'))
+
+
+def create_code_counter_table(engine, code_table):
+    """
+    Creates the table containing the last serial number of each code
+    prefix if it does not exist. Roles that can insert codes are granted
+    access to the counters. Counters are added and seeded from the existing
+    codes when a prefix is first used since the prefix of an existing code
+    cannot be told apart from its serial number e.g. KE01 in KE010005.
+    :param engine: SQLAlchemy connectable object.
+    :type engine: Engine
+    :param code_table: Name of the table containing generated codes.
+    :type code_table: str
+    """
+    counter_table = u'{0}{1}'.format(code_table, COUNTER_TABLE_SUFFIX)
+
+    create_sql = u'CREATE TABLE IF NOT EXISTS {0} (' \
+                 u'code_prefix character varying PRIMARY KEY, ' \
+                 u'last_serial bigint NOT NULL DEFAULT 0);'.format(
+        counter_table
+    )
+
+    grantee_sql = u"SELECT DISTINCT grantee FROM " \
+                  u"information_schema.role_table_grants " \
+                  u"WHERE table_name = :table_name " \
+                  u"AND privilege_type = 'INSERT';"
+
+    conn = engine.connect()
+    trans = conn.begin()
+    try:
+        conn.execute(text(create_sql))
+
+        grantees = conn.execute(
+            text(grantee_sql), table_name=code_table
+        ).fetchall()
+        for grantee in grantees:
+            conn.execute(text(
+                u'GRANT SELECT, INSERT, UPDATE ON TABLE {0} '
+                u'TO {1};'.format(counter_table, _quote_role(grantee[0]))
+            ))
+
+        trans.commit()
+
+        LOGGER.debug('%s code counter table updated.', counter_table)
+
+    except Exception:
+        trans.rollback()
+        raise
+
+    finally:
+        conn.close()
+
 
 class AutoGenerateCode(Entity):
     """
@@ -47,3 +112,24 @@ class AutoGenerateCode(Entity):
 
         # Add columns
         self.add_column(self.auto_generate_code_name)
+
+    @property
+    def counter_table_name(self):
+        """
+        :return: Returns the name of the table containing the last serial
+        number of each code prefix.
+        :rtype: str
+        """
+        return u'{0}{1}'.format(self.name, COUNTER_TABLE_SUFFIX)
+
+    def create_counter_table(self, engine):
+        """
+        Creates the counter table of the codes if it does not exist, see
+        create_code_counter_table.
+        :param engine: SQLAlchemy connectable object.
+        :type engine: Engine
+        """
+        if not pg_table_exists(self.name, False):
+            return
+
+        create_code_counter_table(engine, self.name)
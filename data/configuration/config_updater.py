@@ -35,7 +35,11 @@ from stdm.data.database import (
 from stdm.data.configuration.db_items import DbItem
 from stdm.data.configuration.stdm_configuration import StdmConfiguration
 from stdm.data.configuration.exception import ConfigurationException
-from stdm.data.configuration import profile_foreign_keys
+from stdm.data.configuration import (
+    clear_entity_model_cache,
+    profile_foreign_keys
+)
+from stdm.data.pg_utils import suspend_catalog_snapshot
 
 LOGGER = logging.getLogger('stdm')
 
@@ -90,6 +94,9 @@ class ConfigurationSchemaUpdater(QObject):
 
             return
 
+        #Catalog snapshot is reloaded on each access during the update
+        suspend_catalog_snapshot(True)
+
         try:
             #Iterate through removed profiles first
             for rp in self.config.removed_profiles:
@@ -113,6 +120,16 @@ class ConfigurationSchemaUpdater(QObject):
 
             self.update_completed.emit(False)
 
+        finally:
+            #Mapped classes no longer reflect the updated tables, some
+            #tables might have been updated before an error
+            self._reset_schema_caches()
+
+    def _reset_schema_caches(self):
+        #Reset cached mapped classes and catalog items after an update
+        clear_entity_model_cache()
+        suspend_catalog_snapshot(False)
+
     def _clean_removed_profiles(self):
         #Delete removed profiles
         for p in self.config.removed_profiles:
@@ -167,6 +184,7 @@ class ConfigurationSchemaUpdater(QObject):
 
                 else:
                     del profile.relations[er.name]
+                    profile.reset_relation_indexes()
 
                     msg = self.tr(u'{0} foreign key constraint successfully '
                                   'removed.'.format(er.autoname))
@@ -219,6 +237,13 @@ class ConfigurationSchemaUpdater(QObject):
 
             self.update_completed.emit(False)
 
+        #Counters used to allocate the serial numbers of generated codes
+        trans_msg = self.tr('Updating code counters...')
+        self.update_progress.emit(ConfigurationSchemaUpdater.INFORMATION,
+                                  trans_msg)
+
+        profile.auto_generate_code.create_counter_table(self.engine)
+
     def _update_entities(self, entities):
         for e in entities:
             action = e.action
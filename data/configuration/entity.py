@@ -378,14 +378,13 @@ class Entity(QObject, TableItem):
         is an example of an object that uses association entities.
         :rtype: list
         """
-        assoc_entities = self.profile.entities_by_type_info(
-            'ASSOCIATION_ENTITY'
-        )
+        assoc_entities = self.profile.association_entities_by_parent(self)
 
         rel_entities = []
 
         for ase in assoc_entities:
-            if ase.first_parent.name == self.name:
+            if not ase.first_parent is None and \
+                    ase.first_parent.name == self.name:
                 rel_entities.append(ase.first_parent)
             elif ase.second_parent.name == self.name:
                 rel_entities.append(ase.second_parent)
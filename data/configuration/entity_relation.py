@@ -77,6 +77,7 @@ class EntityRelation(object):
     @parent.setter
     def parent(self, entity):
         self._parent = self._obj_from_str(entity)
+        self._reset_profile_indexes()
 
     @property
     def child(self):
@@ -85,6 +86,12 @@ class EntityRelation(object):
     @child.setter
     def child(self, entity):
         self._child = self._obj_from_str(entity)
+        self._reset_profile_indexes()
+
+    def _reset_profile_indexes(self):
+        # Profile relation indexes are keyed by the parent and child names
+        if not self.profile is None:
+            self.profile.reset_relation_indexes()
 
     @property
     def name(self):
@@ -19,7 +19,10 @@ email                : stdm@unhabitat.org
 """
 
 import logging
-from collections import OrderedDict
+from collections import (
+    defaultdict,
+    OrderedDict
+)
 from copy import deepcopy
 
 from PyQt4.QtCore import (
@@ -74,6 +77,15 @@ class Profile(QObject):
         :param configuration: Parent configuration object.
         """
         QObject.__init__(self, configuration)
+
+        #Secondary indexes for lookups by entity or table name
+        self._entity_name_index = {}
+        self._indexed_entity_count = 0
+        self._parent_relations_index = None
+        self._child_relations_index = None
+        self._indexed_relations_count = 0
+        self._association_index = None
+
         self.name = name
         self.description = ''
         self.configuration = configuration
@@ -240,13 +252,110 @@ class Profile(QObject):
         ValueLists are also searched and returned.
         :rtype: Entity
         """
-        items = [e for e in self.entities.values() if e.name == name]
+        # Entities were added or removed directly in the collection
+        if self._entity_name_index is None or \
+                self._indexed_entity_count != len(self.entities):
+            self._build_entity_name_index()
 
-        if len(items) == 0:
-            return None
+        item = self._entity_name_index.get(name, None)
 
-        else:
-            return items[0]
+        # Rebuild the index if the entity was renamed or removed directly
+        if not item is None and (item.name != name or
+                                 self.entities.get(item.short_name, None)
+                                 is not item):
+            self._build_entity_name_index()
+            item = self._entity_name_index.get(name, None)
+
+        return item
+
+    def _build_entity_name_index(self):
+        # Index entities by table name, the first entity takes precedence
+        self._entity_name_index = {}
+
+        for e in self.entities.values():
+            self._entity_name_index.setdefault(e.name, e)
+
+        self._indexed_entity_count = len(self.entities)
+
+    def _entity_index_in_sync(self):
+        # True if the index can be updated incrementally
+        return not self._entity_name_index is None and \
+            self._indexed_entity_count == len(self.entities)
+
+    def reset_entity_name_index(self):
+        """
+        Clears the index of entities by table name so that it is rebuilt on
+        next use. Called when entities in the collection have been replaced
+        directly.
+        """
+        self._entity_name_index = None
+
+    def reset_association_index(self):
+        """
+        Clears the index of association entities by parent so that it is
+        rebuilt on next use. Called when the parent of an association entity
+        has changed.
+        """
+        self._association_index = None
+
+    def reset_relation_indexes(self):
+        """
+        Clears the indexes of entity relations and association entities so
+        that they are rebuilt on next use. Called when the parent or child
+        of an entity relation has changed.
+        """
+        self._parent_relations_index = None
+        self._child_relations_index = None
+        self._association_index = None
+
+    def _relation_indexes(self):
+        """
+        :return: Returns the entity relations indexed by the names of the
+        parent and child entities respectively.
+        :rtype: tuple(dict, dict)
+        """
+        if self._parent_relations_index is None or \
+                self._indexed_relations_count != len(self.relations):
+            parent_index = defaultdict(list)
+            child_index = defaultdict(list)
+
+            for er in self.relations.values():
+                if not er.parent is None:
+                    parent_index[er.parent.name].append(er)
+                if not er.child is None:
+                    child_index[er.child.name].append(er)
+
+            self._parent_relations_index = parent_index
+            self._child_relations_index = child_index
+            self._indexed_relations_count = len(self.relations)
+
+        return self._parent_relations_index, self._child_relations_index
+
+    def association_entities_by_parent(self, entity):
+        """
+        :param entity: First or second parent of association entities.
+        :type entity: Entity
+        :return: Returns the association entities which reference the
+        given entity as either the first or second parent.
+        :rtype: list
+        """
+        if self._association_index is None:
+            assoc_index = defaultdict(list)
+
+            for ae in self.association_entities():
+                parent_names = []
+                if not ae.first_parent is None:
+                    parent_names.append(ae.first_parent.name)
+                if not ae.second_parent is None and \
+                        not ae.second_parent.name in parent_names:
+                    parent_names.append(ae.second_parent.name)
+
+                for pn in parent_names:
+                    assoc_index[pn].append(ae)
+
+            self._association_index = assoc_index
+
+        return list(self._association_index.get(entity.name, []))
 
     def relation(self, name):
         """
@@ -287,10 +396,9 @@ class Profile(QObject):
         if not isinstance(item, Entity):
             raise TypeError(self.tr('Entity object type expected.'))
 
-        name = item.name
+        parent_index, child_index = self._relation_indexes()
 
-        return [er for er in self.relations.values()
-                if er.parent.name == name]
+        return list(parent_index.get(item.name, []))
 
     def child_relations(self, item):
         """
@@ -305,10 +413,9 @@ class Profile(QObject):
         if not isinstance(item, Entity):
             return []
 
-        name = item.name
+        parent_index, child_index = self._relation_indexes()
 
-        return [er for er in self.relations.values()
-                if er.child.name == name]
+        return list(child_index.get(item.name, []))
 
     def add_entity_relation(self, entity_relation):
         """
@@ -342,6 +449,7 @@ class Profile(QObject):
             return False
 
         self.relations[entity_relation.name] = entity_relation
+        self.reset_relation_indexes()
 
         LOGGER.debug('%s entity relation added.', entity_relation.name)
 
@@ -388,7 +496,21 @@ class Profile(QObject):
             if old_item.action <> DbItem.DROP:
                 return
 
+        old_item = self.entities.get(item.short_name, None)
+        in_sync = self._entity_index_in_sync()
+
         self.entities[item.short_name] = item
+        if in_sync:
+            if not old_item is None and \
+                    self._entity_name_index.get(old_item.name, None) is old_item:
+                del self._entity_name_index[old_item.name]
+            self._entity_name_index.setdefault(item.name, item)
+            self._indexed_entity_count = len(self.entities)
+        else:
+            # Entity was removed directly from the collection e.g. when
+            # renaming, the count alone cannot tell if the index is stale
+            self.reset_entity_name_index()
+        self.reset_relation_indexes()
 
         LOGGER.debug('%s entity added to %s profile', item.short_name, self.name)
 
@@ -436,7 +558,15 @@ class Profile(QObject):
         self.remove_association_entities(ent)
 
         #Now remove the entity from the collection
+        in_sync = self._entity_index_in_sync()
         del_entity = self.entities.pop(name, None)
+        if in_sync:
+            if self._entity_name_index.get(ent.name, None) is ent:
+                del self._entity_name_index[ent.name]
+            self._indexed_entity_count = len(self.entities)
+        else:
+            self.reset_entity_name_index()
+        self.reset_relation_indexes()
 
         LOGGER.debug('%s entity removed from %s profile', name, self.name)
 
@@ -552,17 +682,21 @@ class Profile(QObject):
         """
         parents = []
 
+        assoc_entities = self.association_entities_by_parent(entity)
+
         #Get first parent if specified
         if (parent & AssociationEntity.FIRST_PARENT) == AssociationEntity.FIRST_PARENT:
-            first_parents = [ae for ae in self.association_entities()
-                             if ae.first_parent.name == entity.name]
+            first_parents = [ae for ae in assoc_entities
+                             if not ae.first_parent is None and
+                             ae.first_parent.name == entity.name]
 
             parents.extend(first_parents)
 
         #Get second parent if specified
         if (parent & AssociationEntity.SECOND_PARENT) == AssociationEntity.SECOND_PARENT:
-            second_parents = [ae for ae in self.association_entities()
-                              if ae.second_parent.name == entity.name]
+            second_parents = [ae for ae in assoc_entities
+                              if not ae.second_parent is None and
+                              ae.second_parent.name == entity.name]
 
             parents.extend(second_parents)
 
@@ -628,7 +762,12 @@ class Profile(QObject):
             self.social_tenure.remove_spatial_unit(ent)
 
         # Remove entity from the collection
+        in_sync = self._entity_index_in_sync()
         rn_entity = self.entities.pop(original_name)
+        if in_sync:
+            if self._entity_name_index.get(rn_entity.name, None) is rn_entity:
+                del self._entity_name_index[rn_entity.name]
+            self._indexed_entity_count = len(self.entities)
 
         rn_entity.rename(new_name)
 
@@ -0,0 +1,251 @@
+"""
+/***************************************************************************
+Name                 : Expression evaluator
+Description          : Evaluates the expressions of expression columns for
+                       many records at a time using shared entity layers.
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import logging
+
+from qgis.core import (
+    NULL,
+    QgsExpression,
+    QgsFeatureRequest
+)
+from sqlalchemy import or_
+from sqlalchemy.sql import (
+    bindparam,
+    column,
+    select,
+    table
+)
+
+from stdm.data.configuration.columns import ExpressionColumn
+from stdm.data.database import STDMDb
+from stdm.data.pg_utils import (
+    _execute,
+    vector_layer
+)
+
+LOGGER = logging.getLogger('stdm')
+
+#Number of records evaluated in one feature request
+EVALUATION_BATCH_SIZE = 500
+
+#Entity and its layer indexed by entity name
+_entity_layers = {}
+
+#Column and its prepared expression indexed by entity, column and
+#expression text
+_prepared_expressions = {}
+
+
+def clear_expression_cache():
+    """
+    Removes the layers and prepared expressions. Cached items are also
+    replaced when the configuration is reloaded since the entity and column
+    objects change.
+    """
+    _entity_layers.clear()
+    _prepared_expressions.clear()
+
+
+def entity_layer(entity):
+    """
+    :param entity: Entity containing expression columns.
+    :type entity: Entity
+    :return: Returns the layer used to evaluate the expressions of the
+    entity, which is created once and shared by all the expression
+    columns of the entity.
+    :rtype: QgsVectorLayer
+    """
+    cached_entity, layer = _entity_layers.get(entity.name, (None, None))
+    if cached_entity is entity:
+        return layer
+
+    srid = None
+    geom_column = ''
+    if entity.has_geometry_column():
+        geom_columns = [c.name for c in entity.columns.values()
+                        if c.TYPE_INFO == 'GEOMETRY']
+        geom_column = geom_columns[0]
+        geom_col_obj = entity.columns[geom_column]
+
+        if geom_col_obj.srid >= 100000:
+            srid = geom_col_obj.srid
+
+    layer = vector_layer(entity.name, geom_column=geom_column,
+                         proj_wkt=srid)
+    _entity_layers[entity.name] = (entity, layer)
+
+    return layer
+
+
+def prepared_expression(column):
+    """
+    :param column: Expression column.
+    :type column: ExpressionColumn
+    :return: Returns the expression of the column, parsed and prepared
+    for the fields of the entity layer. It is prepared once for each
+    expression text.
+    :rtype: QgsExpression
+    """
+    key = (column.entity.name, column.name, column.expression)
+
+    cached_column, exp = _prepared_expressions.get(key, (None, None))
+    if cached_column is column:
+        return exp
+
+    exp = QgsExpression(column.expression)
+
+    if exp.hasParserError():
+        raise Exception(exp.parserErrorString())
+
+    exp.prepare(entity_layer(column.entity).pendingFields())
+    _prepared_expressions[key] = (column, exp)
+
+    return exp
+
+
+def evaluate_column(column, record_ids):
+    """
+    Evaluates the expression of the column for the given records. The
+    features are read using one feature request per batch of records.
+    :param column: Expression column.
+    :type column: ExpressionColumn
+    :param record_ids: Ids of the records.
+    :type record_ids: list
+    :return: Returns the values indexed by record id, NULL results are
+    returned as None. Records that do not exist are not included.
+    :rtype: dict
+    """
+    layer = entity_layer(column.entity)
+    exp = prepared_expression(column)
+
+    ids = [i for i in record_ids if not i is None]
+    values = {}
+
+    for start in range(0, len(ids), EVALUATION_BATCH_SIZE):
+        request = QgsFeatureRequest()
+        request.setFilterFids(ids[start:start + EVALUATION_BATCH_SIZE])
+        if not exp.needsGeometry():
+            request.setFlags(QgsFeatureRequest.NoGeometry)
+
+        for feature in layer.getFeatures(request):
+            value = exp.evaluate(feature)
+
+            #NULL results cannot be adapted by the database driver
+            values[feature.id()] = None if value == NULL else value
+
+            if exp.hasEvalError():
+                LOGGER.debug(u'{0} expression could not be evaluated for '
+                             u'record {1}: {2}'.format(column.name,
+                                                       feature.id(),
+                                                       exp.evalErrorString()))
+
+    return values
+
+
+def evaluate_column_value(column, record_id):
+    """
+    :param column: Expression column.
+    :type column: ExpressionColumn
+    :param record_id: Id of the record.
+    :type record_id: int
+    :return: Returns the value of the expression for the record or None
+    if the record does not exist.
+    """
+    return evaluate_column(column, [record_id]).get(record_id, None)
+
+
+def expression_columns(entity):
+    """
+    :param entity: Entity object.
+    :type entity: Entity
+    :return: Returns the expression columns of the entity.
+    :rtype: list
+    """
+    return [c for c in entity.columns.values()
+            if isinstance(c, ExpressionColumn) and c.expression]
+
+
+def update_expression_columns(entity, record_ids=None):
+    """
+    Evaluates the expression columns of the entity and saves the values,
+    a batch of records at a time.
+    :param entity: Entity whose expression columns will be updated.
+    :type entity: Entity
+    :param record_ids: Ids of the records to update e.g. the records
+    inserted by an import. If None, the records with missing expression
+    values are updated.
+    :type record_ids: list
+    :return: Returns the number of updated records.
+    :rtype: int
+    """
+    exp_columns = expression_columns(entity)
+    if len(exp_columns) == 0:
+        return 0
+
+    entity_table = table(
+        entity.name,
+        column('id'),
+        *[column(c.name) for c in exp_columns]
+    )
+
+    if record_ids is None:
+        query = select([entity_table.c.id]).where(or_(*[
+            entity_table.c[c.name] == None for c in exp_columns
+        ]))
+        record_ids = [r[0] for r in _execute(query).fetchall()]
+
+    update = entity_table.update().where(
+        entity_table.c.id == bindparam('record_id')
+    ).values(**dict([(c.name, bindparam(c.name)) for c in exp_columns]))
+
+    updated = 0
+    for start in range(0, len(record_ids), EVALUATION_BATCH_SIZE):
+        batch_ids = record_ids[start:start + EVALUATION_BATCH_SIZE]
+        column_values = [
+            (c.name, evaluate_column(c, batch_ids)) for c in exp_columns
+        ]
+
+        rows = []
+        for record_id in batch_ids:
+            row = {'record_id': record_id}
+            for name, values in column_values:
+                row[name] = values.get(record_id, None)
+
+            rows.append(row)
+
+        if len(rows) == 0:
+            continue
+
+        conn = STDMDb.instance().engine.connect()
+        trans = conn.begin()
+        try:
+            conn.execute(update, rows)
+            trans.commit()
+
+        except Exception:
+            trans.rollback()
+            raise
+
+        finally:
+            conn.close()
+
+        updated += len(rows)
+
+    return updated
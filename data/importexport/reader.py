@@ -22,6 +22,8 @@ email                : stdm@unhabitat.org
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
+from sqlalchemy.exc import SQLAlchemyError
+
 try:
     from osgeo import gdal
     from osgeo import ogr
@@ -29,6 +31,8 @@ except:
     import gdal
     import ogr
 
+from collections import OrderedDict
+
 from stdm.data.pg_utils import (
     delete_table_data,
     geometryType
@@ -46,10 +50,153 @@ from stdm.data.importexport.value_translators import (
 )
 from stdm.data.configuration import entity_model
 from stdm.data.configuration.exception import ConfigurationException
+from stdm.data.record_cache import clear_display_record_caches
 from stdm.ui.sourcedocument import SourceDocumentManager
 
 
+def _is_null_text(value):
+    # True if value is an empty string or the text 'null'
+    return isinstance(value, basestring) and \
+        (not bool(value.strip()) or value.strip().lower() == 'null')
+
+
+def fix_double_value(value):
+    """
+    Converts the value of a double column to a float.
+    :param value: Value to be saved to the DB
+    :type value: Any
+    :return: Float value or None if empty or invalid.
+    :rtype: float
+    """
+    if value is None or _is_null_text(value):
+        return None
+
+    try:
+        return float(value)
+
+    except ValueError:
+        return None
+
+
+def fix_integer_value(value):
+    """
+    Converts the value of an integer column to an int.
+    :param value: Value to be saved to the DB
+    :type value: Any
+    :return: Integer value or None if empty or invalid.
+    :rtype: int
+    """
+    if value is None or _is_null_text(value):
+        return None
+
+    try:
+        return int(value)
+
+    except ValueError:
+        #TODO show warning to the user that
+        #  some values cannot be converted to integer.
+        return None
+
+
+def fix_foreign_key_value(value):
+    """
+    Converts the value of a column referencing another table to an int.
+    Zero is not a valid id hence it is converted to None.
+    :param value: Value to be saved to the DB
+    :type value: Any
+    :return: Integer value or None if empty, zero or invalid.
+    :rtype: int
+    """
+    value = fix_integer_value(value)
+    if value == 0:
+        return None
+
+    return value
+
+
+def fix_percent_value(value):
+    """
+    Converts the value of a percent column, with or without the percent
+    sign, to a float.
+    :param value: Value to be saved to the DB
+    :type value: Any
+    :return: Float value or None if empty or invalid.
+    :rtype: float
+    """
+    if value is None or _is_null_text(value):
+        return None
+
+    if isinstance(value, basestring) and '%' in value:
+        value = value.replace('%', '')
+
+    try:
+        return float(value)
+
+    except ValueError:
+        return None
+
+
+def fix_date_value(value):
+    """
+    Converts empty values of date and datetime columns to None.
+    :param value: Value to be saved to the DB
+    :type value: Any
+    :return: Date value or None if empty.
+    :rtype: Any
+    """
+    if not bool(value):
+        return None
+
+    if isinstance(value, basestring) and value.lower() == 'null':
+        return None
+
+    return value
+
+
+def fix_yes_no_value(value):
+    """
+    Converts yes/no and true/false text values of Yes_No columns to bool.
+    :param value: Value to be saved to the DB
+    :type value: Any
+    :return: Boolean value, None if empty or the unchanged value if not
+    recognized.
+    :rtype: Any
+    """
+    if not isinstance(value, basestring):
+        return value
+
+    bool_text = value.strip().lower()
+
+    if not bool_text or bool_text == 'null':
+        return None
+
+    elif bool_text in ('yes', 'true'):
+        return True
+
+    elif bool_text in ('no', 'false'):
+        return False
+
+    return value
+
+
+#Value fixers for each column type
+VALUE_FIXERS = {
+    'DOUBLE': fix_double_value,
+    'INT': fix_integer_value,
+    'LOOKUP': fix_foreign_key_value,
+    'ADMIN_SPATIAL_UNIT': fix_foreign_key_value,
+    'FOREIGN_KEY': fix_foreign_key_value,
+    'PERCENT': fix_percent_value,
+    'DATE': fix_date_value,
+    'DATETIME': fix_date_value,
+    'BOOL': fix_yes_no_value
+}
+
+
 class OGRReader(object):
+    #Default number of rows written in a single transaction in bulk mode
+    BULK_CHUNK_SIZE = 5000
+
     def __init__(self, source_file):
         self._ds = ogr.Open(source_file)
         self._targetGeomColSRID = -1
@@ -59,6 +206,10 @@ class OGRReader(object):
         self._mapped_doc_cls = None
         self._current_profile = current_profile()
         self._source_doc_manager = None
+        self._value_fixers = {}
+
+        #Ids of the records inserted by the last import
+        self.inserted_ids = []
 
     def getLayer(self):
         # Return the first layer in the data source
@@ -154,17 +305,7 @@ class OGRReader(object):
         entity = self._data_source_entity(target_table)
 
         if entity.columns[col_name].TYPE_INFO == 'PERCENT':
-            if isinstance(value, str):
-                if not bool(value.strip()) or value.strip().lower() == 'null':
-                    value = None
-            if '%' in value:
-                value = value.replace('%', '')
-            try:
-                if value is not None:
-                    value = float(value)
-
-            except ValueError:
-                value = None
+            value = fix_percent_value(value)
 
         return value
 
@@ -183,39 +324,12 @@ class OGRReader(object):
         entity = self._data_source_entity(target_table)
         integer_types = ['INT', 'LOOKUP', 'ADMIN_SPATIAL_UNIT',
                          'FOREIGN_KEY', 'DOUBLE']
-        float_type = ['DOUBLE']
-        int_type = ['INT', 'LOOKUP', 'ADMIN_SPATIAL_UNIT',
-                    'FOREIGN_KEY']
 
         if col_name in entity.columns.keys():
-            if entity.columns[col_name].TYPE_INFO in integer_types:
-                if isinstance(value, str):
-                    if not bool(value.strip()) or value.strip().lower() == 'null':
-                        value = None
-                if entity.columns[col_name].TYPE_INFO in float_type:
-                    try:
-                        if value is not None:
-                            value = float(value)
-
-                    except ValueError:
-                        value = None
-
-                elif entity.columns[col_name].TYPE_INFO in int_type:
-
-                    try:
-                        if value is not None:
-                            value = int(value)
-                            if isinstance(value, int):
-                                if value == 0:
-                                    if entity.columns[col_name].TYPE_INFO in \
-                                        ['LOOKUP', 'ADMIN_SPATIAL_UNIT',
-                                        'FOREIGN_KEY']:
-                                        value = None
-                    except ValueError:
-                        #TODO show warning to the user that
-                        #  some values cannot be converted to integer.
-                        value = None
-                    
+            type_info = entity.columns[col_name].TYPE_INFO
+            if type_info in integer_types:
+                value = VALUE_FIXERS[type_info](value)
+
         return value
 
     def auto_fix_date(self, target_table, col_name, value):
@@ -235,8 +349,7 @@ class OGRReader(object):
         date_types = ['DATE', 'DATETIME']
 
         if entity.columns[col_name].TYPE_INFO in date_types:
-            if not bool(value) or value.lower() == 'null':
-                value = None
+            value = fix_date_value(value)
 
         return value
 
@@ -256,18 +369,50 @@ class OGRReader(object):
         yes_no_types = ['BOOL']
        
         if entity.columns[col_name].TYPE_INFO in yes_no_types:
-            if not bool(value.strip()) or value.strip().lower() == 'null':
-                value = None
-            elif value.strip().lower() == 'yes':
-                value = True
-            elif value.strip().lower() == 'no':
-                value = False
-            elif value.strip().lower() == 'true':
-                value = True
-            elif value.strip().lower() == 'false':
-                value = False
+            value = fix_yes_no_value(value)
+
         return value
 
+    def value_fixers(self, target_table):
+        """
+        Compiles the value fixers of the target table columns so that the
+        entity and column types are looked up once per import rather than
+        for each value.
+        :param target_table: The destination table name
+        :type target_table: str
+        :return: Column names and the corresponding functions for fixing
+        their values. Columns that do not require fixing are excluded.
+        :rtype: dict
+        """
+        entity = self._data_source_entity(target_table)
+
+        if entity is None:
+            return {}
+
+        fixers = {}
+        for col_name, column in entity.columns.iteritems():
+            fixer = VALUE_FIXERS.get(column.TYPE_INFO, None)
+            if fixer is not None:
+                fixers[col_name] = fixer
+
+        return fixers
+
+    def _fix_value(self, col, value):
+        """
+        Applies the compiled value fixer, if any, of the given column.
+        :param col: The destination column name
+        :type col: String
+        :param value: Value to be saved to the DB
+        :type value: Any
+        :return: Converted value
+        :rtype: Any
+        """
+        fixer = self._value_fixers.get(col, None)
+        if fixer is None:
+            return value
+
+        return fixer(value)
+
     def _insertRow(self, target_table, columnValueMapping):
         """
         Insert a new row using the mapped class instance then mapping column
@@ -287,12 +432,7 @@ class OGRReader(object):
                 '''
                 # documents is not a column so exclude it.
                 if col != 'documents':
-
-                    value = self.auto_fix_float_integer(target_table, col,
-                                                        value)
-                    value = self.auto_fix_percent(target_table, col, value)
-                    value = self.auto_fix_date(target_table, col, value)
-                    value = self.auto_fix_yes_no(target_table, col, value)
+                    value = self._fix_value(col, value)
 
                 if not isinstance(value, IgnoreType):
                     setattr(model_instance, col, value)
@@ -305,6 +445,163 @@ class OGRReader(object):
             self._dbSession.rollback()
             raise
 
+        if hasattr(model_instance, 'id'):
+            self.inserted_ids.append(model_instance.id)
+
+    def _bulk_row(self, target_table, columnValueMapping):
+        """
+        Converts the column values of a source feature to a dictionary of
+        table column names and values that can be used in a multi-row
+        INSERT statement.
+        :param target_table: The destination table name
+        :type target_table: str
+        :param columnValueMapping: Destination column names and the
+        corresponding values.
+        :type columnValueMapping: dict
+        :return: Table column names and corresponding converted values.
+        :rtype: dict
+        """
+        table_cols = self._mapped_cls.__table__.c
+        row = {}
+
+        for col, value in columnValueMapping.iteritems():
+            if not col in table_cols:
+                continue
+
+            value = self._fix_value(col, value)
+
+            if not isinstance(value, IgnoreType):
+                row[col] = value
+
+        return row
+
+    def _insert_chunk(self, rows, feature_ids):
+        """
+        Inserts a chunk of rows in a single transaction. Rows are grouped by
+        their column names so that each group is written using one
+        multi-row INSERT statement. The ids of the inserted rows are added
+        to 'inserted_ids'.
+        :param rows: Rows, as returned by '_bulk_row', to be inserted.
+        :type rows: list
+        :param feature_ids: Ids of the source features corresponding to the
+        rows.
+        :type feature_ids: list
+        :return: None if the chunk was successfully inserted, otherwise a
+        tuple containing the ids of the source features in the chunk and the
+        error message.
+        :rtype: tuple
+        """
+        if len(rows) == 0:
+            return None
+
+        table = self._mapped_cls.__table__
+        col_groups = OrderedDict()
+
+        for row in rows:
+            col_groups.setdefault(frozenset(row.keys()), []).append(row)
+
+        chunk_ids = []
+
+        try:
+            for group_rows in col_groups.values():
+                insert = table.insert().values(group_rows)
+                if not 'id' in table.c:
+                    self._dbSession.execute(insert)
+
+                    continue
+
+                result = self._dbSession.execute(
+                    insert.returning(table.c.id)
+                )
+                chunk_ids.extend([r[0] for r in result])
+
+            self._dbSession.commit()
+
+        except SQLAlchemyError as ex:
+            self._dbSession.rollback()
+
+            return list(feature_ids), unicode(ex)
+
+        self.inserted_ids.extend(chunk_ids)
+
+        return None
+
+    def supports_bulk_insert(self, target_table, columnmatch,
+                             translator_manager=None):
+        """
+        Checks whether the features can be imported to the target table
+        using multi-row INSERT statements. Entities supporting documents and
+        destination columns that are not table columns e.g. multiple select
+        collections require the ORM and hence cannot be bulk inserted.
+        :param target_table: The destination table name
+        :type target_table: str
+        :param columnmatch: Dictionary containing source columns as keys and
+        target columns as the values.
+        :type columnmatch: dict
+        :param translator_manager: Value translators for the destination
+        table columns.
+        :type translator_manager: ValueTranslatorManager
+        :return: True if the features can be bulk inserted, else False.
+        :rtype: bool
+        """
+        entity = self._data_source_entity(target_table)
+
+        if entity is None or entity.supports_documents:
+            return False
+
+        if translator_manager is None:
+            translator_manager = ValueTranslatorManager()
+
+        for dest_column in columnmatch.values():
+            if not dest_column in entity.columns:
+                return False
+
+            col_type = entity.columns[dest_column].TYPE_INFO
+            if col_type == 'MULTIPLE_SELECT':
+                return False
+
+            value_translator = translator_manager.translator(dest_column)
+            if value_translator is not None and \
+                    value_translator.requires_source_document_manager():
+                return False
+
+        return True
+
+    def _init_mapped_class(self, target_table, destination_entity,
+                           geom_column=None):
+        """
+        Creates the mapped classes for the destination table, and the
+        supporting documents manager and target geometry type and SRID
+        where applicable.
+        """
+        mapped_cls, mapped_doc_cls = self._get_mapped_class(target_table)
+
+        if mapped_cls is None:
+            msg = QApplication.translate(
+                "OGRReader",
+                "Something happened that caused the "
+                "database table not to be mapped to the "
+                "corresponding model class. Please contact"
+                " your system administrator."
+            )
+
+            raise RuntimeError(msg)
+
+        self._mapped_cls = mapped_cls
+        self._mapped_doc_cls = mapped_doc_cls
+
+        # Create source document manager if the entity supports them
+        if destination_entity.supports_documents:
+            self._source_doc_manager = SourceDocumentManager(
+                destination_entity.supporting_doc,
+                self._mapped_doc_cls
+            )
+
+        if geom_column is not None:
+            # Use geometry column SRID in the target table
+            self._geomType, self._targetGeomColSRID = \
+                geometryType(target_table, geom_column)
+
     def auto_fix_geom_type(self, geom, source_geom_type, destination_geom_type):
         """
         Converts single geometry type to multi type if the destination is multi type.
@@ -354,7 +651,8 @@ class OGRReader(object):
         return geom_wkb, geom_type
 
     def featToDb(self, targettable, columnmatch, append, parentdialog,
-                 geomColumn=None, geomCode=-1, translator_manager=None):
+                 geomColumn=None, geomCode=-1, translator_manager=None,
+                 chunk_size=BULK_CHUNK_SIZE):
         """
         Performs the data import from the source layer to the STDM database.
         :param targettable: Destination table name
@@ -364,7 +662,20 @@ class OGRReader(object):
         :param translator_manager: Instance of 'stdm.data.importexport.ValueTranslatorManager'
         containing value translators defined for the destination table columns.
         :type translator_manager: ValueTranslatorManager
+        :param chunk_size: Number of features inserted in a single
+        transaction when the destination table supports bulk inserts. Zero
+        or None forces the features to be inserted one by one using the
+        mapped class.
+        :type chunk_size: int
+        :return: Chunks that could not be inserted, each as a tuple
+        containing the ids of the source features in the chunk and the
+        error message. Always empty when features are inserted one by one
+        since any error is raised. The ids of the inserted records are
+        available in 'inserted_ids'.
+        :rtype: list
         """
+        self.inserted_ids = []
+
         # Check current profile
         if self._current_profile is None:
             msg = QApplication.translate(
@@ -399,6 +710,21 @@ class OGRReader(object):
         # Set entity for use in translators
         destination_entity = self._data_source_entity(targettable)
 
+        # Create mapped class only once
+        if self._mapped_cls is None:
+            self._init_mapped_class(targettable, destination_entity,
+                                    geomColumn)
+
+        # Look up the column types once for the whole import
+        self._value_fixers = self.value_fixers(targettable)
+
+        bulk_insert = bool(chunk_size) and self.supports_bulk_insert(
+            targettable, columnmatch, translator_manager
+        )
+        chunk_rows = []
+        chunk_feature_ids = []
+        failed_chunks = []
+
         for feat in lyr:
             column_count = 0
             progress.setValue(init_val)
@@ -423,37 +749,6 @@ class OGRReader(object):
 
                     field_value = feat.GetField(f)
 
-                    # Create mapped class only once
-                    if self._mapped_cls is None:
-                        mapped_cls, mapped_doc_cls = self._get_mapped_class(
-                            targettable)
-
-                        if mapped_cls is None:
-                            msg = QApplication.translate(
-                                "OGRReader",
-                                "Something happened that caused the "
-                                "database table not to be mapped to the "
-                                "corresponding model class. Please contact"
-                                " your system administrator."
-                            )
-
-                            raise RuntimeError(msg)
-
-                        self._mapped_cls = mapped_cls
-                        self._mapped_doc_cls = mapped_doc_cls
-
-                        # Create source document manager if the entity supports them
-                        if destination_entity.supports_documents:
-                            self._source_doc_manager = SourceDocumentManager(
-                                destination_entity.supporting_doc,
-                                self._mapped_doc_cls
-                            )
-
-                        if geomColumn is not None:
-                            # Use geometry column SRID in the target table
-                            self._geomType, self._targetGeomColSRID = \
-                                geometryType(targettable, geomColumn)
-
                     '''
                     Check if there is a value translator defined for the
                     specified destination column.
@@ -508,18 +803,50 @@ class OGRReader(object):
                                 geom_type,
                                 self._geomType))
 
-            try:
-                # Insert the record
-                self._insertRow(targettable, column_value_mapping)
+            if bulk_insert:
+                chunk_rows.append(
+                    self._bulk_row(targettable, column_value_mapping)
+                )
+                chunk_feature_ids.append(feat.GetFID())
 
-            except:
-                progress.close()
-                raise
+                if len(chunk_rows) >= chunk_size:
+                    failed_chunk = self._insert_chunk(chunk_rows,
+                                                      chunk_feature_ids)
+                    if failed_chunk is not None:
+                        failed_chunks.append(failed_chunk)
+
+                    chunk_rows = []
+                    chunk_feature_ids = []
+
+            else:
+                try:
+                    # Insert the record
+                    self._insertRow(targettable, column_value_mapping)
+
+                except:
+                    progress.close()
+                    raise
 
             init_val += 1
 
+        # Insert remaining rows, including those read before cancelling
+        if bulk_insert:
+            failed_chunk = self._insert_chunk(chunk_rows, chunk_feature_ids)
+            if failed_chunk is not None:
+                failed_chunks.append(failed_chunk)
+
+        #Records inserted in bulk are not tracked by the ORM
+        if append:
+            clear_display_record_caches(targettable)
+
+        else:
+            #Deleted records may cascade to other tables
+            clear_display_record_caches()
+
         progress.setValue(numFeat)
 
+        return failed_chunks
+
     def _enumeration_column_type(self, column_name, value):
         """
         Checks if the given column is of DeclEnumType.
@@ -17,6 +17,8 @@ email                : gkahiu@gmail.com
  *                                                                         *
  ***************************************************************************/
 """
+from collections import OrderedDict
+
 from qgis.core import *
 
 from PyQt4.QtCore import (
@@ -56,20 +58,276 @@ _text_col_types = ["character varying", "text"]
 VIEWS = 2500
 TABLES = 2501
 
+#Statements which change the database schema
+_ddl_commands = ("CREATE", "ALTER", "DROP", "COMMENT")
+
+#Catalog snapshots keyed by schema name
+_catalog_snapshots = {}
+
+#True if snapshots are reloaded on each access e.g. during schema updates
+_catalog_snapshot_suspended = False
+
+
+class CatalogSnapshot(object):
+    """
+    In-memory snapshot of the tables, views, columns, geometry columns and
+    foreign keys in a database schema. The snapshot is loaded using a
+    handful of pg_catalog queries and serves the catalog util functions in
+    this module, which would otherwise query information_schema for each
+    table or column.
+    """
+    def __init__(self, schema="public"):
+        """
+        :param schema: Name of the database schema.
+        :type schema: str
+        """
+        self.schema = schema
+        self._loaded = False
+        self._clear()
+
+    def _clear(self):
+        self.tables = []
+        self.views = []
+        #Relation name and list of (column name, data type, type name)
+        self._columns = {}
+        #Table name and OrderedDict of geometry column and (type, srid)
+        self._geometry_columns = OrderedDict()
+        #Tuples of table, column, foreign table, foreign column, constraint
+        self._foreign_keys = []
+
+    @property
+    def is_loaded(self):
+        """
+        :return: True if the catalog has been loaded from the database and
+        has not been invalidated since.
+        :rtype: bool
+        """
+        return self._loaded
+
+    def invalidate(self):
+        """
+        Flags the snapshot as stale so that it is reloaded on next access.
+        """
+        self._loaded = False
+
+    def refresh(self):
+        """
+        Loads the catalog items afresh from the database. The items are
+        replaced once all of them have been loaded so that readers in other
+        threads never see a partially loaded catalog.
+        """
+        tables = []
+        views = []
+        columns = {}
+        geometry_columns = OrderedDict()
+        foreign_keys = []
+
+        #Tables and views, with the same privilege checks as information_schema
+        rel_sql = text(
+            "SELECT c.relname, c.relkind FROM pg_class c "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "WHERE n.nspname = :tschema AND c.relkind IN ('r', 'p', 'v') "
+            "AND (pg_has_role(c.relowner, 'USAGE') OR "
+            "has_table_privilege(c.oid, 'SELECT, INSERT, UPDATE, DELETE, "
+            "TRUNCATE, REFERENCES, TRIGGER') OR "
+            "has_any_column_privilege(c.oid, 'SELECT, INSERT, UPDATE, "
+            "REFERENCES')) "
+            "ORDER BY c.relname ASC"
+        )
+        for r in _execute(rel_sql, tschema=self.schema):
+            if r["relkind"] == "v":
+                views.append(r["relname"])
+            else:
+                tables.append(r["relname"])
+
+        #data_type mirrors information_schema.columns while type_name
+        #mirrors pg_typeof, which was used for view columns.
+        col_sql = text(
+            "SELECT c.relname, a.attname, "
+            "CASE WHEN t.typelem <> 0 AND t.typlen = -1 THEN 'ARRAY' "
+            "WHEN tn.nspname = 'pg_catalog' "
+            "THEN format_type(a.atttypid, NULL) "
+            "ELSE 'USER-DEFINED' END AS data_type, "
+            "format_type(a.atttypid, NULL) AS type_name "
+            "FROM pg_attribute a "
+            "JOIN pg_class c ON c.oid = a.attrelid "
+            "JOIN pg_namespace n ON n.oid = c.relnamespace "
+            "JOIN pg_type t ON t.oid = a.atttypid "
+            "JOIN pg_namespace tn ON tn.oid = t.typnamespace "
+            "WHERE n.nspname = :tschema AND c.relkind IN ('r', 'p', 'v') "
+            "AND a.attnum > 0 AND NOT a.attisdropped "
+            "ORDER BY c.relname, a.attnum"
+        )
+        for r in _execute(col_sql, tschema=self.schema):
+            rel_cols = columns.setdefault(r["relname"], [])
+            rel_cols.append((r["attname"], r["data_type"], r["type_name"]))
+
+        geom_sql = text(
+            "SELECT f_table_name, f_geometry_column, type, srid "
+            "FROM geometry_columns WHERE f_table_schema = :tschema "
+            "ORDER BY f_table_name, f_geometry_column"
+        )
+        for r in _execute(geom_sql, tschema=self.schema):
+            table_geoms = geometry_columns.setdefault(
+                r["f_table_name"], OrderedDict()
+            )
+            table_geoms[r["f_geometry_column"]] = (r["type"], r["srid"])
+
+        fk_sql = text(
+            "SELECT cl.relname AS table_name, att.attname AS column_name, "
+            "fcl.relname AS foreign_table_name, "
+            "fatt.attname AS foreign_column_name, con.conname "
+            "AS constraint_name FROM ("
+            "SELECT conname, conrelid, confrelid, unnest(conkey) AS conkey, "
+            "unnest(confkey) AS confkey FROM pg_constraint "
+            "WHERE contype = 'f') con "
+            "JOIN pg_class cl ON cl.oid = con.conrelid "
+            "JOIN pg_namespace n ON n.oid = cl.relnamespace "
+            "JOIN pg_attribute att ON att.attrelid = con.conrelid "
+            "AND att.attnum = con.conkey "
+            "JOIN pg_class fcl ON fcl.oid = con.confrelid "
+            "JOIN pg_attribute fatt ON fatt.attrelid = con.confrelid "
+            "AND fatt.attnum = con.confkey "
+            "WHERE n.nspname = :tschema"
+        )
+        for r in _execute(fk_sql, tschema=self.schema):
+            foreign_keys.append((
+                r["table_name"], r["column_name"], r["foreign_table_name"],
+                r["foreign_column_name"], r["constraint_name"]
+            ))
+
+        self.tables = tables
+        self.views = views
+        self._columns = columns
+        self._geometry_columns = geometry_columns
+        self._foreign_keys = foreign_keys
+        self._loaded = True
+
+    def column_names(self, relation, creation_order=False):
+        """
+        :param relation: Name of the table or view.
+        :type relation: str
+        :param creation_order: True to return the columns in the order they
+        were created, else they are sorted by name.
+        :type creation_order: bool
+        :return: Returns the column names of the table or view.
+        :rtype: list
+        """
+        col_names = [c[0] for c in self._columns.get(relation, [])]
+
+        if not creation_order:
+            col_names.sort()
+
+        return col_names
+
+    def column_type(self, relation, column):
+        """
+        :param relation: Name of the table or view.
+        :type relation: str
+        :param column: Column name.
+        :type column: str
+        :return: Returns the data type of the column or an empty string if
+        the column does not exist.
+        :rtype: str
+        """
+        is_view = relation in self.views
+
+        for name, data_type, type_name in self._columns.get(relation, []):
+            if name == column:
+                return type_name if is_view else data_type
+
+        return ""
+
+    def geometry_columns(self, table):
+        """
+        :param table: Table or view name.
+        :type table: str
+        :return: Returns the geometry column names, sorted by name, and the
+        corresponding geometry type and SRID.
+        :rtype: OrderedDict
+        """
+        return self._geometry_columns.get(table, OrderedDict())
+
+    def spatial_tables(self):
+        """
+        :return: Returns the names of the tables and views with at least one
+        geometry column.
+        :rtype: list
+        """
+        return self._geometry_columns.keys()
+
+    def foreign_keys(self, table, search_parent=True):
+        """
+        :param table: Name of the table.
+        :type table: str
+        :param search_parent: True to return the foreign keys where the
+        table is the child, else those where the table is the parent.
+        :type search_parent: bool
+        :return: Returns tuples of table, column, foreign table, foreign
+        column and constraint names.
+        :rtype: list
+        """
+        tb_idx = 0 if search_parent else 2
+
+        return [fk for fk in self._foreign_keys if fk[tb_idx] == table]
+
+
+def catalog_snapshot(schema="public"):
+    """
+    :param schema: Name of the database schema.
+    :type schema: str
+    :return: Returns the loaded catalog snapshot of the given schema. The
+    snapshot is loaded from the database on first use or if it has been
+    invalidated.
+    :rtype: CatalogSnapshot
+    """
+    snapshot = _catalog_snapshots.get(schema, None)
+    if snapshot is None:
+        snapshot = CatalogSnapshot(schema)
+        _catalog_snapshots[schema] = snapshot
+
+    if not snapshot.is_loaded or _catalog_snapshot_suspended:
+        snapshot.refresh()
+
+    return snapshot
+
+
+def refresh_catalog_snapshot():
+    """
+    Invalidates the catalog snapshots so that they are reloaded from the
+    database on next access. Should be called after the database schema
+    has changed or the database connection has been reset.
+    """
+    for snapshot in _catalog_snapshots.values():
+        snapshot.invalidate()
+
+
+def suspend_catalog_snapshot(suspend):
+    """
+    Specify whether catalog snapshots should be reloaded on every access.
+    Used when making a series of schema changes, such as during a
+    configuration update, which are not all executed through this module.
+    :param suspend: True to reload the catalog on every access, False to
+    reuse the loaded snapshots.
+    :type suspend: bool
+    """
+    global _catalog_snapshot_suspended
+
+    _catalog_snapshot_suspended = suspend
+    refresh_catalog_snapshot()
+
+
 def spatial_tables(exclude_views=False):
     """
     Returns a list of spatial table names in the STDM database.
     """
-    t = text("select DISTINCT f_table_name from geometry_columns")
-    result = _execute(t)
+    snapshot = catalog_snapshot()
 
     spTables = []
-    views = pg_views()
 
-    for r in result:
-        spTable = r["f_table_name"]
+    for spTable in snapshot.spatial_tables():
         if exclude_views:
-            tableIndex = getIndex(views,spTable)
+            tableIndex = getIndex(snapshot.views, spTable)
             if tableIndex == -1:
                 spTables.append(spTable)
         else:
@@ -83,14 +341,9 @@ def pg_tables(schema="public", exclude_lookups=False):
     Views are also excluded. See separate function for retrieving views.
     :rtype: list
     """
-    t = text("SELECT table_name FROM information_schema.tables WHERE table_schema = :tschema and table_type = :tbtype " \
-             "ORDER BY table_name ASC")
-    result = _execute(t, tschema=schema, tbtype="BASE TABLE")
-        
     pgTables = []
         
-    for r in result:
-        tableName = r["table_name"]
+    for tableName in catalog_snapshot(schema).tables:
         
         #Remove default PostGIS tables
         tableIndex = getIndex(_postGISTables, tableName)
@@ -112,15 +365,9 @@ def pg_views(schema="public"):
     """
     Returns the views in the given schema minus the default PostGIS views.
     """
-    t = text("SELECT table_name FROM information_schema.tables WHERE table_schema = :tschema and table_type = :tbtype " \
-             "ORDER BY table_name ASC")
-    result = _execute(t, tschema = schema, tbtype = "VIEW")
-        
     pgViews = []
         
-    for r in result:
-
-        viewName = r["table_name"]
+    for viewName in catalog_snapshot(schema).views:
         
         #Remove default PostGIS tables
         viewIndex = getIndex(_postGISViews, viewName)
@@ -336,27 +583,12 @@ def table_column_names(tableName, spatialColumns=False, creation_order=False):
     If 'spatialColumns' then the function will lookup for spatial columns in the given 
     table or view.
     """
+    snapshot = catalog_snapshot()
+
     if spatialColumns:
-        sql = u"select f_geometry_column from geometry_columns where f_table_name = :tbname ORDER BY f_geometry_column ASC"
-        columnName = "f_geometry_column"
-    else:
-        if not creation_order:
-            sql = u"select column_name from information_schema.columns where table_name = :tbname ORDER BY column_name ASC"
-            columnName = "column_name"
-        else:
-            sql = u"select column_name from information_schema.columns where table_name = :tbname"
-            columnName = "column_name"
+        return snapshot.geometry_columns(tableName).keys()
 
-    t = text(sql)
-    result = _execute(t, tbname=tableName)
-        
-    columnNames = []
-       
-    for r in result:
-        colName = r[columnName]
-        columnNames.append(colName)
-           
-    return columnNames
+    return snapshot.column_names(tableName, creation_order)
 
 def non_spatial_table_columns(table):
     """
@@ -391,21 +623,9 @@ def geometryType(tableName, spatialColumnName, schemaName="public"):
     Returns a tuple of geometry type and EPSG code of the given column name in
     the table within the given schema.
     """
-    sql = u"select type,srid from geometry_columns where f_table_name = :tbname " \
-          "and f_geometry_column = :spcolumn and f_table_schema = :tbschema"
-    t = text(sql)
-    
-    result = _execute(t,tbname = tableName,spcolumn=spatialColumnName,tbschema=schemaName)
-        
-    geomType,epsg_code = "", -1
-       
-    for r in result:
-        geomType = r["type"]
-        epsg_code = r["srid"]
-        
-        break
-        
-    return (geomType,epsg_code)
+    geom_columns = catalog_snapshot(schemaName).geometry_columns(tableName)
+
+    return geom_columns.get(spatialColumnName, ("", -1))
 
 def unique_column_values(tableName, columnName, quoteDataTypes=["character varying"]):
     """
@@ -447,36 +667,10 @@ def columnType(tableName, columnName):
     """
     Returns the PostgreSQL data type of the specified column.
     """
-    view = tableName in pg_views()
-    if not view:
-        sql = u"SELECT data_type FROM information_schema.columns where table_name='{}' AND column_name='{}'".\
-            format(tableName, columnName)
-    else:
-        # if ' ' in columnName:
-        #     columnName = u'"{}"'.format(columnName)
-        if '"' in columnName:
-            sql = u'SELECT pg_typeof({}) from {} limit 1;'.format(
-                columnName, tableName
-            )
-        else:
-            sql = u'SELECT pg_typeof("{}") from {} limit 1;'.format(
-                columnName, tableName
-            )
+    # Quoted column names are used for views
+    columnName = columnName.strip('"')
 
-    t = text(sql)
-
-    result = _execute(t)
-
-    dataType = ""
-    for r in result:
-        if view:
-            if len(r) > 0:
-                dataType = r[0]
-        else:
-            dataType = r["data_type"]
-
-        break
-    return dataType
+    return catalog_snapshot().column_type(tableName, columnName)
 
 def columns_by_type(table, data_types):
     """
@@ -491,9 +685,11 @@ def columns_by_type(table, data_types):
     """
     cols = []
 
-    table_cols = table_column_names(table)
+    snapshot = catalog_snapshot()
+
+    table_cols = snapshot.column_names(table)
     for tc in table_cols:
-        col_type = columnType(table, tc)
+        col_type = snapshot.column_type(table, tc)
         type_idx = getIndex(data_types, col_type)
 
         if type_idx != -1:
@@ -531,6 +727,25 @@ def numeric_varchar_columns(table, exclude_fk_columns=True):
     else:
         return num_char_cols
 
+def qgsgeometry_from_wkb(wkb):
+    """
+    Creates a QgsGeometry object from a geometry in WKB format.
+    :param wkb: Geometry in WKB format.
+    :type wkb: buffer
+    :return: QGIS Geometry object or None if the WKB could not be parsed.
+    :rtype: QgsGeometry
+    """
+    if wkb is None:
+        return None
+
+    geom = QgsGeometry()
+    geom.fromWkb(str(wkb))
+
+    if geom.isEmpty():
+        return None
+
+    return geom
+
 def qgsgeometry_from_wkbelement(wkb_element):
     """
     Convert a geoalchemy object in str or WKBElement format to the a
@@ -538,6 +753,11 @@ def qgsgeometry_from_wkbelement(wkb_element):
     :return: QGIS Geometry object.
     """
     if isinstance(wkb_element, WKBElement):
+        #Geometry columns are selected as WKB hence no database round trip
+        geom = qgsgeometry_from_wkb(wkb_element.data)
+        if not geom is None:
+            return geom
+
         db_session = STDMDb.instance().session
         geom_wkt = db_session.scalar(wkb_element.ST_AsText())
 
@@ -562,6 +782,11 @@ def _execute(sql,**kwargs):
         result = conn.execute(sql,**kwargs)
         trans.commit()
         conn.close()
+
+        #Catalog snapshot is stale if the schema has changed
+        if unicode(sql).lstrip().upper().startswith(_ddl_commands):
+            refresh_catalog_snapshot()
+
         return result
     except SQLAlchemyError as db_error:
         trans.rollback()
@@ -648,49 +873,14 @@ def foreign_key_parent_tables(table_name, search_parent=True, filter_exp=None):
     name, corresponding foreign column name and constraint name.
     :rtype: list
     """
-    # Check if the view for listing foreign key references exists
-    fk_ref_view = pg_table_exists("foreign_key_references")
-
-    # Create if it does not exist
-    if not fk_ref_view:
-        script_path = PLUGIN_DIR + "/scripts/foreign_key_references.sql"
-
-        script_file = QFile(script_path)
-        if script_file.exists():
-            if not script_file.open(QIODevice.ReadOnly):
-                return None
-
-            reader = QTextStream(script_file)
-            sql = reader.readAll()
-            if sql:
-                t = text(sql)
-                _execute(t)
-
-        else:
-            return None
-
-    if search_parent:
-        ref_table = "foreign_table_name"
-        search_table = "table_name"
-    else:
-        ref_table = "table_name"
-        search_table = "foreign_table_name"
-
-    # Fetch foreign key references
-    sql = u"SELECT column_name,{0},foreign_column_name, constraint_name FROM " \
-          u"foreign_key_references where {1} =:tb_name".format(ref_table,
-                                                               search_table)
-
-    t = text(sql)
-    result = _execute(t, tb_name=table_name)
-
     fk_refs = []
 
-    for r in result:
-        rel_table = r[ref_table]
+    fks = catalog_snapshot().foreign_keys(table_name, search_parent)
+
+    for tb, col, foreign_tb, foreign_col, constraint in fks:
+        rel_table = foreign_tb if search_parent else tb
 
-        fk_ref = r["column_name"], rel_table,\
-                 r["foreign_column_name"], r["constraint_name"]
+        fk_ref = col, rel_table, foreign_col, constraint
 
         if not filter_exp is None:
             if filter_exp.indexIn(rel_table) >= 0:
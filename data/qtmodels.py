@@ -24,10 +24,32 @@ from decimal import Decimal
 from PyQt4.QtCore import *
 from PyQt4.QtGui import *
 
+from sqlalchemy import (
+    and_,
+    cast,
+    func,
+    or_,
+    Text
+)
+from sqlalchemy.sql import (
+    column,
+    select,
+    table
+)
+from sqlalchemy.sql.expression import nullslast
+
 from .modelformatters import (
     LookupFormatter,
     DoBFormatter
 )
+from .configuration.columns import (
+    AdministrativeSpatialUnitColumn,
+    ForeignKeyColumn,
+    GeometryColumn,
+    LookupColumn,
+    VirtualColumn
+)
+from .pg_utils import _execute
 #Standard colors for widgets supporting alternating rows
 ALT_COLOR_EVEN = QColor(255,165,79)
 ALT_COLOR_ODD = QColor(135,206,255)
@@ -544,6 +566,418 @@ class VerticalHeaderSortFilterProxyModel(QSortFilterProxyModel):
 
         return super(VerticalHeaderSortFilterProxyModel, self).headerData(section, orientation, role)
 
+class _RecordRow(object):
+    """
+    Values of a row in the EntityRecordsTableModel. Database values are
+    only converted to display values when the row is first displayed.
+    """
+    __slots__ = ('values', 'formatted')
+
+    def __init__(self, values, formatted=False):
+        self.values = values
+        self.formatted = formatted
+
+
+class EntityRecordsTableModel(QAbstractTableModel):
+    """
+    Table model that fetches the records of an entity in pages as the view
+    is scrolled. Pages are read using keyset pagination, sorting and
+    filtering are applied in the database and cell values are formatted
+    on demand.
+    """
+    PAGE_SIZE = 500
+
+    def __init__(self, entity, attributes, headers, formatters=None,
+                 parent=None, page_size=PAGE_SIZE, search_query=None,
+                 search_count=None):
+        """
+        :param entity: Entity whose records will be loaded.
+        :type entity: Entity
+        :param attributes: Names of the attributes in each column, the
+        first one should be the id.
+        :type attributes: list
+        :param headers: Header labels of the columns.
+        :type headers: list
+        :param formatters: Column value formatters indexed by attribute
+        name.
+        :type formatters: dict
+        :param page_size: Number of records fetched at a time.
+        :type page_size: int
+        :param search_query: Only fetches the records matching the search
+        e.g. from the advanced search.
+        :type search_query: EntitySearchQuery
+        :param search_count: Number of records matching the search and
+        True if it is an estimate, as returned by EntitySearchQuery.count,
+        so that the records are not counted again.
+        :type search_count: tuple
+        """
+        QAbstractTableModel.__init__(self, parent)
+
+        self._entity = entity
+        self._attributes = attributes
+        self._headers = headers
+        self._formatters = formatters if not formatters is None else {}
+        self._page_size = page_size
+
+        #Only physical columns can be fetched, sorted and filtered
+        self._table_columns = [
+            c.name for c in entity.columns.values()
+            if not isinstance(c, (VirtualColumn, GeometryColumn))
+        ]
+        if not 'id' in self._table_columns:
+            self._table_columns.insert(0, 'id')
+
+        self._select_columns = [
+            a for a in attributes if a in self._table_columns
+        ]
+        if not 'id' in self._select_columns:
+            self._select_columns.insert(0, 'id')
+
+        self._table = table(
+            entity.name,
+            *[column(c) for c in self._table_columns]
+        )
+
+        self._search_query = search_query
+        self._search_count = search_count
+        self._search_clause = None
+        if not search_query is None:
+            self._search_clause = search_query.where_clause(self._table)
+
+        self._rows = []
+        self._last_key = None
+        self._all_fetched = False
+        self._total_count = None
+        self._count_estimated = False
+
+        #Records are shown with the most recent first by default
+        self._sort_column = 'id'
+        self._sort_desc = True
+
+        self._filter_column = None
+        self._filter_text = ''
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+
+        return len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return len(self._headers)
+
+    def total_count(self, refresh=False):
+        """
+        :param refresh: True to count the records again.
+        :type refresh: bool
+        :return: Returns the number of records in the database that match
+        the current filter.
+        :rtype: int
+        """
+        if self._total_count is None or refresh:
+            filter_clause = self._filter_clause()
+            self._count_estimated = False
+
+            #Large search results are not counted in full
+            if not self._search_query is None and \
+                    self._filter_column is None:
+                if self._search_count is None or refresh:
+                    self._search_count = self._search_query.count()
+
+                self._total_count, self._count_estimated = \
+                    self._search_count
+
+                return self._total_count
+
+            query = select([func.count()]).select_from(self._table)
+
+            conditions = [
+                c for c in (self._search_clause, filter_clause)
+                if not c is None
+            ]
+            if len(conditions) > 0:
+                query = query.where(and_(*conditions))
+
+            self._total_count = _execute(query).scalar()
+
+        return self._total_count
+
+    def is_count_estimated(self):
+        """
+        :return: True if the total count is an estimate.
+        :rtype: bool
+        """
+        return self._count_estimated
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or role != Qt.DisplayRole:
+            return None
+
+        row = self._rows[index.row()]
+        if not row.formatted:
+            self._format_row(row)
+
+        value = row.values[index.column()]
+
+        #Decimal not supported by QVariant so we adapt it to a supported type
+        if isinstance(value, Decimal):
+            return str(value)
+
+        return value
+
+    def _format_row(self, row):
+        for i, attr in enumerate(self._attributes):
+            value = row.values[i]
+            if value is not None and attr in self._formatters:
+                row.values[i] = self._formatters[attr].format_column_value(
+                    value
+                )
+
+        row.formatted = True
+
+    def headerData(self, section, orientation, role):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self._headers[section]
+
+        elif orientation == Qt.Vertical and role == Qt.DisplayRole:
+            return section + 1
+
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if index.isValid() and role == Qt.EditRole:
+            row = self._rows[index.row()]
+            if not row.formatted:
+                self._format_row(row)
+
+            row.values[index.column()] = value
+            self.dataChanged.emit(index, index)
+
+            return True
+
+        return False
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.ItemIsEnabled
+
+        return Qt.ItemIsEditable|Qt.ItemIsSelectable|Qt.ItemIsEnabled
+
+    def insertRows(self, position, rows, parent=QModelIndex()):
+        if position < 0 or position > len(self._rows):
+            return False
+
+        self.beginInsertRows(parent, position, position + rows - 1)
+
+        for i in range(rows):
+            self._rows.insert(
+                position,
+                _RecordRow(["" for c in range(self.columnCount())], True)
+            )
+
+        self.endInsertRows()
+
+        return True
+
+    def removeRows(self, position, count, parent=QModelIndex()):
+        if position < 0 or position >= len(self._rows) or count < 1:
+            return False
+
+        last = min(position + count, len(self._rows)) - 1
+        self.beginRemoveRows(parent, position, last)
+
+        del self._rows[position:last + 1]
+
+        self.endRemoveRows()
+
+        return True
+
+    def canFetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return False
+
+        return not self._all_fetched
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid() or self._all_fetched:
+            return
+
+        records = _execute(self._page_query()).fetchall()
+
+        if len(records) < self._page_size:
+            self._all_fetched = True
+
+        if len(records) == 0:
+            return
+
+        #Load the parent records, lookups etc. for the page in batches
+        for attr, formatter in self._formatters.iteritems():
+            prefetch = getattr(formatter, 'prefetch_column_values', None)
+            if not prefetch is None and attr in self._select_columns:
+                prefetch([r[attr] for r in records])
+
+        position = len(self._rows)
+        self.beginInsertRows(QModelIndex(), position,
+                             position + len(records) - 1)
+
+        for r in records:
+            values = [
+                r[a] if a in self._select_columns else None
+                for a in self._attributes
+            ]
+            self._rows.append(_RecordRow(values))
+
+        self.endInsertRows()
+
+        last = records[-1]
+        self._last_key = (last[self._sort_column], last['id'])
+
+    def _page_query(self):
+        query = select([self._table.c[c] for c in self._select_columns])
+
+        conditions = [
+            c for c in (
+                self._search_clause,
+                self._filter_clause(),
+                self._keyset_clause()
+            )
+            if not c is None
+        ]
+        if len(conditions) > 0:
+            query = query.where(and_(*conditions))
+
+        return query.order_by(*self._order_by()).limit(self._page_size)
+
+    def _order_by(self):
+        id_col = self._table.c.id
+
+        if self._sort_column == 'id':
+            return [id_col.desc() if self._sort_desc else id_col.asc()]
+
+        sort_col = self._table.c[self._sort_column]
+        sort_exp = sort_col.desc() if self._sort_desc else sort_col.asc()
+
+        return [nullslast(sort_exp), id_col.asc()]
+
+    def _keyset_clause(self):
+        #Selects the records after the last fetched record
+        if self._last_key is None:
+            return None
+
+        last_value, last_id = self._last_key
+        id_col = self._table.c.id
+
+        if self._sort_column == 'id':
+            return id_col < last_id if self._sort_desc else id_col > last_id
+
+        sort_col = self._table.c[self._sort_column]
+
+        #Nulls are sorted last
+        if last_value is None:
+            return and_(sort_col == None, id_col > last_id)
+
+        if self._sort_desc:
+            after = sort_col < last_value
+
+        else:
+            after = sort_col > last_value
+
+        return or_(
+            after,
+            and_(sort_col == last_value, id_col > last_id),
+            sort_col == None
+        )
+
+    def _filter_clause(self):
+        if not self._filter_column or not self._filter_text:
+            return None
+
+        pattern = u'%{0}%'.format(
+            self._filter_text.replace('\\', '\\\\').replace(
+                '%', '\\%').replace('_', '\\_')
+        )
+
+        filter_col = self._table.c[self._filter_column]
+        ent_col = self._entity.columns.get(self._filter_column, None)
+
+        #Match the display values of related records
+        if isinstance(ent_col, ForeignKeyColumn):
+            if isinstance(ent_col, LookupColumn):
+                parent_name = ent_col.value_list.name
+                display_cols = ['value', 'code']
+
+            elif isinstance(ent_col, AdministrativeSpatialUnitColumn):
+                parent_name = ent_col.entity.profile.\
+                    administrative_spatial_unit.name
+                display_cols = ['name', 'code']
+
+            else:
+                parent_name = ent_col.entity_relation.parent.name
+                display_cols = ent_col.entity_relation.display_cols
+
+            parent_table = table(
+                parent_name,
+                *[column(c) for c in set(['id'] + display_cols)]
+            )
+            matches = select([parent_table.c.id]).where(or_(*[
+                cast(parent_table.c[c], Text).ilike(pattern)
+                for c in display_cols
+            ]))
+
+            return filter_col.in_(matches)
+
+        return cast(filter_col, Text).ilike(pattern)
+
+    def reload(self):
+        """
+        Clears the rows and fetches the first page using the current sort
+        and filter settings.
+        """
+        self.beginResetModel()
+
+        self._rows = []
+        self._last_key = None
+        self._all_fetched = False
+        self._total_count = None
+
+        self.endResetModel()
+
+        self.fetchMore()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        """
+        Sorts the records in the database using the attribute in the
+        given column.
+        """
+        if column < 0 or column >= len(self._attributes):
+            return
+
+        attr = self._attributes[column]
+        if not attr in self._select_columns:
+            return
+
+        self._sort_column = attr
+        self._sort_desc = order == Qt.DescendingOrder
+
+        self.reload()
+
+    def set_filter(self, column_name, text):
+        """
+        Only shows the records whose value in the given column contains
+        the text.
+        :param column_name: Name of the column in the entity.
+        :type column_name: str
+        :param text: Text to search for, the filter is cleared if empty.
+        :type text: str
+        """
+        if not column_name in self._table_columns:
+            column_name = None
+
+        self._filter_column = column_name
+        self._filter_text = unicode(text) if text else u''
+
+        self.reload()
+
 class STRTreeViewModel(QAbstractItemModel):
     """
     Model for rendering social tenure relationship nodes in a tree view.
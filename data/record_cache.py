@@ -0,0 +1,287 @@
+"""
+/***************************************************************************
+Name                 : Record cache
+Description          : Process-wide cache of the display columns of parent,
+                       lookup and administrative unit records.
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import logging
+import time
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import (
+    column,
+    select,
+    table
+)
+
+from stdm.data.configuration.columns import ForeignKeyColumn
+from stdm.data.pg_utils import _execute
+
+LOGGER = logging.getLogger('stdm')
+
+#Maximum number of records held by each cache
+DEFAULT_CAPACITY = 20000
+
+#Maximum number of ids in the IN clause when fetching missing records
+FETCH_BATCH_SIZE = 500
+
+#Number of seconds after which the cached records are reloaded so that
+#changes made by other users or outside the ORM are picked up
+DEFAULT_MAX_AGE = 300
+
+
+class DisplayRecordCache(object):
+    """
+    Least recently used cache of the records in a table, keyed by the
+    primary key and containing only the id and the specified columns.
+    Tables with more records than the cache capacity are not loaded in
+    full, missing records are fetched in batches. The records are
+    reloaded once they are older than the maximum age.
+    """
+    def __init__(self, table_name, columns, capacity=DEFAULT_CAPACITY,
+                 max_age=DEFAULT_MAX_AGE):
+        """
+        :param table_name: Name of the table.
+        :type table_name: str
+        :param columns: Names of the columns to be fetched in addition to
+        the id column.
+        :type columns: list
+        :param capacity: Maximum number of records in the cache.
+        :type capacity: int
+        :param max_age: Number of seconds after which the records are
+        reloaded. None to keep them until the cache is cleared.
+        :type max_age: int
+        """
+        self.table_name = table_name
+        self.columns = [c for c in columns if c != 'id']
+        self.capacity = capacity
+        self.max_age = max_age
+
+        self._table = table(
+            table_name,
+            *[column(c) for c in ['id'] + self.columns]
+        )
+        self._records = OrderedDict()
+
+        #True if all the records in the table are in the cache
+        self._complete = False
+        self._loaded = False
+        self._loaded_at = None
+
+    def __len__(self):
+        return len(self._records)
+
+    @property
+    def is_complete(self):
+        """
+        :return: Returns True if all the records in the table have been
+        loaded i.e. the number of records does not exceed the capacity.
+        :rtype: bool
+        """
+        self._load()
+
+        return self._complete
+
+    def _select(self):
+        return select([self._table.c[c] for c in ['id'] + self.columns])
+
+    def is_expired(self):
+        """
+        :return: Returns True if the records were loaded more than the
+        maximum age ago.
+        :rtype: bool
+        """
+        if self._loaded_at is None or self.max_age is None:
+            return False
+
+        return time.time() - self._loaded_at > self.max_age
+
+    def _load(self):
+        """
+        Loads records up to the cache capacity in one query.
+        """
+        if self.is_expired():
+            self.clear()
+
+        if self._loaded:
+            return
+
+        query = self._select().order_by(self._table.c.id).limit(
+            self.capacity + 1
+        )
+        rows = _execute(query).fetchall()
+
+        self._complete = len(rows) <= self.capacity
+        for r in rows[:self.capacity]:
+            self._records[r.id] = r
+
+        self._loaded = True
+        self._loaded_at = time.time()
+
+    def _add(self, rec):
+        if rec.id in self._records:
+            del self._records[rec.id]
+
+        self._records[rec.id] = rec
+
+        while len(self._records) > self.capacity:
+            self._records.popitem(last=False)
+
+            #Evicted records will have to be fetched again
+            self._complete = False
+
+    def records(self):
+        """
+        :return: Returns the cached records sorted by id. All the records
+        in the table are returned if the cache is complete.
+        :rtype: list
+        """
+        self._load()
+
+        return [self._records[k] for k in sorted(self._records)]
+
+    def record(self, record_id):
+        """
+        :param record_id: Primary key of the record.
+        :type record_id: int
+        :return: Returns the record with the given id or None if it does
+        not exist.
+        """
+        return self.fetch([record_id]).get(record_id, None)
+
+    def fetch(self, record_ids):
+        """
+        Returns the records with the given ids. Those that are not in the
+        cache are fetched from the database in batches.
+        :param record_ids: Primary keys of the records.
+        :type record_ids: list
+        :return: Returns a collection of records indexed by id. Ids that
+        do not exist in the table are excluded.
+        :rtype: dict
+        """
+        self._load()
+
+        found = {}
+        missing = []
+        for rid in set(record_ids):
+            if rid is None:
+                continue
+
+            rec = self._records.get(rid, None)
+            if rec is None:
+                missing.append(rid)
+
+            else:
+                #Mark as most recently used
+                self._add(rec)
+                found[rid] = rec
+
+        for i in range(0, len(missing), FETCH_BATCH_SIZE):
+            batch = missing[i:i + FETCH_BATCH_SIZE]
+            query = self._select().where(self._table.c.id.in_(batch))
+
+            for rec in _execute(query).fetchall():
+                self._add(rec)
+                found[rec.id] = rec
+
+        return found
+
+    def clear(self):
+        """
+        Removes all the records from the cache, which will be reloaded
+        when next accessed.
+        """
+        self._records = OrderedDict()
+        self._complete = False
+        self._loaded = False
+        self._loaded_at = None
+
+
+#Caches shared by the widget factories, indexed by table and columns
+_record_caches = {}
+
+
+def display_record_cache(table_name, columns, capacity=DEFAULT_CAPACITY):
+    """
+    :param table_name: Name of the table.
+    :type table_name: str
+    :param columns: Display columns to be fetched in addition to the id.
+    :type columns: list
+    :return: Returns the cache shared by all the consumers of the given
+    table and columns.
+    :rtype: DisplayRecordCache
+    """
+    key = (table_name, tuple(sorted(set(columns) - set(['id']))))
+
+    if not key in _record_caches:
+        _record_caches[key] = DisplayRecordCache(
+            table_name,
+            list(key[1]),
+            capacity
+        )
+
+    return _record_caches[key]
+
+
+def clear_display_record_caches(table_name=None):
+    """
+    Clears the caches of the table with the given name or all the caches
+    if no name is specified.
+    :param table_name: Name of the table.
+    :type table_name: str
+    """
+    for key, cache in _record_caches.iteritems():
+        if table_name is None or key[0] == table_name:
+            cache.clear()
+
+
+def clear_entity_record_caches(entity):
+    """
+    Clears the caches of the parent, lookup and administrative unit tables
+    referenced by the entity columns. Should be called when a form or
+    browser of the entity is opened so that it shows the current records.
+    :param entity: Entity whose related records are displayed.
+    :type entity: Entity
+    """
+    if len(_record_caches) == 0:
+        return
+
+    for c in entity.columns.values():
+        if isinstance(c, ForeignKeyColumn) and not c.parent is None:
+            clear_display_record_caches(c.parent.name)
+
+
+@event.listens_for(Session, 'after_flush')
+def _invalidate_flushed_tables(session, flush_context):
+    """
+    Clears the caches of the tables whose records have been added,
+    modified or deleted through the ORM.
+    """
+    if len(_record_caches) == 0:
+        return
+
+    table_names = set()
+    for obj in list(session.new) + list(session.dirty) + \
+            list(session.deleted):
+        obj_table = getattr(obj, '__table__', None)
+        if not obj_table is None:
+            table_names.add(obj_table.name)
+
+    for name in table_names:
+        clear_display_record_caches(name)
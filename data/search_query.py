@@ -0,0 +1,278 @@
+"""
+/***************************************************************************
+Name                 : Search query
+Description          : Builds parameterized search conditions for the
+                       columns of an entity and counts the matching records.
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import json
+import logging
+from datetime import (
+    date,
+    datetime,
+    timedelta
+)
+
+from PyQt4.QtCore import (
+    QDate,
+    QDateTime
+)
+from sqlalchemy import (
+    and_,
+    func
+)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import (
+    column,
+    select,
+    table
+)
+
+from stdm.data.configuration.columns import (
+    BooleanColumn,
+    DateColumn,
+    DateTimeColumn,
+    DoubleColumn,
+    ForeignKeyColumn,
+    IntegerColumn,
+    TextColumn,
+    VarCharColumn
+)
+from stdm.data.database import STDMDb
+from stdm.data.pg_utils import _execute
+from stdm.data.text_search import (
+    ensure_search_indexes,
+    match_clause,
+    PREFIX_MATCH
+)
+
+LOGGER = logging.getLogger('stdm')
+
+#Matching records are counted exactly up to this number, then estimated
+EXACT_COUNT_LIMIT = 10000
+
+
+def _python_value(value):
+    #Converts the values of date widgets for use as bound parameters
+    if isinstance(value, QDateTime):
+        return value.toPyDateTime()
+
+    if isinstance(value, QDate):
+        return value.toPyDate()
+
+    if isinstance(value, (tuple, list)):
+        return tuple([_python_value(v) for v in value])
+
+    return value
+
+
+def _is_range(value):
+    return isinstance(value, (tuple, list)) and len(value) == 2
+
+
+def _range_clause(col, lower, upper):
+    #Open-ended if one of the bounds is None
+    if lower is None:
+        return col <= upper
+
+    if upper is None:
+        return col >= lower
+
+    return col.between(lower, upper)
+
+
+def _day_clause(col, value):
+    #Matches the date and time values within the day
+    if isinstance(value, datetime):
+        value = value.date()
+
+    day_start = datetime(value.year, value.month, value.day)
+
+    return and_(col >= day_start, col < day_start + timedelta(days=1))
+
+
+def column_search_clause(entity_column, col, value):
+    """
+    Creates a condition for matching the values in a column based on the
+    type of the entity column. The value is always a bound parameter.
+    Text is matched by prefix ignoring case, dates and numbers by value or
+    range if the value is a (lower, upper) tuple, and related records by
+    id.
+    :param entity_column: Column in the entity configuration.
+    :type entity_column: BaseColumn
+    :param col: Table column to search.
+    :param value: Search value.
+    :return: Returns the where clause.
+    """
+    if isinstance(entity_column, ForeignKeyColumn):
+        return col == value
+
+    if isinstance(entity_column, BooleanColumn):
+        return col == bool(value)
+
+    if _is_range(value):
+        return _range_clause(col, value[0], value[1])
+
+    if isinstance(entity_column, DateTimeColumn) and \
+            isinstance(value, date):
+        return _day_clause(col, value)
+
+    if isinstance(entity_column, (DateColumn, IntegerColumn, DoubleColumn)):
+        return col == value
+
+    if isinstance(entity_column, (VarCharColumn, TextColumn)):
+        return match_clause(col, value, PREFIX_MATCH)
+
+    return col == value
+
+
+def _text_search(entity_column):
+    #True if the column is searched using the text indexes
+    return isinstance(entity_column, (VarCharColumn, TextColumn)) and \
+        not isinstance(entity_column, (IntegerColumn, DoubleColumn))
+
+
+class EntitySearchQuery(object):
+    """
+    Search for entity records whose column values match the values
+    entered by the user. The conditions are created for the table of the
+    model that fetches the records so that only the displayed columns
+    are selected, a page at a time.
+    """
+    def __init__(self, entity, search_values):
+        """
+        :param entity: Entity whose records are searched.
+        :type entity: Entity
+        :param search_values: Search values indexed by column name.
+        :type search_values: dict
+        """
+        self.entity = entity
+        self.search_values = dict([
+            (name, _python_value(value))
+            for name, value in search_values.iteritems()
+            if name in entity.columns
+        ])
+
+        self._table = table(
+            entity.name,
+            *[column(c) for c in set(['id'] + self.search_values.keys())]
+        )
+
+    def is_empty(self):
+        """
+        :return: True if there are no search values.
+        :rtype: bool
+        """
+        return len(self.search_values) == 0
+
+    def where_clause(self, search_table=None):
+        """
+        :param search_table: Table whose columns are matched, containing
+        the search columns. Defaults to a table with the id and search
+        columns.
+        :return: Returns the conditions that the records have to match or
+        None if there are no search values.
+        """
+        if self.is_empty():
+            return None
+
+        if search_table is None:
+            search_table = self._table
+
+        return and_(*[
+            column_search_clause(
+                self.entity.columns[name],
+                search_table.c[name],
+                value
+            )
+            for name, value in self.search_values.iteritems()
+        ])
+
+    def index_columns(self):
+        """
+        :return: Returns the names of the searched columns that are
+        indexed and whether each is matched as text. Only text and foreign
+        key columns are indexed, an index on columns such as booleans and
+        dates is rarely selective enough to justify the cost of building
+        and maintaining it.
+        :rtype: list
+        """
+        columns = []
+        for name in self.search_values:
+            entity_column = self.entity.columns[name]
+            if _text_search(entity_column):
+                columns.append((name, True))
+
+            elif isinstance(entity_column, ForeignKeyColumn):
+                columns.append((name, False))
+
+        return columns
+
+    def ensure_indexes(self):
+        """
+        Creates the indexes used by the search conditions if they do not
+        exist.
+        """
+        for name, text_search in self.index_columns():
+            ensure_search_indexes(self.entity.name, name, text_search)
+
+    def _estimated_count(self):
+        #Number of rows estimated by the query planner
+        query = select([self._table.c.id]).where(self.where_clause())
+        compiled = query.compile(dialect=STDMDb.instance().engine.dialect)
+
+        try:
+            plan = STDMDb.instance().engine.execute(
+                u'EXPLAIN (FORMAT JSON) {0}'.format(unicode(compiled)),
+                compiled.params
+            ).scalar()
+
+        except SQLAlchemyError as db_error:
+            LOGGER.debug(u'Search result count could not be estimated. '
+                         u'{0}'.format(db_error))
+
+            return None
+
+        if isinstance(plan, basestring):
+            plan = json.loads(plan)
+
+        return int(plan[0]['Plan']['Plan Rows'])
+
+    def count(self, exact_limit=EXACT_COUNT_LIMIT):
+        """
+        Counts the matching records without counting beyond the limit, the
+        number of records above the limit is estimated.
+        :param exact_limit: Maximum number of records counted exactly.
+        :type exact_limit: int
+        :return: Returns the number of matching records and True if it is
+        an estimate.
+        :rtype: tuple
+        """
+        capped = select([self._table.c.id]).where(
+            self.where_clause()
+        ).limit(exact_limit + 1).alias('capped_search')
+        capped_count = _execute(
+            select([func.count()]).select_from(capped)
+        ).scalar()
+
+        if capped_count <= exact_limit:
+            return capped_count, False
+
+        estimate = self._estimated_count()
+        if estimate is None or estimate < capped_count:
+            return capped_count, True
+
+        return estimate, True
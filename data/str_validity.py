@@ -0,0 +1,99 @@
+"""
+/***************************************************************************
+Name                 : STR validity
+Description          : Filters party and spatial unit queries by the validity
+                       period of their social tenure relationships.
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from sqlalchemy import (
+    and_,
+    func
+)
+
+#Label of the column containing the ids of the valid STR records
+VALID_STR_IDS = 'valid_str_ids'
+
+
+def validity_period_clause(str_columns, from_date, to_date):
+    """
+    Creates a clause for STR records whose validity period lies within the
+    specified period i.e. the record starts on or after the start of the
+    period and ends on or before the end of the period. Records without a
+    start or end date are excluded.
+    :param str_columns: Social tenure model or table columns containing
+    the validity_start and validity_end columns.
+    :param from_date: Start of the period.
+    :type from_date: date
+    :param to_date: End of the period.
+    :type to_date: date
+    :return: Returns the where clause.
+    """
+    start = str_columns.validity_start
+    end = str_columns.validity_end
+
+    return and_(
+        start != None,
+        end != None,
+        start >= from_date,
+        end <= to_date
+    )
+
+
+def with_valid_str_ids(query, model, str_model, str_column, from_date,
+                       to_date):
+    """
+    Restricts the query of party or spatial unit records to those with STR
+    records valid within the specified period. The ids of the valid STR
+    records are aggregated per record so that they are returned in the
+    same query.
+    :param query: Query of the party or spatial unit model.
+    :type query: Query
+    :param model: Party or spatial unit model.
+    :param str_model: Social tenure model.
+    :param str_column: Attribute of the social tenure model referencing
+    the party or spatial unit.
+    :param from_date: Start of the period.
+    :type from_date: date
+    :param to_date: End of the period.
+    :type to_date: date
+    :return: Returns a query whose rows contain the record and the list of
+    its valid STR ids.
+    :rtype: Query
+    """
+    return query.add_columns(
+        func.array_agg(str_model.id).label(VALID_STR_IDS)
+    ).join(
+        str_model, str_column == model.id
+    ).filter(
+        validity_period_clause(str_model, from_date, to_date)
+    ).group_by(model.id)
+
+
+def split_valid_str_rows(rows):
+    """
+    :param rows: Rows returned by a query created using with_valid_str_ids.
+    :type rows: list
+    :return: Returns the records and the set of the valid STR ids of all
+    the records.
+    :rtype: tuple
+    """
+    records = []
+    valid_str_ids = set()
+    for record, str_ids in rows:
+        records.append(record)
+        valid_str_ids.update([i for i in str_ids or [] if not i is None])
+
+    return records, valid_str_ids
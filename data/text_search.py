@@ -0,0 +1,333 @@
+"""
+/***************************************************************************
+Name                 : Text search
+Description          : Index-backed exact, prefix and fuzzy matching of the
+                       values in a table column.
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import hashlib
+import logging
+
+from sqlalchemy import (
+    cast,
+    func,
+    Text
+)
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.sql import (
+    column,
+    select,
+    table,
+    text
+)
+
+from stdm.data.database import STDMDb
+from stdm.data.pg_utils import (
+    _execute,
+    refresh_catalog_snapshot
+)
+
+LOGGER = logging.getLogger('stdm')
+
+#Maximum number of values suggested while the user types
+SUGGESTION_LIMIT = 50
+
+#Minimum number of characters for fuzzy (trigram) matching
+MIN_FUZZY_LENGTH = 3
+
+#Maximum length of a PostgreSQL identifier
+MAX_IDENTIFIER_LENGTH = 63
+
+EXACT_MATCH = 'exact'
+PREFIX_MATCH = 'prefix'
+FUZZY_MATCH = 'fuzzy'
+
+#True/False once the availability of pg_trgm has been checked
+_trigram_support = None
+
+#Table columns whose indexes have been checked in this session
+_indexed_columns = set()
+
+
+def folded_value(col):
+    """
+    :param col: Column or column attribute.
+    :return: Returns the lower case text of the column. Indexes are created
+    on this expression hence it should be used in all the search clauses.
+    """
+    return func.lower(cast(col, Text))
+
+
+def _escape_like(term):
+    return term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+def match_clause(col, term, mode=EXACT_MATCH):
+    """
+    Creates a case-insensitive clause for matching the column values to
+    the search term.
+    :param col: Column or column attribute.
+    :param term: Search term.
+    :type term: str
+    :param mode: EXACT_MATCH, PREFIX_MATCH or FUZZY_MATCH. Fuzzy matching
+    requires the pg_trgm extension.
+    :type mode: str
+    :return: Returns the where clause.
+    """
+    folded_term = unicode(term).lower()
+
+    if mode == PREFIX_MATCH:
+        return folded_value(col).like(u'{0}%'.format(_escape_like(folded_term)))
+
+    elif mode == FUZZY_MATCH:
+        #Trigram similarity operator, escaped for the psycopg2 paramstyle
+        return folded_value(col).op('%%')(folded_term)
+
+    return folded_value(col) == folded_term
+
+
+def similarity(col, term):
+    """
+    :param col: Column or column attribute.
+    :param term: Search term.
+    :type term: str
+    :return: Returns the trigram similarity of the column values and the
+    search term, used for ranking fuzzy matches.
+    """
+    return func.similarity(folded_value(col), unicode(term).lower())
+
+
+def trigram_supported():
+    """
+    Checks whether the pg_trgm extension is installed and tries to create
+    it if it is available. The result is cached for the session.
+    :return: Returns True if fuzzy matching is supported.
+    :rtype: bool
+    """
+    global _trigram_support
+
+    if _trigram_support is not None:
+        return _trigram_support
+
+    sql = text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm';")
+    _trigram_support = _execute(sql).first() is not None
+
+    if not _trigram_support:
+        try:
+            _execute(text('CREATE EXTENSION IF NOT EXISTS pg_trgm;'))
+            _trigram_support = True
+
+        except SQLAlchemyError as db_error:
+            LOGGER.debug(u'Fuzzy search is not available, the pg_trgm '
+                         u'extension could not be created. {0}'.format(
+                db_error))
+
+    return _trigram_support
+
+
+def search_index_name(table_name, column_name, suffix):
+    """
+    :return: Returns the name of the search index, shortened using a hash
+    of the full name if it exceeds the PostgreSQL identifier length.
+    :rtype: str
+    """
+    name = u'idx_{0}_{1}_{2}'.format(table_name, column_name, suffix)
+
+    if len(name) > MAX_IDENTIFIER_LENGTH:
+        digest = hashlib.sha1(name.encode('utf-8')).hexdigest()[:10]
+        name = u'{0}_{1}'.format(
+            name[:MAX_IDENTIFIER_LENGTH - len(digest) - 1],
+            digest
+        )
+
+    return name
+
+
+def _index_valid(index_name):
+    #None if the index does not exist, False if it was left invalid by a
+    #failed concurrent build
+    sql = text(
+        'SELECT i.indisvalid FROM pg_index i '
+        'JOIN pg_class c ON c.oid = i.indexrelid WHERE c.relname = :name;'
+    )
+    row = _execute(sql, name=index_name).first()
+    if row is None:
+        return None
+
+    return row[0]
+
+
+def _execute_concurrently(sql):
+    #CREATE/DROP INDEX CONCURRENTLY cannot run inside a transaction block
+    conn = STDMDb.instance().engine.connect().execution_options(
+        isolation_level='AUTOCOMMIT'
+    )
+    try:
+        conn.execute(text(sql))
+
+    finally:
+        conn.close()
+
+    refresh_catalog_snapshot()
+
+
+def _create_index(index_name, sql):
+    valid = _index_valid(index_name)
+    if valid:
+        return True
+
+    try:
+        if valid is False:
+            _execute_concurrently(
+                u'DROP INDEX CONCURRENTLY "{0}";'.format(index_name)
+            )
+
+        _execute_concurrently(sql)
+
+        return True
+
+    except SQLAlchemyError as db_error:
+        #Most likely the user does not own the table
+        LOGGER.debug(u'Search index {0} could not be created. {1}'.format(
+            index_name, db_error))
+
+        return False
+
+
+def ensure_search_indexes(table_name, column_name, text_search=True):
+    """
+    Creates the indexes used when searching the column, if they do not
+    exist. Text columns get a B-tree index on the lower case values, which
+    supports exact and prefix matching, and a trigram index for fuzzy
+    matching if pg_trgm is available. Other columns, normally foreign
+    keys, are compared by value and get a plain B-tree index. The indexes
+    are built concurrently so that writes to the table are not blocked,
+    and are checked once per session.
+    :param table_name: Name of the table.
+    :type table_name: str
+    :param column_name: Name of the column.
+    :type column_name: str
+    :param text_search: True if the column values are matched as text.
+    :type text_search: bool
+    """
+    key = (table_name, column_name, text_search)
+    if key in _indexed_columns:
+        return
+
+    _indexed_columns.add(key)
+
+    if not text_search:
+        index_name = search_index_name(table_name, column_name, 'idx')
+        _create_index(
+            index_name,
+            u'CREATE INDEX CONCURRENTLY "{0}" ON "{1}" ("{2}");'.format(
+                index_name, table_name, column_name
+            )
+        )
+
+        return
+
+    expression = u'lower(CAST("{0}" AS TEXT))'.format(column_name)
+
+    index_name = search_index_name(table_name, column_name, 'lower')
+    _create_index(
+        index_name,
+        u'CREATE INDEX CONCURRENTLY "{0}" ON "{1}" '
+        u'({2} text_pattern_ops);'.format(
+            index_name, table_name, expression
+        )
+    )
+
+    if trigram_supported():
+        index_name = search_index_name(table_name, column_name, 'trgm')
+        _create_index(
+            index_name,
+            u'CREATE INDEX CONCURRENTLY "{0}" ON "{1}" '
+            u'USING gin ({2} gin_trgm_ops);'.format(
+                index_name, table_name, expression
+            )
+        )
+
+
+class ColumnTextSearch(object):
+    """
+    Suggests the values of a table column that start with, or are similar
+    to, the text typed by the user. Matching is done in the database using
+    the search indexes hence only the suggested values are transferred.
+    """
+    def __init__(self, table_name, column_name, limit=SUGGESTION_LIMIT):
+        """
+        :param table_name: Name of the table.
+        :type table_name: str
+        :param column_name: Name of the column.
+        :type column_name: str
+        :param limit: Maximum number of suggested values.
+        :type limit: int
+        """
+        self.table_name = table_name
+        self.column_name = column_name
+        self.limit = limit
+
+        self._table = table(table_name, column(column_name))
+        self._column = self._table.c[column_name]
+
+    def ensure_indexes(self):
+        """
+        Creates the search indexes of the column if they do not exist.
+        """
+        ensure_search_indexes(self.table_name, self.column_name)
+
+    def _values(self, mode, term, limit, order_by):
+        query = select([self._column]).where(
+            match_clause(self._column, term, mode)
+        ).group_by(self._column).order_by(order_by).limit(limit)
+
+        return [r[0] for r in _execute(query).fetchall()]
+
+    def suggestions(self, term):
+        """
+        :param term: Text typed by the user.
+        :type term: str
+        :return: Returns the distinct values starting with the term in
+        alphabetical order, followed by similar values ordered by
+        similarity if there are fewer prefix matches than the limit.
+        :rtype: list
+        """
+        if not term:
+            return []
+
+        values = self._values(
+            PREFIX_MATCH,
+            term,
+            self.limit,
+            func.min(folded_value(self._column))
+        )
+
+        remaining = self.limit - len(values)
+        if remaining > 0 and len(term) >= MIN_FUZZY_LENGTH and \
+                trigram_supported():
+            fuzzy_values = self._values(
+                FUZZY_MATCH,
+                term,
+                self.limit,
+                func.max(similarity(self._column, term)).desc()
+            )
+            found = set(values)
+            values.extend(
+                [v for v in fuzzy_values if not v in found][:remaining]
+            )
+
+        return values
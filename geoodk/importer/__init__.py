@@ -1,5 +1,12 @@
-from entity_importer import EntityImporter, Save2DB
+from entity_importer import (
+    BatchEntityImporter,
+    EntityImporter,
+    Save2DB
+)
 from uuid_extractor import InstanceUUIDExtractor
 from geometry_provider import GeometryProvider
 from geometry_provider import STDMGeometry
-from import_log import ImportLogger
+from import_log import (
+    ImportLedger,
+    ImportLogger
+)
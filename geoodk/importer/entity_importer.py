@@ -19,12 +19,21 @@ email                : stdm@unhabitat.org
  ***************************************************************************/
 """
 import os
+import logging
+from itertools import islice
 from PyQt4.QtXml import QDomDocument
 from PyQt4.QtCore import QFile, QIODevice
 from stdm.settings import current_profile
 from stdm.utils.util import entity_attr_to_id, entity_attr_to_model
 from stdm.data.configuration import entity_model
-from stdm.geoodk.importer.geometry_provider import STDMGeometry
+from stdm.data.database import STDMDb
+from stdm.geoodk.importer.geometry_provider import (
+    geometry_sql_value,
+    GeometryBatchBuilder,
+    STDMGeometry
+)
+from stdm.geoodk.importer.value_resolver import LookupValueResolver
+from stdm.geoodk.importer.instance_parser import InstanceParser
 from stdm.data.configuration.columns import GeometryColumn
 from stdm.ui.sourcedocument import SourceDocumentManager
 from PyQt4.QtCore import \
@@ -42,6 +51,11 @@ HOME = QDir.home().path()
 
 CONFIG_FILE = HOME + '/.stdm/geoodk/instances'
 
+#Number of instances imported in one database transaction
+IMPORT_BATCH_SIZE = 100
+
+LOGGER = logging.getLogger('stdm')
+
 class EntityImporter():
     """
     class constructor
@@ -185,19 +199,103 @@ class EntityImporter():
         else:
             return None
 
+class EntityImportPlan(object):
+    """
+    Resolves the database model and column types of an entity once so
+    that they can be reused when importing several instances.
+    """
+    def __init__(self, entity_name, value_resolver=None):
+        """
+        :param entity_name: Name of the entity or 'social_tenure'.
+        :type entity_name: str
+        :param value_resolver: Resolver of lookup, administrative unit and
+        multiple select values shared by the plans in an import run.
+        :type value_resolver: LookupValueResolver
+        """
+        self.value_resolver = value_resolver
+        if entity_name == 'social_tenure':
+            self.entity = current_profile().social_tenure
+        else:
+            self.entity = current_profile().entity_by_name(entity_name)
+
+        self.doc_model = None
+        self.doc_column = None
+
+        if self.entity.supports_documents:
+            self.model_cls, self.doc_model = entity_model(
+                self.entity,
+                with_supporting_document=True
+            )
+            if self.entity.TYPE_INFO == 'SOCIAL_TENURE':
+                self.doc_column = current_profile().social_tenure.supporting_doc
+            else:
+                self.doc_column = self.entity.supporting_doc
+        else:
+            self.model_cls = entity_model(self.entity)
+
+        self.column_types = dict(
+            (c.name, c.TYPE_INFO) for c in self.entity.columns.values()
+        )
+
+        #Referenced tables and columns used to resolve collected values
+        self.value_columns = []
+        for c in self.entity.columns.values():
+            if c.TYPE_INFO == 'LOOKUP':
+                self.value_columns.append(
+                    (c.name, c.parent.name, ['code', 'value'])
+                )
+            elif c.TYPE_INFO == 'ADMIN_SPATIAL_UNIT':
+                self.value_columns.append(
+                    (c.name, c.parent.name, ['code', 'name'])
+                )
+            elif c.TYPE_INFO == 'MULTIPLE_SELECT':
+                self.value_columns.append(
+                    (c.name, c.association.first_parent.name,
+                     ['code', 'value'])
+                )
+
+        #Geometry columns whose values are created in batches
+        self.geometry_columns = [
+            c for c in self.entity.columns.values()
+            if isinstance(c, GeometryColumn)
+        ]
+
+    def prefetch_values(self, attributes_list):
+        """
+        Queries the collected values of the referenced tables in batches.
+        :param attributes_list: Attributes of the entity in several
+        instances.
+        :type attributes_list: list
+        """
+        if self.value_resolver is None:
+            return
+
+        for col_name, table_name, key_columns in self.value_columns:
+            values = [a.get(col_name, None) for a in attributes_list]
+            for key_column in key_columns:
+                self.value_resolver.prefetch(table_name, key_column, values)
+
+
 class Save2DB:
     """
     Class to insert entity data into db
     """
-    def __init__(self, entity, attributes, ids=None):
+    def __init__(self, entity, attributes, ids=None, import_plan=None):
         """
         Initialize class and class variable
+        :param import_plan: Model and column types of the entity, they
+        are resolved from the entity name if not specified.
+        :type import_plan: EntityImportPlan
         """
         self.attributes = attributes
         self.form_entity = entity
         self.doc_model = None
         self._doc_manager =None
-        self.entity = self.object_from_entity_name(self.form_entity)
+        self._plan = import_plan
+        if import_plan is None:
+            self.entity = self.object_from_entity_name(self.form_entity)
+        else:
+            self.entity = import_plan.entity
         self.model = self.dbmodel_from_entity()
         self.key = 0
         self.parents_ids = ids
@@ -234,6 +332,17 @@ class Save2DB:
         Format model attributes from passed entity attributes
         :return:
         """
+        if not self._plan is None:
+            entity_object_model = self._plan.model_cls()
+            self.doc_model = self._plan.doc_model
+            if not self.doc_model is None and \
+                    hasattr(entity_object_model, 'documents'):
+                self._doc_manager = SourceDocumentManager(
+                    self._plan.doc_column, self.doc_model
+                )
+
+            return entity_object_model
+
         if self.entity_has_supporting_docs():
             entity_object, self.doc_model = entity_model(self.entity, with_supporting_document=True)
             entity_object_model = entity_object()
@@ -311,10 +420,10 @@ class Save2DB:
         else:
             return default
 
-    def save_to_db(self):
+    def set_str_parent_ids(self):
         """
-        Format object attribute data from entity and save them into database
-        :return:
+        Sets the party and spatial unit ids of a social tenure
+        relationship record from the ids of the imported parents.
         """
         try:
             if self.parents_ids is not None and self.entity.short_name == 'social_tenure_relationship':
@@ -325,14 +434,33 @@ class Save2DB:
                         self.parents_ids.get(str_tables.spatial_units[0].name)[0])
         except:
             pass
+
+    def set_model_attributes(self):
+        """
+        Format object attribute data from entity and set them in the model
+        without saving it.
+        :return: Model object
+        """
+        column_types = self.column_info()
         for k, v in self.attributes.iteritems():
             if hasattr(self.model, k):
-                col_type = self.column_info().get(k)
+                col_type = column_types.get(k)
                 col_prop = self.entity.columns[k]
                 var = self.attribute_formatter(col_type, col_prop, v)
                 setattr(self.model, k, var)
-        if self.entity_has_supporting_docs():
+        if self.entity_has_supporting_docs() and \
+                not self._doc_manager is None:
             self.model.documents = self._doc_manager.model_objects()
+
+        return self.model
+
+    def save_to_db(self):
+        """
+        Format object attribute data from entity and save them into database
+        :return:
+        """
+        self.set_str_parent_ids()
+        self.set_model_attributes()
         self.model.save()
         return self.model.id
         #self.cleanup()
@@ -343,14 +471,7 @@ class Save2DB:
         attribute
         :return:
         """
-        for k, v in self.attributes.iteritems():
-            if hasattr(self.model, k):
-                col_type = self.column_info().get(k)
-                col_prop = self.entity.columns[k]
-                var = self.attribute_formatter(col_type, col_prop, v)
-                setattr(self.model, k, var)
-        if self.entity_has_supporting_docs():
-            self.model.documents = self._doc_manager.model_objects()
+        self.set_model_attributes()
         self.model.save()
         self.key = self.model.id
         return self.key
@@ -362,6 +483,9 @@ class Save2DB:
 
         :return:
         """
+        if not self._plan is None:
+            return self._plan.column_types
+
         type_mapping = {}
         cols = self.entity.columns.values()
         for c in cols:
@@ -385,6 +509,35 @@ class Save2DB:
         """
         return obj.id
 
+    def _attr_id(self, entity, col_name, var):
+        """
+        Similar to entity_attr_to_id, uses the value resolver of the
+        import plan where available.
+        :return: The id of the record or the value if no record is found.
+        """
+        if self._plan is None or self._plan.value_resolver is None:
+            return entity_attr_to_id(entity, col_name, var)
+
+        rec_id = self._plan.value_resolver.id(entity.name, col_name, var)
+
+        return var if rec_id is None else rec_id
+
+    def _attr_model_id(self, entity, col_name, var):
+        """
+        Returns the id of the record with the given value.
+        :return: The id of the record, raises an error if not found.
+        """
+        if self._plan is None or self._plan.value_resolver is None:
+            return entity_attr_to_model(entity, col_name, var).id
+
+        rec_id = self._plan.value_resolver.id(entity.name, col_name, var)
+        if rec_id is None:
+            raise ValueError(
+                u'"{0}" does not exist in {1}'.format(var, entity.name)
+            )
+
+        return rec_id
+
     def attribute_formatter(self, col_type, col_prop, var):
         """
 
@@ -394,18 +547,18 @@ class Save2DB:
             if var == '' or var is None:
                 return None
             if var == 'Yes' or var =='No':
-                return entity_attr_to_model(col_prop.parent, 'value', var).id
+                return self._attr_model_id(col_prop.parent, 'value', var)
             if not len(var) > 3 and var != 'Yes' and var != 'No':
-                lk_code = entity_attr_to_id(col_prop.parent, "code", var)
+                lk_code = self._attr_id(col_prop.parent, "code", var)
                 if not str(lk_code).isdigit():
                     return None
                 else:
                     return lk_code
             if len(var) > 3:
-                if not str(entity_attr_to_id(col_prop.parent, 'code', var)).isdigit():
-                    return entity_attr_to_model(col_prop.parent, 'value', var).id
+                if not str(self._attr_id(col_prop.parent, 'code', var)).isdigit():
+                    return self._attr_model_id(col_prop.parent, 'value', var)
                 else:
-                    lk_code = entity_attr_to_id(col_prop.parent, "code", var)
+                    lk_code = self._attr_id(col_prop.parent, "code", var)
                     if not str(lk_code).isdigit():
                         return None
                     else:
@@ -414,22 +567,25 @@ class Save2DB:
                 return None
         elif col_type == 'ADMIN_SPATIAL_UNIT':
             if not len(var) > 3:
-                return entity_attr_to_id(col_prop.parent, "code", var)
+                return self._attr_id(col_prop.parent, "code", var)
             else:
-                return entity_attr_to_id(col_prop.parent, "name", var)
+                return self._attr_id(col_prop.parent, "name", var)
 
         elif col_type == 'MULTIPLE_SELECT':
             if var == '' or var is None:
                 return None
             if not len(var) > 3:
-                return entity_attr_to_id(col_prop.association.first_parent, "code", var)
+                return self._attr_id(col_prop.association.first_parent, "code", var)
             elif len(var) > 3:
-                if not str(entity_attr_to_id(col_prop.association.first_parent, "code", var)).isdigit():
-                    return entity_attr_to_model(col_prop.association.first_parent,'value', var).id
+                if not str(self._attr_id(col_prop.association.first_parent, "code", var)).isdigit():
+                    return self._attr_model_id(col_prop.association.first_parent,'value', var)
                 else:
-                    return entity_attr_to_id(col_prop.association.first_parent, "code", var)
+                    return self._attr_id(col_prop.association.first_parent, "code", var)
 
         elif col_type == 'GEOMETRY':
+            #Geometry already created by the batch importer
+            if not isinstance(var, basestring):
+                return var
             defualt_srid = 0
             geom_provider = STDMGeometry(var)
             if isinstance(col_prop, GeometryColumn):
@@ -473,3 +629,260 @@ class Save2DB:
         self._doc_manager = None
 
 
+class BatchEntityImporter(object):
+    """
+    Imports mobile instances in batches. The instance files are parsed in
+    worker processes ahead of the database writes and the records of a
+    batch are saved in a single transaction, each instance within a
+    savepoint so that a failing instance is rolled back without affecting
+    the rest of the batch.
+    """
+    def __init__(self, srid, batch_size=IMPORT_BATCH_SIZE,
+                 parser_processes=None):
+        """
+        :param srid: Coordinate system of the collected geometries.
+        :type srid: int
+        :param batch_size: Number of instances in a transaction.
+        :type batch_size: int
+        :param parser_processes: Number of processes parsing the instance
+        files, defaults to the number of processors.
+        :type parser_processes: int
+        """
+        self.srid = srid
+        self.batch_size = max(1, batch_size)
+        self.parser_processes = parser_processes
+        self._plans = {}
+        self._value_resolver = LookupValueResolver()
+        self._geometry_builders = {}
+
+    def import_plan(self, entity_name):
+        """
+        :param entity_name: Name of the entity or 'social_tenure'.
+        :type entity_name: str
+        :return: Returns the import plan of the entity, which is created
+        on first use.
+        :rtype: EntityImportPlan
+        """
+        if not entity_name in self._plans:
+            self._plans[entity_name] = EntityImportPlan(
+                entity_name,
+                self._value_resolver
+            )
+
+        return self._plans[entity_name]
+
+    def import_instances(self, instances, parent_tables, tables,
+                         import_str=False, feedback=None, ledger=None,
+                         profile=None):
+        """
+        Saves the records in the instances to the database.
+        :param instances: Paths to the instance files.
+        :type instances: list
+        :param parent_tables: Names of the entities that are referenced by
+        other entities, they are saved first.
+        :type parent_tables: list
+        :param tables: Names of the other entities to import.
+        :type tables: list
+        :param import_str: True to save the social tenure relationship.
+        :type import_str: bool
+        :param feedback: Function called after each instance has been
+        processed with the instance number, path, status and error message.
+        :type feedback: function
+        :param ledger: Register of the imported instances. Instances in the
+        ledger are skipped and the imported ones are added to it so that
+        the import can be run again.
+        :type ledger: ImportLedger
+        :param profile: Name of the profile recorded in the ledger.
+        :type profile: str
+        :return: Number of instances imported and a list of the paths of
+        the instances that failed with the error message.
+        :rtype: tuple
+        """
+        global GEOMPARAM
+        GEOMPARAM = self.srid
+
+        tables = [t for t in tables if not t in parent_tables]
+        entities = list(parent_tables) + tables
+
+        #Resolve the models before the first transaction
+        for entity_name in entities:
+            self.import_plan(entity_name)
+        if import_str:
+            self.import_plan('social_tenure')
+
+        session = STDMDb.instance().session
+        num_imported = 0
+        failures = []
+        counter = 0
+
+        pending = list(instances)
+        if not ledger is None:
+            imported = ledger.imported_instances(pending)
+            for path in [p for p in pending if p in imported]:
+                counter += 1
+                if not feedback is None:
+                    feedback(counter, path, True,
+                             'Instance has already been imported')
+            pending = [p for p in pending if not p in imported]
+
+        #Instances are parsed in the worker processes while the batches
+        #are being saved
+        parser = InstanceParser(self.parser_processes)
+        try:
+            parsed_iter = parser.parse(pending, entities, import_str)
+
+            while True:
+                parsed_instances = list(islice(parsed_iter, self.batch_size))
+                if len(parsed_instances) == 0:
+                    break
+
+                valid_instances = []
+                for parsed in parsed_instances:
+                    if parsed.is_valid:
+                        valid_instances.append(parsed)
+
+                        continue
+
+                    counter += 1
+                    failures.append((parsed.path, parsed.error))
+                    if not feedback is None:
+                        feedback(counter, parsed.path, False, parsed.error)
+
+                self._prefetch_values(valid_instances, entities)
+                self._build_geometries(valid_instances, entities)
+                imported_records = []
+
+                try:
+                    for parsed in valid_instances:
+                        counter += 1
+                        savepoint = session.begin_nested()
+                        try:
+                            records = self._import_instance(
+                                session, parsed, parent_tables, tables
+                            )
+                            savepoint.commit()
+
+                        except Exception as ex:
+                            savepoint.rollback()
+                            LOGGER.debug(u'Import of {0} failed: {1}'.format(
+                                parsed.path, unicode(ex)
+                            ))
+                            failures.append((parsed.path, unicode(ex)))
+                            if not feedback is None:
+                                feedback(counter, parsed.path, False,
+                                         unicode(ex))
+
+                            continue
+
+                        num_imported += 1
+                        imported_records.append((parsed.path, records))
+                        if not feedback is None:
+                            feedback(counter, parsed.path, True, '')
+
+                    session.commit()
+
+                except Exception:
+                    session.rollback()
+                    raise
+
+                if not ledger is None:
+                    ledger.add_instances(imported_records, profile)
+
+        finally:
+            parser.close()
+
+        return num_imported, failures
+
+    def _prefetch_values(self, parsed_instances, entities):
+        #Resolve the values that have not been preloaded for the batch
+        for entity_name in entities:
+            self.import_plan(entity_name).prefetch_values(
+                [p.attributes[entity_name] for p in parsed_instances]
+            )
+
+        str_attributes = [
+            p.str_attributes for p in parsed_instances if p.str_attributes
+        ]
+        if len(str_attributes) > 0:
+            self.import_plan('social_tenure').prefetch_values(str_attributes)
+
+    def _build_geometries(self, parsed_instances, entities):
+        """
+        Creates the geometries of the instances in the batch column by
+        column. Values that are not valid are left as they are and
+        processed by Save2DB.
+        """
+        for entity_name in entities:
+            plan = self.import_plan(entity_name)
+            for col in plan.geometry_columns:
+                srid = col.srid if col.srid != 0 else GEOMPARAM
+                if not srid in self._geometry_builders:
+                    self._geometry_builders[srid] = GeometryBatchBuilder(srid)
+
+                attributes = [
+                    p.attributes[entity_name] for p in parsed_instances
+                    if col.name in p.attributes[entity_name]
+                ]
+                if len(attributes) == 0:
+                    continue
+
+                try:
+                    results = self._geometry_builders[srid].build(
+                        [a[col.name] for a in attributes],
+                        col.geometry_type()
+                    )
+
+                except ValueError:
+                    #Geometry type not supported by the builder
+                    continue
+
+                for attrs, (ewkb, error) in zip(attributes, results):
+                    if not ewkb is None:
+                        attrs[col.name] = geometry_sql_value(ewkb)
+
+    def _save_record(self, session, entity_name, attributes, instance_path,
+                     records, parent_ids=None):
+        record = Save2DB(entity_name, attributes, parent_ids,
+                         self.import_plan(entity_name))
+        record.get_srid(self.srid)
+        record.objects_from_supporting_doc(instance_path)
+        record.set_str_parent_ids()
+        model = record.set_model_attributes()
+
+        session.add(model)
+
+        #Flush to get the id referenced by the records that follow
+        session.flush()
+        records.append((self.import_plan(entity_name).entity.name, model.id))
+
+        return model.id
+
+    def _import_instance(self, session, parsed, parent_tables, tables):
+        global GROUPCODE
+        if parsed.group_id:
+            GROUPCODE = parsed.group_id
+
+        parent_ids = {}
+        records = []
+        for parent_table in parent_tables:
+            ref_id = self._save_record(session, parent_table,
+                                       parsed.attributes[parent_table],
+                                       parsed.path, records)
+            if parsed.group_id:
+                parent_ids[parent_table] = [ref_id, parsed.group_id]
+            else:
+                parent_ids[parent_table] = [ref_id, parent_table]
+
+        for table in tables:
+            table_id = self._save_record(session, table,
+                                         parsed.attributes[table],
+                                         parsed.path, records, parent_ids)
+            if not table in parent_ids:
+                parent_ids[table] = [table_id, parsed.group_id]
+
+        if parsed.str_attributes:
+            self._save_record(session, 'social_tenure',
+                              parsed.str_attributes, parsed.path,
+                              records, parent_ids)
+
+        return records
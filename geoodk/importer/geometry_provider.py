@@ -19,6 +19,11 @@ email                : stdm@unhabitat.org
  *                                                                         *
  ***************************************************************************/
 """
+import struct
+
+import numpy as np
+
+from osgeo import osr
 
 from qgis.core import (
     QgsGeometry,
@@ -27,6 +32,33 @@ from qgis.core import (
     QgsCoordinateTransform
 )
 
+from sqlalchemy import (
+    func,
+    LargeBinary,
+    literal
+)
+
+#Coordinate system of the coordinates collected by the mobile devices
+DEFAULT_SRID = 4326
+
+#Number of decimal places retained in the collected coordinates
+COORDINATE_PRECISION = 6
+
+#WKB geometry type codes and the flag for the SRID in EWKB
+WKB_TYPES = {
+    'POINT': 1,
+    'LINESTRING': 2,
+    'POLYGON': 3
+}
+EWKB_SRID_FLAG = 0x20000000
+
+#Minimum number of points of each geometry type, polygon rings included
+MIN_POINTS = {
+    'POINT': 1,
+    'LINESTRING': 2,
+    'POLYGON': 4
+}
+
 class GeometryProvider:
     """
     Class constructor
@@ -223,5 +255,212 @@ class STDMGeometry(GeometryProvider):
         return 'SRID={};{}'.format(self.srid, point_wkt)
 
 
+def odk_coordinates(value):
+    """
+    Reads the coordinates in an ODK geopoint, geotrace or geoshape value,
+    which contains points separated by semi-colons, each with the latitude,
+    longitude, altitude and accuracy.
+    :param value: Collected value.
+    :type value: str
+    :return: Returns an array of the longitude and latitude of each point.
+    :rtype: numpy.ndarray
+    """
+    points = [p for p in value.split(';') if p.strip()]
+    if len(points) == 0:
+        raise ValueError('No coordinates in the geometry value')
+
+    point_values = [p.split() for p in points]
+
+    #Points normally have the same number of values so the coordinates are
+    #converted in one go
+    if len(set([len(v) for v in point_values])) == 1:
+        coords = np.array(point_values, dtype=float)
+
+    else:
+        coords = np.array([v[:2] for v in point_values], dtype=float)
+
+    if coords.ndim != 2 or coords.shape[1] < 2:
+        raise ValueError('Incomplete coordinates in the geometry value')
+
+    return coords[:, 1::-1]
+
+
+def geometry_sql_value(ewkb):
+    """
+    :param ewkb: Geometry in EWKB format.
+    :type ewkb: str
+    :return: Returns an SQL expression that creates the geometry from
+    the EWKB, which can be assigned to a geometry attribute of a model.
+    """
+    return func.ST_GeomFromEWKB(literal(ewkb, LargeBinary))
+
+
+class GeometryBatchBuilder(object):
+    """
+    Converts a column of ODK geometry values to EWKB. The coordinates of
+    all the values are held in a single array so that they are rounded,
+    validated and transformed to the destination coordinate system in one
+    pass.
+    """
+    def __init__(self, srid=DEFAULT_SRID, source_srid=DEFAULT_SRID):
+        """
+        :param srid: Coordinate system of the geometries to be created.
+        :type srid: int
+        :param source_srid: Coordinate system of the collected coordinates.
+        :type source_srid: int
+        """
+        self.srid = int(srid)
+        self.source_srid = int(source_srid)
+
+    @staticmethod
+    def _spatial_reference(srid):
+        sp_ref = osr.SpatialReference()
+        sp_ref.ImportFromEPSG(srid)
+
+        #Keep the X, Y (longitude, latitude) order used by the coordinates
+        if hasattr(sp_ref, 'SetAxisMappingStrategy'):
+            sp_ref.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+
+        return sp_ref
+
+    def _coordinate_transform(self):
+        return osr.CoordinateTransformation(
+            self._spatial_reference(self.source_srid),
+            self._spatial_reference(self.srid)
+        )
+
+    def transform(self, coords):
+        """
+        Transforms the coordinates to the destination coordinate system.
+        Coordinates that cannot be transformed are set to NaN.
+        :param coords: Array of X and Y coordinates.
+        :type coords: numpy.ndarray
+        :return: Returns the transformed coordinates.
+        :rtype: numpy.ndarray
+        """
+        if self.srid == self.source_srid or len(coords) == 0:
+            return coords
+
+        crs_transform = self._coordinate_transform()
+        points = coords[:, :2].tolist()
+
+        #All the coordinates are transformed in a single call
+        try:
+            transformed = crs_transform.TransformPoints(points)
+
+        except RuntimeError:
+            #The batch fails as a whole, find the points that cannot be
+            #transformed
+            transformed = []
+            for x, y in points:
+                try:
+                    transformed.append(crs_transform.TransformPoint(x, y))
+
+                except RuntimeError:
+                    transformed.append((np.nan, np.nan, np.nan))
+
+        transformed = np.array(transformed, dtype=float)[:, :2]
+
+        #Points that could not be transformed are returned as HUGE_VAL
+        transformed[~(np.abs(transformed) < 1e300)] = np.nan
+
+        return transformed
+
+    def build(self, values, geometry_type):
+        """
+        Creates the geometries from the collected values.
+        :param values: ODK geometry values.
+        :type values: list
+        :param geometry_type: POINT, LINESTRING or POLYGON.
+        :type geometry_type: str
+        :return: Returns a list with the EWKB of each value and the
+        reason why the geometry could not be created, the EWKB is None if
+        the value is not valid.
+        :rtype: list
+        """
+        geometry_type = geometry_type.upper()
+        if not geometry_type in WKB_TYPES:
+            raise ValueError(
+                '{0} geometries are not supported'.format(geometry_type)
+            )
+
+        results = [(None, None)] * len(values)
+
+        #Parse the values and note the position of each in the batch
+        arrays = []
+        indexes = []
+        for i, value in enumerate(values):
+            try:
+                coords = odk_coordinates(value or '')
+
+            except (AttributeError, ValueError) as err:
+                results[i] = (None, unicode(err))
+
+                continue
+
+            #Only the first point of a geopoint is used
+            if geometry_type == 'POINT':
+                coords = coords[:1]
+
+            arrays.append(coords)
+            indexes.append(i)
+
+        if len(arrays) == 0:
+            return results
+
+        counts = np.array([len(a) for a in arrays])
+        ends = np.cumsum(counts)
+        starts = ends - counts
+
+        coords = np.round(np.concatenate(arrays), COORDINATE_PRECISION)
+
+        #Validate the geographic coordinates of all the values at once
+        invalid = ~(np.isfinite(coords).all(axis=1) &
+                    (np.abs(coords[:, 0]) <= 180) &
+                    (np.abs(coords[:, 1]) <= 90))
+        invalid_geoms = np.add.reduceat(invalid.astype(int), starts) > 0
+
+        #Rings whose first and last points differ are closed
+        open_rings = (coords[starts] != coords[ends - 1]).any(axis=1)
+
+        coords = self.transform(coords)
+        untransformed = np.add.reduceat(
+            (~np.isfinite(coords).all(axis=1)).astype(int),
+            starts
+        ) > 0
+
+        header = struct.pack('<BII', 1, WKB_TYPES[geometry_type] |
+                             EWKB_SRID_FLAG, self.srid)
+
+        for k, i in enumerate(indexes):
+            if invalid_geoms[k]:
+                results[i] = (None, 'Coordinates are out of range')
+
+                continue
+
+            if untransformed[k]:
+                results[i] = (None, 'Coordinates could not be transformed')
+
+                continue
+
+            points = coords[starts[k]:ends[k]]
+            if geometry_type == 'POLYGON' and open_rings[k]:
+                points = np.vstack((points, points[:1]))
+
+            if len(points) < MIN_POINTS[geometry_type]:
+                results[i] = (None, 'Not enough points for a {0}'.format(
+                    geometry_type.lower()
+                ))
+
+                continue
+
+            body = points.astype('<f8').tostring()
+            if geometry_type == 'LINESTRING':
+                body = struct.pack('<I', len(points)) + body
+
+            elif geometry_type == 'POLYGON':
+                body = struct.pack('<II', 1, len(points)) + body
 
+            results[i] = (header + body, None)
 
+        return results
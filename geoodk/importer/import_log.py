@@ -20,13 +20,23 @@ email                : stdm@unhabitat.org
  ***************************************************************************/
 """
 import ConfigParser
+import hashlib
 import os
+import re
+import sqlite3
+from datetime import datetime
 from PyQt4.QtCore import QDir
 
 HOME = QDir.home().path()
 
 LOGGER_HOME = HOME + '/.stdm/geoodk'
 IMPORT_SECTION = 'imports'
+LEDGER_FILE = 'import_ledger.sqlite'
+
+#Maximum number of parameters in an IN clause
+LEDGER_QUERY_BATCH_SIZE = 500
+
+INSTANCE_ID_REGEX = re.compile(r'<instanceID>\s*([^<]+?)\s*</instanceID>')
 
 class ImportLogger:
     """
@@ -151,3 +161,195 @@ class ImportLogger:
 
 
 
+
+
+class ImportLedger(object):
+    """
+    Local SQLite register of the imported mobile instances. Instances are
+    identified by the instance UUID and a hash of the file content so that
+    renamed or copied files are not imported again. The ids of the records
+    created from each instance are also kept.
+    """
+    def __init__(self, path=None):
+        """
+        :param path: Path to the ledger database, defaults to a file in
+        the GeoODK directory.
+        :type path: str
+        """
+        if path is None:
+            if not os.access(LOGGER_HOME, os.F_OK):
+                os.makedirs(unicode(LOGGER_HOME))
+            path = os.path.join(LOGGER_HOME, LEDGER_FILE)
+
+        self._conn = sqlite3.connect(path)
+        self._keys = {}
+        self._create_tables()
+
+    def _create_tables(self):
+        with self._conn:
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS imported_instance (
+                    id INTEGER PRIMARY KEY,
+                    uuid TEXT,
+                    content_hash TEXT NOT NULL,
+                    file_name TEXT,
+                    profile TEXT,
+                    imported_on TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_imported_instance_uuid
+                    ON imported_instance (uuid);
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_imported_instance_hash
+                    ON imported_instance (content_hash);
+                CREATE TABLE IF NOT EXISTS imported_record (
+                    instance_id INTEGER NOT NULL
+                        REFERENCES imported_instance (id) ON DELETE CASCADE,
+                    table_name TEXT NOT NULL,
+                    record_id INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS idx_imported_record_instance
+                    ON imported_record (instance_id);
+                """
+            )
+
+    def close(self):
+        """
+        Closes the connection to the ledger database.
+        """
+        self._conn.close()
+
+    def instance_key(self, path):
+        """
+        :param path: Path to the instance file.
+        :type path: str
+        :return: Returns the instance UUID and the SHA-1 hash of the file
+        content. The UUID is None if the instance does not have one and
+        both are None if the file cannot be read.
+        :rtype: tuple
+        """
+        if path in self._keys:
+            return self._keys[path]
+
+        try:
+            with open(path, 'rb') as f:
+                content = f.read()
+
+        except IOError:
+            return None, None
+
+        match = INSTANCE_ID_REGEX.search(content)
+        uuid = match.group(1).decode('utf-8') if match else None
+        key = (uuid, hashlib.sha1(content).hexdigest())
+        self._keys[path] = key
+
+        return key
+
+    def _existing_values(self, column, values):
+        #Returns the values that are in the given column of the ledger
+        existing = set()
+        values = list(values)
+        for i in range(0, len(values), LEDGER_QUERY_BATCH_SIZE):
+            batch = values[i:i + LEDGER_QUERY_BATCH_SIZE]
+            sql = 'SELECT {0} FROM imported_instance WHERE {0} IN ({1})'.\
+                format(column, ','.join('?' * len(batch)))
+            existing.update([r[0] for r in self._conn.execute(sql, batch)])
+
+        return existing
+
+    def imported_instances(self, paths):
+        """
+        :param paths: Paths to instance files.
+        :type paths: list
+        :return: Returns the paths of the instances that have already been
+        imported.
+        :rtype: set
+        """
+        keys = dict((p, self.instance_key(p)) for p in paths)
+        uuids = self._existing_values(
+            'uuid',
+            set([k[0] for k in keys.values() if k[0]])
+        )
+        hashes = self._existing_values(
+            'content_hash',
+            set([k[1] for k in keys.values() if k[1]])
+        )
+
+        return set([
+            p for p, k in keys.iteritems()
+            if (k[0] and k[0] in uuids) or (k[1] and k[1] in hashes)
+        ])
+
+    def add_instances(self, instances, profile=None):
+        """
+        Registers imported instances in a single transaction.
+        :param instances: Tuples of the instance path and a list of
+        (table name, record id) of the records created from the instance.
+        :type instances: list
+        :param profile: Name of the profile the instances were imported to.
+        :type profile: str
+        """
+        imported_on = datetime.now().isoformat()
+
+        with self._conn:
+            for path, records in instances:
+                uuid, content_hash = self.instance_key(path)
+                if content_hash is None:
+                    continue
+
+                cursor = self._conn.execute(
+                    'INSERT OR IGNORE INTO imported_instance (uuid, '
+                    'content_hash, file_name, profile, imported_on) '
+                    'VALUES (?, ?, ?, ?, ?)',
+                    (uuid, content_hash, os.path.basename(path), profile,
+                     imported_on)
+                )
+                if cursor.rowcount == 0:
+                    continue
+
+                self._conn.executemany(
+                    'INSERT INTO imported_record (instance_id, table_name, '
+                    'record_id) VALUES (?, ?, ?)',
+                    [(cursor.lastrowid, t, r) for t, r in records]
+                )
+
+    def records(self, path):
+        """
+        :param path: Path to an imported instance file.
+        :type path: str
+        :return: Returns the table names and ids of the records created
+        from the instance.
+        :rtype: list
+        """
+        uuid, content_hash = self.instance_key(path)
+
+        return [tuple(r) for r in self._conn.execute(
+            'SELECT r.table_name, r.record_id FROM imported_record r '
+            'JOIN imported_instance i ON i.id = r.instance_id '
+            'WHERE i.content_hash = ? OR (i.uuid IS NOT NULL AND i.uuid = ?)',
+            (content_hash, uuid)
+        )]
+
+    def remove_instances(self, paths):
+        """
+        Removes instances from the ledger so that they can be imported
+        again.
+        :param paths: Paths to instance files.
+        :type paths: list
+        """
+        with self._conn:
+            for path in paths:
+                uuid, content_hash = self.instance_key(path)
+                ids = [r[0] for r in self._conn.execute(
+                    'SELECT id FROM imported_instance WHERE content_hash = ? '
+                    'OR (uuid IS NOT NULL AND uuid = ?)',
+                    (content_hash, uuid)
+                )]
+                for instance_id in ids:
+                    self._conn.execute(
+                        'DELETE FROM imported_record WHERE instance_id = ?',
+                        (instance_id,)
+                    )
+                    self._conn.execute(
+                        'DELETE FROM imported_instance WHERE id = ?',
+                        (instance_id,)
+                    )
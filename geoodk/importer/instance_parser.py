@@ -0,0 +1,225 @@
+"""
+/***************************************************************************
+Name                 : InstanceParser
+Description          : Parses and validates mobile instance files in a pool
+                       of worker processes
+
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import imp
+import logging
+import multiprocessing
+import os
+import sys
+from itertools import imap
+
+from stdm.geoodk.importer import instance_reader
+from stdm.geoodk.importer.instance_reader import (
+    instance_uuid,
+    parse_instance
+)
+
+LOGGER = logging.getLogger('stdm')
+
+#Number of instance files sent to a worker at a time
+PARSE_CHUNK_SIZE = 20
+
+#Seconds to wait for the next parsed file before parsing in-process
+PARSE_TIMEOUT = 60
+
+#Name of the reader module loaded by the worker processes. It is loaded
+#from its file so that the workers do not import the plugin package.
+WORKER_READER_MODULE = 'stdm_geoodk_instance_reader'
+
+
+def _reader_source_path():
+    #Source file of the reader module, the workers compile it if required
+    return u'{0}.py'.format(os.path.splitext(instance_reader.__file__)[0])
+
+
+def _worker_reader():
+    """
+    :return: Returns the reader module loaded under the name used by the
+    worker processes so that its functions are pickled by that name.
+    :rtype: module
+    """
+    reader = sys.modules.get(WORKER_READER_MODULE, None)
+    if reader is None:
+        reader = imp.load_source(WORKER_READER_MODULE, _reader_source_path())
+
+    return reader
+
+
+class ParsedInstance(object):
+    """
+    Data read from a mobile instance file.
+    """
+    __slots__ = ('path', 'group_id', 'attributes', 'str_attributes', 'uuid',
+                 'error')
+
+    def __init__(self, path, group_id, attributes, str_attributes=None,
+                 uuid=None, error=None):
+        """
+        :param path: Path to the instance file.
+        :type path: str
+        :param group_id: Group identifier of related records.
+        :type group_id: str
+        :param attributes: Collected values indexed by entity name and
+        field name.
+        :type attributes: dict
+        :param str_attributes: Social tenure values or None if the social
+        tenure relationship was not captured.
+        :type str_attributes: dict
+        :param uuid: Instance identifier.
+        :type uuid: str
+        :param error: Reason why the instance is not valid, None if valid.
+        :type error: str
+        """
+        self.path = path
+        self.group_id = group_id
+        self.attributes = attributes
+        self.str_attributes = str_attributes
+        self.uuid = uuid
+        self.error = error
+
+    @property
+    def is_valid(self):
+        """
+        :return: True if the instance could be parsed.
+        :rtype: bool
+        """
+        return self.error is None
+
+
+def _parsed_instance(result):
+    path, uuid, group_id, attributes, str_attributes, error = result
+
+    return ParsedInstance(path, group_id or None, attributes, str_attributes,
+                          uuid, error)
+
+
+class InstanceParser(object):
+    """
+    Parses instance files in a pool of worker processes so that parsing
+    runs in parallel with the database writes in the importing process.
+    The workers only load the reader module, which uses the standard
+    library. Files are parsed in-process if the pool cannot be started or
+    stops returning results.
+    """
+    def __init__(self, processes=None):
+        """
+        :param processes: Number of worker processes, defaults to the
+        number of processors. Files are parsed in-process if 1.
+        :type processes: int
+        """
+        if processes is None:
+            try:
+                processes = multiprocessing.cpu_count()
+
+            except NotImplementedError:
+                processes = 1
+
+        self._processes = max(1, processes)
+        self._pool = None
+
+    def _start_pool(self):
+        if self._pool is None and self._processes > 1:
+            #The QGIS executable cannot be used to start the workers
+            if sys.platform.startswith('win'):
+                multiprocessing.set_executable(
+                    os.path.join(sys.exec_prefix, 'pythonw.exe')
+                )
+
+            try:
+                #The initializer is pickled by reference, unlike the
+                #functions of a module imported through the plugin package
+                self._pool = multiprocessing.Pool(
+                    self._processes,
+                    imp.load_source,
+                    (WORKER_READER_MODULE, _reader_source_path())
+                )
+
+            except (OSError, ValueError, ImportError) as err:
+                LOGGER.debug(u'Instance parser pool could not be started, '
+                             u'parsing in-process. {0}'.format(err))
+                self._processes = 1
+
+        return self._pool
+
+    def parse(self, paths, entities, include_str=False):
+        """
+        Parses the instance files. Parsing in the worker processes starts
+        immediately and the results are returned in the order of the paths
+        as they become available.
+        :param paths: Paths to the instance files.
+        :type paths: list
+        :param entities: Names of the entities to read.
+        :type entities: list
+        :param include_str: True to read the social tenure values.
+        :type include_str: bool
+        :return: Returns an iterator of ParsedInstance objects.
+        :rtype: iterator
+        """
+        tasks = [(p, list(entities), include_str) for p in paths]
+
+        pool = self._start_pool()
+        if pool is None:
+            results = imap(parse_instance, tasks)
+
+        else:
+            results = self._pool_results(pool, tasks)
+
+        return imap(_parsed_instance, results)
+
+    def _pool_results(self, pool, tasks):
+        """
+        Yields the results of the worker processes. If a chunk is not
+        returned within the timeout e.g. the workers cannot start, the pool
+        is stopped and the remaining files are parsed in-process.
+        """
+        #Chunks are sent explicitly since the iterator returned for a
+        #chunk size greater than one does not support a timeout
+        chunks = [tasks[i:i + PARSE_CHUNK_SIZE]
+                  for i in range(0, len(tasks), PARSE_CHUNK_SIZE)]
+        results = pool.imap(_worker_reader().parse_instances, chunks)
+
+        for i, chunk in enumerate(chunks):
+            try:
+                chunk_results = results.next(PARSE_TIMEOUT)
+
+            except multiprocessing.TimeoutError:
+                LOGGER.debug(u'Instance parser workers did not respond, '
+                             u'parsing the remaining files in-process.')
+                self.close()
+                self._processes = 1
+
+                for remaining_chunk in chunks[i:]:
+                    for remaining_task in remaining_chunk:
+                        yield parse_instance(remaining_task)
+
+                return
+
+            for result in chunk_results:
+                yield result
+
+    def close(self):
+        """
+        Stops the worker processes.
+        """
+        if not self._pool is None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
@@ -0,0 +1,144 @@
+"""
+/***************************************************************************
+Name                 : Instance reader
+Description          : Reads the values in mobile instance files. Only uses
+                       the standard library so that the worker processes
+                       parsing the files do not import the plugin, PyQt4 or
+                       QGIS.
+
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import logging
+
+try:
+    from xml.etree import cElementTree as ElementTree
+
+except ImportError:
+    from xml.etree import ElementTree
+
+LOGGER = logging.getLogger('stdm')
+
+STR_ELEMENT = 'social_tenure'
+GROUP_ELEMENT = 'identity'
+META_ELEMENT = 'meta'
+
+
+def _local_name(tag):
+    #Removes the namespace from the element tag
+    return tag.rsplit('}', 1)[-1]
+
+
+def _element_text(element):
+    #Similar to QDomElement.text, which includes the text of descendants
+    return u''.join(element.itertext()).rstrip()
+
+
+def _element_attributes(element):
+    attributes = {}
+    for child in element:
+        attributes[_local_name(child.tag)] = _element_text(child)
+
+    return attributes
+
+
+def parse_instance(task):
+    """
+    Reads the values of the given entities from an instance file using a
+    streaming parser. Runs in the worker processes hence only plain Python
+    structures are returned.
+    :param task: Path to the instance file, names of the entities to read
+    and whether to read the social tenure values.
+    :type task: tuple
+    :return: Path, UUID, group identifier, entity attributes, social
+    tenure attributes and error message.
+    :rtype: tuple
+    """
+    path, entities, include_str = task
+    wanted = set(entities)
+    if include_str:
+        wanted.add(STR_ELEMENT)
+
+    attributes = {}
+    uuid = None
+    group_id = None
+
+    #Only the first element of each entity is read
+    depth = 0
+    try:
+        for event, element in ElementTree.iterparse(path,
+                                                    events=('start', 'end')):
+            if event == 'start':
+                depth += 1
+
+                continue
+
+            depth -= 1
+            name = _local_name(element.tag)
+
+            if name in wanted and not name in attributes:
+                attributes[name] = _element_attributes(element)
+
+            elif name == GROUP_ELEMENT and group_id is None:
+                group_id = _element_text(element)
+
+            elif name == META_ELEMENT and uuid is None and len(element) > 0:
+                uuid = _element_text(element[0])
+
+            #Release the children of the root once they have been read
+            if depth <= 1:
+                element.clear()
+
+    except (IOError, SyntaxError) as err:
+        return path, None, None, {}, None, unicode(err)
+
+    #Entities that were not captured have no values
+    for entity in entities:
+        attributes.setdefault(entity, {})
+
+    str_attributes = attributes.pop(STR_ELEMENT, None) if include_str \
+        else None
+
+    return path, uuid, group_id, attributes, str_attributes, None
+
+
+def parse_instances(tasks):
+    """
+    Parses a chunk of instance files, see parse_instance.
+    :param tasks: Parse tasks of the instance files.
+    :type tasks: list
+    :return: Returns the parse results in the order of the tasks.
+    :rtype: list
+    """
+    return [parse_instance(t) for t in tasks]
+
+
+def instance_uuid(path):
+    """
+    :param path: Path to the instance file.
+    :type path: str
+    :return: Returns the text of the first element in the meta element,
+    which contains the instance UUID, or None if not found.
+    :rtype: str
+    """
+    try:
+        for event, element in ElementTree.iterparse(path):
+            if _local_name(element.tag) == META_ELEMENT and len(element) > 0:
+                return _element_text(element[0])
+
+    except (IOError, SyntaxError) as err:
+        LOGGER.debug(u'Could not read {0}: {1}'.format(path, err))
+
+    return None
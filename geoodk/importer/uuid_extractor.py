@@ -26,6 +26,7 @@ from PyQt4.QtXml import (
     QDomNode
 )
 from stdm.geoodk import GeoODKReader
+from stdm.geoodk.importer.instance_parser import instance_uuid
 UUID = "uuid"
 
 class InstanceUUIDExtractor():
@@ -65,10 +66,12 @@ class InstanceUUIDExtractor():
         :return:
         """
         try:
-            self.set_document()
-            self.read_uuid_element()
-            self.doc.clear()
-            self.file.close()
+            #Only the meta element is read, the document is not loaded
+            uuid = instance_uuid(self.file_path)
+            if uuid is None:
+                return
+            self.node = uuid
+            self.file = QFile(self.file_path)
             self.rename_file()
         except:
             pass
@@ -0,0 +1,163 @@
+"""
+/***************************************************************************
+Name                 : LookupValueResolver
+Description          : Resolves the ids of lookup, administrative unit and
+                       multiple select values collected in mobile instances
+
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+from sqlalchemy import (
+    cast,
+    func,
+    Text
+)
+from sqlalchemy.sql import (
+    column,
+    select,
+    table
+)
+
+from stdm.data.pg_utils import _execute
+
+#Maximum number of records loaded up front from a table
+MAX_PRELOAD_RECORDS = 50000
+
+#Maximum number of values in the IN clause when querying unseen values
+QUERY_BATCH_SIZE = 500
+
+
+def fold_value(value):
+    """
+    :param value: Collected or stored value.
+    :type value: object
+    :return: Returns the case-folded value used as the dictionary key.
+    :rtype: unicode
+    """
+    return unicode(value).strip().lower()
+
+
+class _ColumnValues(object):
+    """
+    Ids of the records in a table indexed by the folded values of a
+    column.
+    """
+    def __init__(self, table_name, column_name):
+        self._table = table(table_name, column('id'), column(column_name))
+        self._column = self._table.c[column_name]
+        self.ids = {}
+
+        #Folded values that were queried and do not exist
+        self.missing = set()
+
+        query = select([self._table.c.id, self._column]).order_by(
+            self._table.c.id
+        ).limit(MAX_PRELOAD_RECORDS + 1)
+        rows = _execute(query).fetchall()
+
+        self.complete = len(rows) <= MAX_PRELOAD_RECORDS
+        self._add(rows[:MAX_PRELOAD_RECORDS])
+
+    def _add(self, rows):
+        for rec_id, value in rows:
+            if value is None:
+                continue
+
+            #Keep the lowest id if the folded values are not unique
+            key = fold_value(value)
+            if not key in self.ids:
+                self.ids[key] = rec_id
+
+    def query(self, keys):
+        """
+        Fetches the ids of the given folded values from the database.
+        :param keys: Folded values not in the dictionary.
+        :type keys: list
+        """
+        for i in range(0, len(keys), QUERY_BATCH_SIZE):
+            batch = keys[i:i + QUERY_BATCH_SIZE]
+            folded_col = func.lower(func.trim(cast(self._column, Text)))
+            query = select([self._table.c.id, self._column]).where(
+                folded_col.in_(batch)
+            ).order_by(self._table.c.id)
+
+            self._add(_execute(query).fetchall())
+
+        self.missing.update([k for k in keys if not k in self.ids])
+
+
+class LookupValueResolver(object):
+    """
+    Resolves collected values to record ids using dictionaries of the
+    values in the referenced tables. Each table column is loaded once and
+    the resolver is shared by all the instances in an import run. Values
+    that have not been loaded are queried in batches.
+    """
+    def __init__(self):
+        self._columns = {}
+
+    def _column_values(self, table_name, column_name):
+        key = (table_name, column_name)
+        if not key in self._columns:
+            self._columns[key] = _ColumnValues(table_name, column_name)
+
+        return self._columns[key]
+
+    def prefetch(self, table_name, column_name, values):
+        """
+        Queries the values that have not been loaded in one go. Only
+        applies to tables with more records than can be preloaded.
+        :param table_name: Name of the referenced table.
+        :type table_name: str
+        :param column_name: Name of the column containing the values.
+        :type column_name: str
+        :param values: Collected values.
+        :type values: list
+        """
+        col_values = self._column_values(table_name, column_name)
+        if col_values.complete:
+            return
+
+        keys = set([fold_value(v) for v in values if v not in (None, '')])
+        unseen = [
+            k for k in keys
+            if not k in col_values.ids and not k in col_values.missing
+        ]
+        if len(unseen) > 0:
+            col_values.query(unseen)
+
+    def id(self, table_name, column_name, value):
+        """
+        :param table_name: Name of the referenced table.
+        :type table_name: str
+        :param column_name: Name of the column containing the value.
+        :type column_name: str
+        :param value: Collected value, matched without regard to case.
+        :type value: str
+        :return: Returns the id of the record with the given value or
+        None if it does not exist.
+        :rtype: int
+        """
+        if value is None:
+            return None
+
+        col_values = self._column_values(table_name, column_name)
+        key = fold_value(value)
+
+        if not key in col_values.ids and not col_values.complete and \
+                not key in col_values.missing:
+            col_values.query([key])
+
+        return col_values.ids.get(key, None)
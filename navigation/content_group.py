@@ -135,52 +135,33 @@ class ContentGroup(QObject,HashableMixin):
     def register(self):
         """
         Registers the content items into the database. Registration only works for a 
-        postgres user account.
+        postgres user account, other accounts only get the codes of the
+        registered items. Items are looked up in the authorization snapshot
+        and the missing ones are added in one statement.
         """
-        PG_ACCOUNT = "postgres"   
-        
-        if self._username == PG_ACCOUNT:
-            for c in self.contentItems():
-                if isinstance(c,Content):
-                    cnt = Content()
-                    qo = cnt.queryObject()
+        from stdm.security.authorization import authorization_snapshot
+
+        PG_ACCOUNT = "postgres"
+        snapshot = authorization_snapshot(self._username)
 
-                    if c.code is None:
+        contents = [c for c in self.contentItems() if isinstance(c, Content)]
+
+        if self._username == PG_ACCOUNT:
+            for c in contents:
+                if c.code is None:
+                    code = snapshot.content_code(c.name)
+                    if code is None:
                         code = self.hash_code(c.name)
-                        cn = c
-                    else:
-                        code = c.code
 
-                    cn = qo.filter(Content.code == code).first()
+                    c.code = code
 
-                    #If content not found then add
-                    if cn is None:
-                        #Check if the 'postgres' role is defined, if not then create one
-                        rl = Role()
-                        rolequery = rl.queryObject()
-                        role = rolequery.filter(Role.name == PG_ACCOUNT).first()
-                        
-                        if role is None:
-                            rl.name = PG_ACCOUNT
-                            rl.contents = [c]
-                            rl.save()                     
-                        else:
-                            existingContents = role.contents
-                            #Append new content to existing 
-                            if c.code is None:
-                                c.code = code 
+            snapshot.register_contents(contents, PG_ACCOUNT)
 
-                            if len([e_cont for e_cont in existingContents if e_cont.name ==  c.name])==0:
-                                existingContents.append(c)
-                                role.contents = existingContents
-                                role.update()
         else:
-            for c in self.contentItems():
-                if isinstance(c,Content):
-                    cnt = Content()
-                    qo = cnt.queryObject()
-                    cn = qo.filter(Content.name == c.name).first()
-                    c.code = cn.code
+            for c in contents:
+                code = snapshot.content_code(c.name)
+                if not code is None:
+                    c.code = code
 
 
             
@@ -39,6 +39,9 @@ from stdm.data.configuration.exception import ConfigurationException
 from stdm.data.configuration.stdm_configuration import StdmConfiguration
 from stdm.settings.config_file_updater import ConfigurationFileUpdater
 from stdm.data.configuration.config_updater import ConfigurationSchemaUpdater
+from stdm.data.configuration import clear_entity_model_cache
+from stdm.data.record_cache import clear_display_record_caches
+from stdm.data.expression_evaluator import clear_expression_cache
 from stdm.data.configuration.column_updaters import varchar_updater
 
 from stdm.ui.change_pwd_dlg import changePwdDlg
@@ -79,6 +82,7 @@ from stdm.data.pg_utils import (
     spatial_tables,
     postgis_exists,
     create_postgis,
+    refresh_catalog_snapshot,
     table_column_names
 )
 from stdm.settings.registryconfig import (
@@ -121,6 +125,7 @@ from stdm.ui.geoodk_profile_importer import ProfileInstanceRecords
 
 from stdm.security.privilege_provider import SinglePrivilegeProvider
 from stdm.security.roleprovider import RoleProvider
+from stdm.security.authorization import refresh_authorization_snapshot
 
 
 LOGGER = logging.getLogger('stdm')
@@ -615,7 +620,7 @@ class STDMQGISLoader(object):
             self.config_serializer.db_update_progress.connect(
                 self.on_update_progress
             )
-            self.config_serializer.load()
+            self.config_serializer.load(use_snapshot=True)
 
             return True
 
@@ -831,6 +836,8 @@ class STDMQGISLoader(object):
             return result
 
     def loadModules(self):
+        #Content items and permissions may have changed since the last load
+        refresh_authorization_snapshot()
 
         self.details_tree_view = DetailsTreeView(self.iface, self)
         '''
@@ -1418,6 +1425,7 @@ class STDMQGISLoader(object):
         '''
         frmUserAccounts = manageAccountsDlg(self)
         frmUserAccounts.exec_()
+        refresh_authorization_snapshot()
 
     def contentAuthorization(self):
         '''
@@ -1425,6 +1433,7 @@ class STDMQGISLoader(object):
         '''
         frmAuthContent = contentAuthDlg(self)
         frmAuthContent.exec_()
+        refresh_authorization_snapshot()
 
     def on_sys_options(self):
         """
@@ -1903,6 +1912,10 @@ class STDMQGISLoader(object):
                 if not data.app_dbconn is None:
                     STDMDb.cleanUp()
                     DeclareMapping.cleanUp()
+                    clear_entity_model_cache()
+                    clear_display_record_caches()
+                    clear_expression_cache()
+                    refresh_catalog_snapshot()
                 #Remove database reference
                 data.app_dbconn = None
             else:
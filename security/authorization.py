@@ -20,28 +20,42 @@ email                : gkahiu@gmail.com
 from roleprovider import RoleProvider
 from exception import SecurityException
 from stdm.data.database import Content, STDMDb, Base
+from stdm.data.pg_utils import _execute
 from stdm.utils.util import *
 from sqlalchemy import Table
 from sqlalchemy.orm import relationship, mapper, clear_mappers
+from sqlalchemy.sql import text
 
 from sqlalchemy.exc import *
 
+PG_ACCOUNT = 'postgres'
+
 class RoleMapper(object):
     pass
 
-class Authorizer(object):
+class AuthorizationSnapshot(object):
     '''
-    This class has the responsibility of asserting whether an account with 
-    the given user name has permissions to access a particular content item
+    In-memory copy of the content items, the roles permitted to access
+    them and the roles of a user. It is loaded in two queries and answers
+    permission checks without querying the database. Call refresh after
+    content permissions or role memberships have been changed.
     '''
     def __init__(self, username):
         self.username = username
         self.userRoles = []
-        self._getUserRoles()        
-        
-    def _getUserRoles(self):
+
+        #Content item code and name mappings
+        self._content_roles = {}
+        self._content_codes = {}
+
+        #Role ids indexed by role name
+        self._role_ids = {}
+
+        self.refresh()
+
+    def refresh(self):
         '''
-        Get roles that the user belongs to
+        Reloads the user roles, content items and their permitted roles.
         '''
         roleProvider = RoleProvider()
         self.userRoles = roleProvider.GetRolesForUser(self.username)
@@ -50,48 +64,151 @@ class Authorizer(object):
         it is not a group role in PostgreSQL but content is initialized by
         morphing it as a role in registering content items
         '''
-        pg_account = 'postgres'
-        if self.username == pg_account:
-            self.userRoles.append(pg_account)
-        
+        if self.username == PG_ACCOUNT:
+            self.userRoles.append(PG_ACCOUNT)
+
+        self._content_roles = {}
+        self._content_codes = {}
+        self._role_ids = {}
+
+        sql = text(
+            'SELECT c.name AS content_name, c.code, r.id AS role_id, '
+            'r.name AS role_name FROM role r FULL OUTER JOIN content_roles cr '
+            'ON cr.role_id = r.id FULL OUTER JOIN content_base c '
+            'ON c.id = cr.content_base_id'
+        )
+        for row in _execute(sql):
+            if not row['role_id'] is None:
+                self._role_ids[row['role_name']] = row['role_id']
+
+            if row['content_name'] is None and row['code'] is None:
+                continue
+
+            roles = self._content_roles.setdefault(row['code'], set())
+            if not row['content_name'] is None:
+                self._content_codes[row['content_name']] = row['code']
+
+            if not row['role_name'] is None and not row['content_name'] is None:
+                roles.add(row['role_name'])
+
+    def has_content(self, code):
+        '''
+        True if a content item with the given code has been registered.
+        '''
+        return code in self._content_roles
+
+    def content_code(self, name):
+        '''
+        Returns the code of the content item with the given name or None
+        if it has not been registered.
+        '''
+        return self._content_codes.get(name, None)
+
+    def has_permission(self, contentCode):
+        '''
+        Assert whether the user has permissions to access a content item
+        with the given code.
+        '''
+        roles = self._content_roles.get(contentCode, None)
+        if not roles:
+            return False
+
+        return len(roles.intersection(self.userRoles)) > 0
+
+    def register_contents(self, contents, role_name=PG_ACCOUNT):
+        '''
+        Adds content items that have not been registered and grants the
+        role access to them, in one statement.
+        :param contents: Content items with the name and code set.
+        :type contents: list
+        :param role_name: Name of the role to be granted access.
+        :type role_name: str
+        '''
+        new_contents = []
+        for c in contents:
+            if self.has_content(c.code) or \
+                    not self.content_code(c.name) is None:
+                continue
+
+            if not c.code in [n.code for n in new_contents]:
+                new_contents.append(c)
+
+        if len(new_contents) == 0:
+            return
+
+        if not role_name in self._role_ids:
+            role_sql = text('INSERT INTO role (name) VALUES (:name) '
+                            'RETURNING id')
+            self._role_ids[role_name] = _execute(
+                role_sql, name=role_name
+            ).scalar()
+
+        values = []
+        params = {'role_id': self._role_ids[role_name]}
+        for i, c in enumerate(new_contents):
+            values.append(u'(:name_{0}, :code_{0})'.format(i))
+            params['name_{0}'.format(i)] = c.name
+            params['code_{0}'.format(i)] = c.code
+
+        sql = text(
+            u'WITH new_content AS (INSERT INTO content_base (name, code) '
+            u'VALUES {0} RETURNING id) INSERT INTO content_roles '
+            u'(content_base_id, role_id) SELECT id, :role_id '
+            u'FROM new_content'.format(u', '.join(values))
+        )
+        _execute(sql, **params)
+
+        for c in new_contents:
+            self._content_roles[c.code] = set([role_name])
+            self._content_codes[c.name] = c.code
+
+
+#Snapshot of the logged in user
+_snapshot = None
+
+
+def authorization_snapshot(username):
+    '''
+    Returns the authorization snapshot of the user, which is loaded once
+    and shared by all the authorizers.
+    :rtype: AuthorizationSnapshot
+    '''
+    global _snapshot
+
+    if _snapshot is None or _snapshot.username != username:
+        _snapshot = AuthorizationSnapshot(username)
+
+    return _snapshot
+
+
+def refresh_authorization_snapshot():
+    '''
+    Reloads the permissions of the logged in user e.g. after content
+    permissions or role memberships have been changed.
+    '''
+    if not _snapshot is None:
+        _snapshot.refresh()
+
+
+class Authorizer(object):
+    '''
+    This class has the responsibility of asserting whether an account with 
+    the given user name has permissions to access a particular content item
+    '''
+    def __init__(self, username):
+        self.username = username
+        self._snapshot = authorization_snapshot(username)
+
+    @property
+    def userRoles(self):
+        '''
+        Roles that the user belongs to
+        '''
+        return self._snapshot.userRoles
+
     def CheckAccess(self, contentCode):
         '''
         Assert whether the given user has permissions to access a content
         item with the gien code. 
-        '''        
-        hasPermission = False
-        #Get roles with permission        
-        try:
-            cnt = Content()                       
-            qo = cnt.queryObject()
-            '''            
-            cntRef = qo.filter(Content.code == contentCode).first()            
-            '''
-            cntRef = qo.filter(Content.code == contentCode).first()
-            if cntRef != None:
-                cntRoles =cntRef.roles 
-                for rl in cntRoles:
-                    if getIndex(self.userRoles,rl.name) != -1:
-                        hasPermission = True
-                        break
-        except Exception:
-            '''
-            Current user does not have permission to access the content tables.
-            Catches all errors
-            '''
-            #pass
-            raise
-        return hasPermission
-    
-
-        
-        
-        
-        
-        
-        
-        
-        
-        
-        
-          
\ No newline at end of file
+        '''
+        return self._snapshot.has_permission(contentCode)
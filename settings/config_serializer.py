@@ -39,6 +39,8 @@ from PyQt4.QtXml import (
     QDomNode
 )
 
+from stdm.data.configuration import clear_entity_model_cache
+from stdm.data.record_cache import clear_display_record_caches
 from stdm.data.configuration.stdm_configuration import StdmConfiguration
 from stdm.data.configuration.exception import ConfigurationException
 from stdm.data.configuration.supporting_document import SupportingDocument
@@ -53,12 +55,17 @@ from stdm.data.configuration.columns import (
     ForeignKeyColumn
 )
 
+from stdm.settings.config_snapshot import (
+    read_snapshot,
+    write_snapshot
+)
 from stdm.settings.config_updaters import ConfigurationUpdater
 from stdm.settings.database_updaters import DatabaseUpdater
 from stdm.utils.util import (
     date_from_string,
     datetime_from_string,
-    string_to_boolean
+    string_to_boolean,
+    version_from_metadata
 )
 
 from stdm.data.configfile_paths import FilePaths
@@ -136,15 +143,29 @@ class ConfigurationFileSerializer(QObject):
         for p in self.config.profiles.values():
             ProfileSerializer.write_xml(p, config_element, document)
 
-    def load(self):
+    def load(self, use_snapshot=False):
         """
         Loads the contents of the configuration file to the corresponding
         instance object.
+        :param use_snapshot: True to load the profiles from the snapshot of
+        the configuration file if the file has not changed since the
+        snapshot was written. The snapshot is written after the file has
+        been parsed.
+        :type use_snapshot: bool
         """
         if not QFile.exists(self.path):
             raise IOError(u'{0} does not exist. Configuration file cannot be '
                           u'loaded.'.format(self.path))
 
+        if use_snapshot:
+            plugin_version = unicode(version_from_metadata()).strip()
+
+            profiles = read_snapshot(self.path, self.config, plugin_version)
+            if not profiles is None:
+                self._load_profiles(profiles)
+
+                return
+
         config_file = QFile(self.path)
 
         if not config_file.open(QIODevice.ReadOnly):
@@ -161,6 +182,19 @@ class ConfigurationFileSerializer(QObject):
         #Load configuration items
         self.read_xml(config_doc)
 
+        if use_snapshot:
+            write_snapshot(self.path, self.config, plugin_version)
+
+    def _load_profiles(self, profiles):
+        #Replaces the profiles in the configuration
+        self.config._clear()
+
+        clear_entity_model_cache()
+        clear_display_record_caches()
+
+        for profile in profiles:
+            self.config.add_profile(profile)
+
     def update(self, document):
         """
         Tries to upgrade the configuration file specified in the DOM document
@@ -263,6 +297,10 @@ class ConfigurationFileSerializer(QObject):
         #Reset items in the config file
         self.config._clear()
 
+        #Entities will be reloaded hence their mapped classes are stale
+        clear_entity_model_cache()
+        clear_display_record_caches()
+
         #Load items afresh
         #Check tag and version attribute first
         doc_element = document.documentElement()
@@ -360,6 +398,64 @@ def _populate_collections_from_element(element, tag_name, collection):
                 collection[name] = er_el
 
 
+def entity_load_order(entity_names, dependencies):
+    """
+    Sorts entities so that each entity comes after the entities it depends
+    on. Each entity is visited once hence the time taken is proportional
+    to the number of entities and dependencies.
+    :param entity_names: Names of the entities to be loaded, in the order
+    of preference for entities that do not depend on each other. Only
+    these entities and their dependencies are included in the result.
+    :type entity_names: list
+    :param dependencies: Names of the entities that each entity depends on.
+    :type dependencies: dict
+    :return: Returns the entity names in the order they should be loaded.
+    :rtype: list
+    """
+    VISITING, LOADED = 1, 2
+
+    load_order = []
+    state = {}
+
+    for name in entity_names:
+        if name in state:
+            continue
+
+        #Depth-first search using a stack of names and parent iterators
+        state[name] = VISITING
+        stack = [(name, iter(dependencies.get(name, [])))]
+
+        while stack:
+            entity_name, parents = stack[-1]
+
+            for parent in parents:
+                parent_state = state.get(parent, None)
+
+                if parent_state is None:
+                    state[parent] = VISITING
+                    stack.append((parent, iter(dependencies.get(parent, []))))
+
+                    break
+
+                elif parent_state == VISITING:
+                    path = [n for n, _ in stack]
+                    cycle = path[path.index(parent):] + [parent]
+
+                    raise ConfigurationException(
+                        u'Entities cannot be loaded due to circular '
+                        u'foreign key relationships: {0}'.format(
+                            u' -> '.join(cycle)
+                        )
+                    )
+
+            else:
+                stack.pop()
+                state[entity_name] = LOADED
+                load_order.append(entity_name)
+
+    return load_order
+
+
 class ProfileSerializer(object):
     """
     (De)serialize profile information.
@@ -429,42 +525,24 @@ class ProfileSerializer(object):
                                          association_elements,
                                          entity_relation_elements)
 
-        deferred_elements = []
-
-        #Process entity elements with no dependency first
-        child_nodes = element.childNodes()
-        for i in range(child_nodes.count()):
-            child_element = child_nodes.item(i).toElement()
-            child_tag_name = child_element.tagName()
-            item_serializer = EntitySerializerCollection.handler_by_tag_name(
-                child_tag_name
-            )
+        '''
+        Index the entity elements by short name and load each entity once,
+        after the entities referenced by its foreign key columns.
+        '''
+        entity_elements = ProfileSerializer.entity_elements(element)
+        dependencies = EntitySerializer.dependency_graph(
+            entity_elements,
+            entity_relation_elements
+        )
 
-            if child_element.tagName() == 'Entity':
-                if not item_serializer is None:
-                    #Check if element has dependency
-                    if not item_serializer.has_dependency(child_element):
-                        item_serializer.read_xml(child_element, profile,
-                                                 association_elements,
-                                                 entity_relation_elements)
-
-                    else:
-                        #Queue the item - tuple containing element and serializer
-                        deferred_elements.append((child_element, item_serializer))
-
-        #Process deferred items
-        for c in deferred_elements:
-            el, serializer = c[0], c[1]
-            '''
-            serializer.read_xml(el, profile, association_elements,
-                        entity_relation_elements)
-            '''
+        #Entities with no dependency first
+        entity_names = [n for n in entity_elements if not dependencies[n]]
+        entity_names.extend([n for n in entity_elements if dependencies[n]])
 
-            #Resolve dependency
-            serializer.resolve_dependency(
-                el,
+        for name in entity_load_order(entity_names, dependencies):
+            EntitySerializer.read_xml(
+                entity_elements[name],
                 profile,
-                element,
                 association_elements,
                 entity_relation_elements
             )
@@ -478,6 +556,33 @@ class ProfileSerializer(object):
 
         return profile
 
+    @staticmethod
+    def entity_elements(profile_element):
+        """
+        Indexes the entity elements in the profile.
+        :param profile_element: Profile element containing the entities.
+        :type profile_element: QDomElement
+        :return: Returns the entity elements indexed by short name, in the
+        order they appear in the profile.
+        :rtype: OrderedDict
+        """
+        entity_elements = OrderedDict()
+
+        child_nodes = profile_element.childNodes()
+        for i in range(child_nodes.count()):
+            child_element = child_nodes.item(i).toElement()
+
+            if child_element.tagName() != EntitySerializer.TAG_NAME:
+                continue
+
+            short_name = unicode(child_element.attribute(
+                EntitySerializer.SHORT_NAME, '')
+            )
+            if short_name and not short_name in entity_elements:
+                entity_elements[short_name] = child_element
+
+        return entity_elements
+
     @staticmethod
     def entity_element(profile_element, entity_name):
         """
@@ -1167,6 +1272,65 @@ class EntitySerializer(EntitySerializerCollection):
 
         return dep_col_elements
 
+    @classmethod
+    def parent_entities(cls, element, entity_relation_elements):
+        """
+        :param element: Element containing entity information.
+        :type element: QDomElement
+        :param entity_relation_elements: Collection of QDomElements
+        containing entity relation information.
+        :type entity_relation_elements: dict
+        :return: Returns the short names of the parent entities referenced
+        by the foreign key columns of the entity.
+        :rtype: list
+        """
+        parents = []
+
+        for c in EntitySerializer._dependency_columns(element):
+            type_info = unicode(c.attribute('TYPE_INFO'))
+            if type_info != ForeignKeyColumn.TYPE_INFO:
+                continue
+
+            er_element = ForeignKeyColumnSerializer.entity_relation_element(c)
+            relation_name = unicode(er_element.attribute('name', ''))
+            er_element = entity_relation_elements.get(relation_name, None)
+
+            if not er_element is None:
+                parent = unicode(
+                    er_element.attribute(EntityRelationSerializer.PARENT, '')
+                )
+
+                if parent and not parent in parents:
+                    parents.append(parent)
+
+        return parents
+
+    @classmethod
+    def dependency_graph(cls, entity_elements, entity_relation_elements):
+        """
+        :param entity_elements: Entity elements indexed by short name.
+        :type entity_elements: dict
+        :param entity_relation_elements: Collection of QDomElements
+        containing entity relation information.
+        :type entity_relation_elements: dict
+        :return: Returns the short names of the parent entities of each
+        entity. Self-references and parents which are not in the entity
+        elements e.g. value lists are excluded.
+        :rtype: dict
+        """
+        dependencies = {}
+
+        for name, element in entity_elements.iteritems():
+            dependencies[name] = [
+                p for p in EntitySerializer.parent_entities(
+                    element,
+                    entity_relation_elements
+                )
+                if p != name and p in entity_elements
+            ]
+
+        return dependencies
+
     @classmethod
     def resolve_dependency(
             cls,
@@ -1177,83 +1341,34 @@ class EntitySerializer(EntitySerializerCollection):
             entity_relation_elements
     ):
         """
-        Performs a depth-first addition of an entity to a profile by
-        recursively cascading all related entities first.
+        Adds an entity to a profile after the related entities that have
+        not yet been added.
         :param element: Element representing the entity.
         :type element: QDomElement
         :param profile: Profile object to be populated with the entity
         information.
         :type profile: Profile
         """
-        dep_cols = EntitySerializer._dependency_columns(element)
+        entity_elements = ProfileSerializer.entity_elements(profile_element)
+        short_name = unicode(element.attribute(EntitySerializer.SHORT_NAME, ''))
+        entity_elements[short_name] = element
+
+        dependencies = EntitySerializer.dependency_graph(
+            entity_elements,
+            entity_relation_elements
+        )
+
+        for name in entity_load_order([short_name], dependencies):
+            if name != short_name and name in profile.entities:
+                continue
 
-        # Add entity directly if there are no dependency columns
-        if len(dep_cols) == 0:
             EntitySerializer.read_xml(
-                element,
+                entity_elements[name],
                 profile,
                 association_elements,
                 entity_relation_elements
             )
 
-            return
-
-        for c in dep_cols:
-            # Get foreign key columns
-            type_info = unicode(c.attribute('TYPE_INFO'))
-
-            if type_info == ForeignKeyColumn.TYPE_INFO:
-                #Get relation element
-                er_element = ForeignKeyColumnSerializer.entity_relation_element(c)
-                relation_name = unicode(er_element.attribute('name', ''))
-                er_element = entity_relation_elements.get(relation_name, None)
-
-                if not er_element is None:
-                    #Get parent
-                    parent = unicode(
-                        er_element.attribute(
-                            EntityRelationSerializer.PARENT,
-                            ''
-                        )
-                    )
-
-                    #Get parent entity element
-                    if parent:
-                        parent_element = ProfileSerializer.entity_element(
-                            profile_element,
-                            parent
-                        )
-
-                        if not parent_element is None:
-                            #Check if parent has dependency
-                            if EntitySerializer.has_dependency(parent_element):
-                                #Resolve dependency
-                                EntitySerializer.resolve_dependency(
-                                    parent_element,
-                                    profile,
-                                    profile_element,
-                                    association_elements,
-                                    entity_relation_elements
-                                )
-
-                            #No more dependencies
-                            else:
-                                EntitySerializer.read_xml(
-                                    parent_element,
-                                    profile,
-                                    association_elements,
-                                    entity_relation_elements
-                                )
-
-        #Now add entity to profile
-        EntitySerializer.read_xml(
-            element,
-            profile,
-            association_elements,
-            entity_relation_elements
-        )
-
-
     @staticmethod
     def write_xml(entity, parent_node, document):
         """
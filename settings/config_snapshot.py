@@ -0,0 +1,223 @@
+"""
+/***************************************************************************
+Name                 : Configuration snapshot
+Description          : Binary copy of the loaded configuration which is read
+                       instead of parsing the configuration file when the
+                       file has not changed.
+Date                 : 17/October/2026
+copyright            : (C) 2026 by UN-Habitat and implementing partners.
+                       See the accompanying file CONTRIBUTORS.txt in the root
+email                : stdm@unhabitat.org
+ ***************************************************************************/
+
+/***************************************************************************
+ *                                                                         *
+ *   This program is free software; you can redistribute it and/or modify  *
+ *   it under the terms of the GNU General Public License as published by  *
+ *   the Free Software Foundation; either version 2 of the License, or     *
+ *   (at your option) any later version.                                   *
+ *                                                                         *
+ ***************************************************************************/
+"""
+import cPickle
+import hashlib
+import importlib
+import logging
+import os
+import pickle
+import types
+
+from PyQt4.QtCore import QObject
+
+LOGGER = logging.getLogger('stdm')
+
+#Incremented when the snapshot layout changes
+SNAPSHOT_FORMAT = 1
+
+SNAPSHOT_EXTENSION = '.snapshot'
+
+#Persistent id of the configuration instance the profiles belong to
+CONFIGURATION_ID = 'configuration'
+
+
+def _restore_qobject(cls):
+    #Creates the QObject whose attributes are set from the snapshot
+    obj = cls.__new__(cls)
+    QObject.__init__(obj)
+
+    return obj
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """
+    Pickles the configuration objects. Profiles and entities are QObjects
+    hence they are recreated empty and their attributes are restored
+    afterwards. The attributes are written after the main object so that
+    long chains of related entities do not exceed the recursion limit.
+    """
+    def __init__(self, snapshot_file, configuration):
+        pickle.Pickler.__init__(self, snapshot_file, cPickle.HIGHEST_PROTOCOL)
+        self._configuration = configuration
+        self._pending_states = []
+
+    def persistent_id(self, obj):
+        if obj is self._configuration:
+            return CONFIGURATION_ID
+
+        return None
+
+    def save(self, obj):
+        if id(obj) in self.memo or obj is self._configuration:
+            pickle.Pickler.save(self, obj)
+
+        elif isinstance(obj, QObject):
+            self.save_reduce(_restore_qobject, (type(obj),), obj=obj)
+            self._pending_states.append((obj, obj.__dict__))
+
+        elif isinstance(obj, types.ModuleType):
+            self.save_reduce(importlib.import_module, (obj.__name__,),
+                             obj=obj)
+
+        else:
+            pickle.Pickler.save(self, obj)
+
+    def dump(self, obj):
+        self.write(pickle.PROTO + chr(self.proto))
+        self.save(obj)
+
+        #Set the attributes of the QObjects
+        while self._pending_states:
+            qobj, state = self._pending_states.pop()
+            self.save(qobj)
+            self.save(state)
+            self.write(pickle.BUILD)
+            self.write(pickle.POP)
+
+        self.write(pickle.STOP)
+
+
+def snapshot_path(config_path):
+    """
+    :param config_path: Path to the configuration file.
+    :type config_path: str
+    :return: Returns the path to the snapshot of the configuration file.
+    :rtype: str
+    """
+    return u'{0}{1}'.format(os.path.splitext(config_path)[0],
+                            SNAPSHOT_EXTENSION)
+
+
+def snapshot_key(config_path, plugin_version):
+    """
+    :param config_path: Path to the configuration file.
+    :type config_path: str
+    :param plugin_version: Version of the plugin writing or reading the
+    snapshot.
+    :type plugin_version: str
+    :return: Returns the hash identifying the contents of the configuration
+    file and the plugin version, which must match for the snapshot to be
+    used.
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    digest.update('{0}|{1}|'.format(SNAPSHOT_FORMAT, plugin_version))
+
+    with open(config_path, 'rb') as config_file:
+        for chunk in iter(lambda: config_file.read(65536), ''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def write_snapshot(config_path, configuration, plugin_version):
+    """
+    Writes the profiles in the configuration to the snapshot of the
+    configuration file. Errors are logged since the snapshot is only used
+    to speed up loading.
+    :param config_path: Path to the configuration file that was loaded.
+    :type config_path: str
+    :param configuration: Configuration containing the loaded profiles.
+    :type configuration: StdmConfiguration
+    :param plugin_version: Version of the plugin.
+    :type plugin_version: str
+    :return: Returns True if the snapshot was written.
+    :rtype: bool
+    """
+    path = snapshot_path(config_path)
+    tmp_path = u'{0}.tmp'.format(path)
+
+    try:
+        key = snapshot_key(config_path, plugin_version)
+
+        with open(tmp_path, 'wb') as snapshot_file:
+            cPickle.dump(key, snapshot_file, cPickle.HIGHEST_PROTOCOL)
+            _SnapshotPickler(snapshot_file, configuration).dump(
+                configuration.profiles.values()
+            )
+
+        #Replace the previous snapshot
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+        return True
+
+    except (IOError, OSError, pickle.PicklingError, TypeError,
+            RuntimeError) as err:
+        LOGGER.debug(u'Configuration snapshot could not be written: '
+                     u'{0}'.format(err))
+
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        return False
+
+
+def read_snapshot(config_path, configuration, plugin_version):
+    """
+    Reads the profiles from the snapshot of the configuration file.
+    :param config_path: Path to the configuration file.
+    :type config_path: str
+    :param configuration: Configuration that the profiles will be added
+    to.
+    :type configuration: StdmConfiguration
+    :param plugin_version: Version of the plugin.
+    :type plugin_version: str
+    :return: Returns the profiles or None if there is no snapshot, or it was
+    written for a different configuration file or plugin version, in which
+    case the configuration file has to be parsed.
+    :rtype: list
+    """
+    path = snapshot_path(config_path)
+    if not os.path.exists(path):
+        return None
+
+    def persistent_load(persistent_id):
+        if persistent_id == CONFIGURATION_ID:
+            return configuration
+
+        raise cPickle.UnpicklingError(
+            u'Unknown object {0} in the configuration snapshot.'.format(
+                persistent_id
+            )
+        )
+
+    try:
+        with open(path, 'rb') as snapshot_file:
+            unpickler = cPickle.Unpickler(snapshot_file)
+            unpickler.persistent_load = persistent_load
+
+            if unpickler.load() != snapshot_key(config_path, plugin_version):
+                LOGGER.debug('Configuration file has changed, the snapshot '
+                             'will not be used.')
+
+                return None
+
+            return unpickler.load()
+
+    except Exception as err:
+        #The snapshot is only a cache hence it is never fatal
+        LOGGER.debug(u'Configuration snapshot could not be read: '
+                     u'{0}'.format(err))
+
+        return None
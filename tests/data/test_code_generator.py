@@ -0,0 +1,40 @@
+import re
+from unittest import (
+    makeSuite,
+    TestCase
+)
+
+from stdm.data.code_generator import (
+    format_code,
+    serial_pattern
+)
+
+
+class TestCodeGenerator(TestCase):
+    def test_format_code(self):
+        self.assertEqual(format_code('HH', '/', '00', 1), (u'HH/001', '001'))
+        self.assertEqual(format_code('HH', '/', '00', 1200),
+                         (u'HH/1200', '1200'))
+        self.assertEqual(format_code('', '', '', 7), (u'7', '7'))
+
+    def test_serial_pattern(self):
+        pattern = re.compile(serial_pattern(u'KE.01/'))
+
+        self.assertEqual(pattern.match(u'KE.01/0010').group(1), u'0010')
+        #Only digits may follow the prefix
+        self.assertIsNone(pattern.match(u'KE.01/0010A'))
+        self.assertIsNone(pattern.match(u'KEX01/0010'))
+        self.assertIsNone(pattern.match(u'KE.01/02/0010'))
+
+    def test_serial_pattern_escapes(self):
+        #Only PostgreSQL regular expression metacharacters are escaped
+        self.assertEqual(serial_pattern(u'K\u00c9-01/'),
+                         u'^K\u00c9-01/([0-9]+)$')
+        self.assertEqual(serial_pattern(u'A(1)+'),
+                         u'^A\\(1\\)\\+([0-9]+)$')
+
+
+def suite():
+    suite = makeSuite(TestCodeGenerator, 'test')
+
+    return suite
@@ -0,0 +1,108 @@
+from unittest import (
+    makeSuite,
+    TestCase
+)
+
+from stdm.data.configuration.stdm_configuration import StdmConfiguration
+from stdm.data.configuration.columns import (
+    BooleanColumn,
+    DateColumn,
+    DoubleColumn,
+    IntegerColumn,
+    PercentColumn
+)
+from stdm.data.importexport.reader import (
+    fix_foreign_key_value,
+    fix_percent_value,
+    fix_yes_no_value,
+    OGRReader
+)
+
+from stdm.tests.data.utils import (
+    add_basic_profile,
+    add_person_entity,
+    append_person_columns,
+    BASIC_PROFILE
+)
+
+
+def _synthetic_rows(num_rows):
+    # Rows of source values, as read from a shapefile or CSV layer
+    rows = []
+    for i in range(num_rows):
+        rows.append({
+            'household_id': str(i),
+            'first_name': 'Name {0}'.format(i),
+            'gender': str(i % 3),
+            'age': '' if i % 10 == 0 else str(i % 90),
+            'income': '{0}.5'.format(i),
+            'share': '{0}%'.format(i % 100),
+            'registration_date': 'NULL' if i % 7 == 0 else '2018-01-01',
+            'is_owner': 'Yes' if i % 2 == 0 else 'no'
+        })
+
+    return rows
+
+
+class TestImportValueFixers(TestCase):
+    def setUp(self):
+        self.config = StdmConfiguration.instance()
+        self.profile = add_basic_profile(self.config)
+        self.entity = add_person_entity(self.profile)
+        append_person_columns(self.entity)
+
+        self.entity.add_column(IntegerColumn('age', self.entity))
+        self.entity.add_column(DoubleColumn('income', self.entity))
+        self.entity.add_column(PercentColumn('share', self.entity))
+        self.entity.add_column(DateColumn('registration_date', self.entity))
+        self.entity.add_column(BooleanColumn('is_owner', self.entity))
+
+        # Reader is not bound to a data source or database
+        self.reader = OGRReader.__new__(OGRReader)
+        self.reader._current_profile = self.profile
+
+    def tearDown(self):
+        self.config.remove_profile(BASIC_PROFILE)
+        self.profile = None
+        self.config = None
+
+    def test_value_fixers(self):
+        fixers = self.reader.value_fixers(self.entity.name)
+
+        self.assertNotIn('first_name', fixers)
+        self.assertIs(fixers['gender'], fix_foreign_key_value)
+        self.assertIs(fixers['share'], fix_percent_value)
+        self.assertIs(fixers['is_owner'], fix_yes_no_value)
+
+    def test_compiled_fixers_match_auto_fix(self):
+        table = self.entity.name
+        fixers = self.reader.value_fixers(table)
+
+        for row in _synthetic_rows(100):
+            for col, value in row.iteritems():
+                expected = self.reader.auto_fix_float_integer(table, col,
+                                                              value)
+                expected = self.reader.auto_fix_percent(table, col, expected)
+                expected = self.reader.auto_fix_date(table, col, expected)
+                expected = self.reader.auto_fix_yes_no(table, col, expected)
+
+                fixer = fixers.get(col, None)
+                actual = value if fixer is None else fixer(value)
+
+                self.assertEqual(actual, expected)
+
+    def test_fix_values(self):
+        self.assertIsNone(fix_foreign_key_value('0'))
+        self.assertIsNone(fix_foreign_key_value(' null '))
+        self.assertEqual(fix_foreign_key_value('12'), 12)
+        self.assertIsNone(fix_percent_value(''))
+        self.assertEqual(fix_percent_value('45%'), 45.0)
+        self.assertTrue(fix_yes_no_value('YES'))
+        self.assertFalse(fix_yes_no_value('false'))
+        self.assertEqual(fix_yes_no_value('maybe'), 'maybe')
+
+
+def suite():
+    suite = makeSuite(TestImportValueFixers, 'test')
+
+    return suite
@@ -15,8 +15,11 @@ from stdm.tests.data.utils import (
     add_spatial_unit_entity,
     append_person_columns,
     BASIC_PROFILE,
+    create_entity,
     create_person_entity,
     create_relation,
+    create_value_list,
+    HOUSEHOLD_ENTITY,
     PERSON_ENTITY,
     set_profile_social_tenure
 )
@@ -104,6 +107,74 @@ class TestProfile(TestCase):
         self.assertGreater(len(entities), 0, 'There no entities of ENTITY '
                                              'type info in the collection.')
 
+    def test_entity_by_name(self):
+        person_entity = add_person_entity(self.profile)
+        entity = self.profile.entity_by_name(person_entity.name)
+
+        self.assertIs(entity, person_entity)
+
+    def test_entity_by_name_after_rename(self):
+        person_entity = add_person_entity(self.profile)
+        old_name = person_entity.name
+        self.profile.rename(PERSON_ENTITY, 'member')
+
+        self.assertIsNone(self.profile.entity_by_name(old_name))
+        self.assertIs(self.profile.entity_by_name(person_entity.name),
+                      person_entity)
+
+    def test_relations_index(self):
+        rel = self._add_household_person_relation()
+        self.profile.add_entity_relation(rel)
+        household_entity = self.profile.entity(HOUSEHOLD_ENTITY)
+        person_entity = self.profile.entity(PERSON_ENTITY)
+
+        self.assertIn(rel, self.profile.parent_relations(household_entity))
+        self.assertIn(rel, self.profile.child_relations(person_entity))
+        self.assertIn(household_entity, person_entity.parents())
+
+        self.profile.rename(HOUSEHOLD_ENTITY, 'family')
+
+        self.assertIn(rel, self.profile.parent_relations(household_entity))
+
+    def test_entity_name_index(self):
+        person_entity = add_person_entity(self.profile)
+        self.assertIs(self.profile.entity_by_name(person_entity.name),
+                      person_entity)
+        self.assertIsNone(self.profile.entity_by_name('ha_missing'))
+
+        self.profile.remove_entity(PERSON_ENTITY)
+        self.assertIsNone(self.profile.entity_by_name(person_entity.name))
+
+    def test_renamed_value_list_lookup(self):
+        value_list = create_value_list(self.profile, 'water_source')
+        self.profile.add_entity(value_list)
+        old_name = value_list.name
+
+        # Populate the index before renaming
+        self.assertIs(self.profile.entity_by_name(old_name), value_list)
+
+        value_list.rename_entity('water_supply')
+
+        # Looking up the old name first would rebuild the index
+        self.assertNotEqual(value_list.name, old_name)
+        self.assertIs(self.profile.entity_by_name(value_list.name),
+                      value_list)
+        self.assertIsNone(self.profile.entity_by_name(old_name))
+
+    def test_renamed_supporting_document_lookup(self):
+        person_entity = add_person_entity(self.profile)
+        doc_entity = person_entity.supporting_doc
+        old_name = doc_entity.name
+
+        self.assertIs(self.profile.entity_by_name(old_name), doc_entity)
+
+        self.profile.rename(PERSON_ENTITY, 'member')
+
+        self.assertNotEqual(doc_entity.name, old_name)
+        self.assertIs(self.profile.entity_by_name(doc_entity.name),
+                      doc_entity)
+        self.assertIsNone(self.profile.entity_by_name(old_name))
+
     def tearDown(self):
         self.config.remove_profile(BASIC_PROFILE)
         self.profile = None
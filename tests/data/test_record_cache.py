@@ -0,0 +1,73 @@
+import time
+from collections import namedtuple
+from unittest import (
+    makeSuite,
+    TestCase
+)
+
+from stdm.data.record_cache import (
+    clear_display_record_caches,
+    display_record_cache,
+    DisplayRecordCache
+)
+
+LookupRecord = namedtuple('LookupRecord', ['id', 'value', 'code'])
+
+
+class TestDisplayRecordCache(TestCase):
+    def setUp(self):
+        self.cache = DisplayRecordCache('check_gender', ['value', 'code'],
+                                        capacity=3)
+
+        #Records are added directly so that no database query is made
+        self.cache._loaded = True
+        self.cache._complete = True
+        for i in range(1, 4):
+            self.cache._add(LookupRecord(i, 'Value {0}'.format(i), str(i)))
+
+    def test_cached_records(self):
+        records = self.cache.fetch([1, 2, None])
+
+        self.assertEqual(len(records), 2)
+        self.assertEqual(records[2].value, 'Value 2')
+        self.assertEqual([r.id for r in self.cache.records()], [1, 2, 3])
+
+    def test_lru_eviction(self):
+        #Access record 1 so that record 2 is the least recently used
+        self.cache.fetch([1])
+        self.cache._add(LookupRecord(4, 'Value 4', '4'))
+
+        self.assertEqual(len(self.cache), 3)
+        self.assertEqual([r.id for r in self.cache.records()], [1, 3, 4])
+        self.assertFalse(self.cache.is_complete)
+
+    def test_clear(self):
+        self.cache.clear()
+
+        self.assertEqual(len(self.cache), 0)
+        self.assertFalse(self.cache._loaded)
+
+    def test_expiry(self):
+        self.cache._loaded_at = time.time()
+        self.assertFalse(self.cache.is_expired())
+
+        self.cache._loaded_at -= self.cache.max_age + 1
+        self.assertTrue(self.cache.is_expired())
+
+        self.cache.max_age = None
+        self.assertFalse(self.cache.is_expired())
+
+    def test_shared_cache(self):
+        cache_a = display_record_cache('ha_party', ['first_name', 'id'])
+        cache_b = display_record_cache('ha_party', ['first_name'])
+
+        self.assertIs(cache_a, cache_b)
+        self.assertEqual(cache_a.columns, ['first_name'])
+
+        clear_display_record_caches('ha_party')
+
+
+def suite():
+    suite = makeSuite(TestDisplayRecordCache, 'test')
+
+    return suite
@@ -0,0 +1,76 @@
+from unittest import (
+    makeSuite,
+    TestCase
+)
+
+from sqlalchemy.dialects import postgresql
+
+from stdm.data.configuration.stdm_configuration import StdmConfiguration
+from stdm.data.search_query import EntitySearchQuery
+
+from stdm.tests.data.utils import (
+    add_basic_profile,
+    add_person_entity,
+    append_person_columns,
+    BASIC_PROFILE
+)
+
+
+class TestEntitySearchQuery(TestCase):
+    def setUp(self):
+        self.config = StdmConfiguration.instance()
+        self.profile = add_basic_profile(self.config)
+        self.person = add_person_entity(self.profile)
+        append_person_columns(self.person)
+
+    def tearDown(self):
+        self.config.remove_profile(BASIC_PROFILE)
+        self.config = None
+
+    def _compile(self, search_query):
+        return search_query.where_clause().compile(
+            dialect=postgresql.dialect()
+        )
+
+    def test_bound_parameters(self):
+        search_query = EntitySearchQuery(
+            self.person,
+            {'first_name': u"O'Brien", 'household_id': 3, 'gender': 2}
+        )
+        compiled = self._compile(search_query)
+        sql = unicode(compiled)
+
+        self.assertNotIn(u"O'Brien", sql)
+        self.assertIn(u"o'brien%", compiled.params.values())
+        self.assertIn(u'lower(CAST(', sql)
+        self.assertIn(u'household_id = %(household_id_1)s', sql)
+        self.assertIn(u'gender = %(gender_1)s', sql)
+
+    def test_range(self):
+        search_query = EntitySearchQuery(self.person, {'household_id': (2, 5)})
+        sql = unicode(self._compile(search_query))
+
+        self.assertIn(u'BETWEEN', sql)
+
+    def test_unknown_columns_ignored(self):
+        search_query = EntitySearchQuery(self.person, {'not_a_column': 1})
+
+        self.assertTrue(search_query.is_empty())
+        self.assertIsNone(search_query.where_clause())
+
+    def test_index_columns(self):
+        search_query = EntitySearchQuery(
+            self.person,
+            {'first_name': u'Jane', 'household_id': 3, 'gender': 2}
+        )
+
+        self.assertEqual(
+            sorted(search_query.index_columns()),
+            [('first_name', True), ('gender', False)]
+        )
+
+
+def suite():
+    suite = makeSuite(TestEntitySearchQuery, 'test')
+
+    return suite
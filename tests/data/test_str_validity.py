@@ -0,0 +1,139 @@
+from datetime import date
+from unittest import (
+    makeSuite,
+    TestCase
+)
+
+from sqlalchemy import (
+    Column,
+    create_engine,
+    Date,
+    ForeignKey,
+    Integer,
+    MetaData,
+    select,
+    String,
+    Table
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.orm import sessionmaker
+
+from stdm.data.str_validity import (
+    split_valid_str_rows,
+    validity_period_clause,
+    with_valid_str_ids
+)
+
+Base = declarative_base()
+
+
+class Party(Base):
+    __tablename__ = 'ha_party'
+    id = Column(Integer, primary_key=True)
+    name = Column(String)
+
+
+class SocialTenure(Base):
+    __tablename__ = 'ha_social_tenure_relationship'
+    id = Column(Integer, primary_key=True)
+    party_id = Column(Integer, ForeignKey('ha_party.id'))
+    validity_start = Column(Date)
+    validity_end = Column(Date)
+
+
+class TestSTRValidity(TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://')
+        metadata = MetaData()
+        self.str_table = Table(
+            'social_tenure_relationship',
+            metadata,
+            Column('id', Integer, primary_key=True),
+            Column('validity_start', Date),
+            Column('validity_end', Date)
+        )
+        metadata.create_all(self.engine)
+
+        self.engine.execute(self.str_table.insert(), [
+            {'id': 1, 'validity_start': date(2015, 1, 1),
+             'validity_end': date(2016, 1, 1)},
+            #Ends after the period
+            {'id': 2, 'validity_start': date(2015, 1, 1),
+             'validity_end': date(2020, 1, 1)},
+            #Records without dates
+            {'id': 3, 'validity_start': date(2015, 6, 1),
+             'validity_end': None},
+            {'id': 4, 'validity_start': None,
+             'validity_end': date(2016, 6, 1)},
+            {'id': 5, 'validity_start': None, 'validity_end': None},
+            #Starts before the period
+            {'id': 6, 'validity_start': date(2010, 1, 1),
+             'validity_end': None}
+        ])
+
+    def _valid_ids(self, from_date, to_date):
+        query = select([self.str_table.c.id]).where(
+            validity_period_clause(self.str_table.c, from_date, to_date)
+        ).order_by(self.str_table.c.id)
+
+        return [r[0] for r in self.engine.execute(query)]
+
+    def test_bounded_period(self):
+        self.assertEqual(
+            self._valid_ids(date(2015, 1, 1), date(2017, 1, 1)),
+            [1]
+        )
+        self.assertEqual(
+            self._valid_ids(date(2015, 1, 1), date(2020, 1, 1)),
+            [1, 2]
+        )
+
+    def test_partial_overlap(self):
+        #Records that only overlap the period are not valid
+        self.assertEqual(
+            self._valid_ids(date(2015, 6, 1), date(2017, 1, 1)),
+            []
+        )
+        self.assertEqual(
+            self._valid_ids(date(2010, 1, 1), date(2015, 12, 1)),
+            []
+        )
+
+    def test_missing_dates(self):
+        #Records without a start or end date are never valid
+        self.assertEqual(
+            self._valid_ids(date(2000, 1, 1), date(2030, 1, 1)),
+            [1, 2]
+        )
+
+    def test_single_query(self):
+        session = sessionmaker()()
+        query = with_valid_str_ids(
+            session.query(Party),
+            Party,
+            SocialTenure,
+            SocialTenure.party_id,
+            date(2015, 1, 1),
+            date(2017, 1, 1)
+        )
+        sql = unicode(query.statement.compile(dialect=postgresql.dialect()))
+
+        self.assertIn('array_agg(ha_social_tenure_relationship.id)', sql)
+        self.assertIn('JOIN ha_social_tenure_relationship', sql)
+        self.assertIn('GROUP BY ha_party.id', sql)
+
+    def test_split_rows(self):
+        records, str_ids = split_valid_str_rows([
+            ('party_1', [1, 2]),
+            ('party_2', [3, None])
+        ])
+
+        self.assertEqual(records, ['party_1', 'party_2'])
+        self.assertEqual(str_ids, set([1, 2, 3]))
+
+
+def suite():
+    suite = makeSuite(TestSTRValidity, 'test')
+
+    return suite
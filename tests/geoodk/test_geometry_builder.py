@@ -0,0 +1,97 @@
+import struct
+from unittest import (
+    makeSuite,
+    TestCase
+)
+
+from qgis.core import QgsGeometry
+
+from stdm.geoodk.importer.geometry_provider import (
+    EWKB_SRID_FLAG,
+    GeometryBatchBuilder,
+    STDMGeometry
+)
+
+
+def _geoshape(num_vertices, offset=0.0):
+    # Closed ring in the ODK format i.e. 'lat lon alt accuracy;...'
+    points = []
+    for i in range(num_vertices):
+        lat = -1.2 + offset + 0.0001 * (i % 7)
+        lon = 36.8 + offset + 0.0001 * i
+        points.append('{0:.7f} {1:.7f} 0.0 0.0'.format(lat, lon))
+    points.append(points[0])
+
+    return ';'.join(points)
+
+
+def _wkb_geometry(ewkb):
+    # Remove the SRID from the EWKB so that QGIS can read it
+    geom_type = struct.unpack('<I', ewkb[1:5])[0] & ~EWKB_SRID_FLAG
+    geom = QgsGeometry()
+    geom.fromWkb(ewkb[:1] + struct.pack('<I', geom_type) + ewkb[9:])
+
+    return geom
+
+
+def _legacy_geometry(ewkt):
+    return QgsGeometry.fromWkt(ewkt.split(';', 1)[1])
+
+
+class TestGeometryBatchBuilder(TestCase):
+    def setUp(self):
+        self.builder = GeometryBatchBuilder(4326)
+
+    def test_polygons_match_legacy_wkt(self):
+        values = [_geoshape(5), _geoshape(12, 0.01), _geoshape(40, 0.5)]
+        results = self.builder.build(values, 'POLYGON')
+
+        for value, (ewkb, error) in zip(values, results):
+            self.assertIsNone(error)
+            self.assertEqual(struct.unpack('<I', ewkb[5:9])[0], 4326)
+
+            legacy = _legacy_geometry(STDMGeometry(value).polygon_to_Wkt())
+            self.assertTrue(_wkb_geometry(ewkb).equals(legacy))
+
+    def test_points_match_legacy_wkt(self):
+        values = ['-1.2864 36.8172 1650.0 5.0', '0.5 33.25 0.0 0.0']
+        results = self.builder.build(values, 'POINT')
+
+        for value, (ewkb, error) in zip(values, results):
+            self.assertIsNone(error)
+
+            legacy = _legacy_geometry(STDMGeometry(value).point_to_Wkt())
+            self.assertTrue(_wkb_geometry(ewkb).equals(legacy))
+
+    def test_ring_closure(self):
+        value = _geoshape(4).rsplit(';', 1)[0]
+        ewkb, error = self.builder.build([value], 'POLYGON')[0]
+
+        ring = _wkb_geometry(ewkb).asPolygon()[0]
+        self.assertEqual(len(ring), 5)
+        self.assertEqual(ring[0], ring[-1])
+
+    def test_invalid_values(self):
+        values = ['', 'abc def', '95.0 36.8 0.0 0.0', '-1.2 36.8 0.0 0.0']
+        results = self.builder.build(values, 'POLYGON')
+
+        for ewkb, error in results:
+            self.assertIsNone(ewkb)
+            self.assertIsNotNone(error)
+
+    def test_transform(self):
+        builder = GeometryBatchBuilder(3857)
+        ewkb, error = builder.build(['0.0 45.0 0.0 0.0'], 'POINT')[0]
+
+        self.assertIsNone(error)
+        self.assertEqual(struct.unpack('<I', ewkb[5:9])[0], 3857)
+
+        x, y = struct.unpack('<dd', ewkb[9:25])
+        self.assertAlmostEqual(x, 5009377.0856, places=3)
+        self.assertAlmostEqual(y, 0.0, places=3)
+
+
+def suite():
+    suite = makeSuite(TestGeometryBatchBuilder, 'test')
+
+    return suite
@@ -0,0 +1,85 @@
+import os
+import tempfile
+from unittest import (
+    makeSuite,
+    TestCase
+)
+
+from stdm.data.configuration.stdm_configuration import StdmConfiguration
+from stdm.settings.config_snapshot import (
+    read_snapshot,
+    snapshot_path,
+    write_snapshot
+)
+
+from stdm.tests.data.utils import (
+    add_basic_profile,
+    add_person_entity,
+    append_person_columns,
+    BASIC_PROFILE,
+    PERSON_ENTITY
+)
+
+PLUGIN_VERSION = '1.7.4'
+
+
+class TestConfigurationSnapshot(TestCase):
+    def setUp(self):
+        self.config = StdmConfiguration.instance()
+        self.profile = add_basic_profile(self.config)
+        append_person_columns(add_person_entity(self.profile))
+
+        fd, self.config_path = tempfile.mkstemp(suffix='.stc')
+        with os.fdopen(fd, 'w') as config_file:
+            config_file.write('<Configuration version="1.3"/>')
+
+    def tearDown(self):
+        for path in [self.config_path, snapshot_path(self.config_path)]:
+            if os.path.exists(path):
+                os.remove(path)
+
+        self.config.remove_profile(BASIC_PROFILE)
+        self.config = None
+
+    def test_read_written_snapshot(self):
+        self.assertTrue(
+            write_snapshot(self.config_path, self.config, PLUGIN_VERSION)
+        )
+
+        profiles = read_snapshot(self.config_path, self.config,
+                                 PLUGIN_VERSION)
+        profile = [p for p in profiles if p.name == BASIC_PROFILE][0]
+
+        self.assertIsNot(profile, self.profile)
+        self.assertIs(profile.configuration, self.config)
+        self.assertEqual(profile.entities.keys(), self.profile.entities.keys())
+
+        person = profile.entity(PERSON_ENTITY)
+        self.assertEqual(
+            person.columns.keys(),
+            self.profile.entity(PERSON_ENTITY).columns.keys()
+        )
+        self.assertIs(person.profile, profile)
+
+    def test_changed_file(self):
+        write_snapshot(self.config_path, self.config, PLUGIN_VERSION)
+
+        with open(self.config_path, 'a') as config_file:
+            config_file.write('\n')
+
+        self.assertIsNone(
+            read_snapshot(self.config_path, self.config, PLUGIN_VERSION)
+        )
+
+    def test_changed_plugin_version(self):
+        write_snapshot(self.config_path, self.config, PLUGIN_VERSION)
+
+        self.assertIsNone(
+            read_snapshot(self.config_path, self.config, '1.7.5')
+        )
+
+
+def suite():
+    suite = makeSuite(TestConfigurationSnapshot, 'test')
+
+    return suite
@@ -1,10 +1,16 @@
+import os
+import tempfile
 from unittest import (
     makeSuite,
     TestCase
 )
 
+from stdm.data.configuration.exception import ConfigurationException
 from stdm.data.configuration.stdm_configuration import StdmConfiguration
-from stdm.settings.config_serializer import ConfigurationFileSerializer
+from stdm.settings.config_serializer import (
+    ConfigurationFileSerializer,
+    entity_load_order
+)
 
 from stdm.tests.data.utils import (
     create_alchemy_engine,
@@ -13,6 +19,10 @@ from stdm.tests.data.utils import (
 
 config_path = 'D:/Temp/Templates/test_writer.stc'
 
+NUM_DEPENDENT_ENTITIES = 300
+DEPENDENT_PROFILE = 'Dependent'
+
+
 class TestConfigurationSerializer(TestCase):
     def setUp(self):
         self.config = StdmConfiguration.instance()
@@ -38,7 +48,104 @@ class TestConfigurationSerializer(TestCase):
         self.assertTrue(read_result)
 
 
+def _dependent_configuration(version):
+    """
+    Creates a configuration whose entities reference the previous entity
+    and the entity at half their position, listed in the reverse order so
+    that every entity depends on entities further down the file.
+    """
+    relations = []
+    entities = []
+
+    for i in range(NUM_DEPENDENT_ENTITIES):
+        columns = [
+            '<Column name="id" TYPE_INFO="SERIAL" minimum="-2147483648" '
+            'maximum="2147483647"/>'
+        ]
+
+        for parent in set([i - 1, i / 2]):
+            if parent < 0 or parent == i:
+                continue
+
+            relation_name = 'fk_entity_{0}_entity_{1}'.format(parent, i)
+            relations.append(
+                '<EntityRelation name="{0}" parent="Entity{1}" '
+                'parentColumn="id" child="Entity{2}" '
+                'childColumn="entity_{1}_id" displayColumns=""/>'.format(
+                    relation_name, parent, i
+                )
+            )
+            columns.append(
+                '<Column name="entity_{0}_id" TYPE_INFO="FOREIGN_KEY" '
+                'minimum="0" maximum="2147483647">'
+                '<Relation name="{1}"/></Column>'.format(parent, relation_name)
+            )
+
+        entities.append(
+            '<Entity shortName="Entity{0}" name="dep_entity_{0}" '
+            'supportsDocuments="False"><Columns>{1}</Columns>'
+            '</Entity>'.format(i, ''.join(columns))
+        )
+
+    entities.reverse()
+
+    return '<Configuration version="{0}"><Profile name="{1}" ' \
+           'description="">{2}<Relations>{3}</Relations></Profile>' \
+           '</Configuration>'.format(
+        version,
+        DEPENDENT_PROFILE,
+        ''.join(entities),
+        ''.join(relations)
+    )
+
+
+class TestEntityLoadOrder(TestCase):
+    def test_parents_first(self):
+        dependencies = {
+            'household': ['person'],
+            'person': ['parcel'],
+            'parcel': []
+        }
+        load_order = entity_load_order(
+            ['household', 'person', 'parcel'],
+            dependencies
+        )
+
+        self.assertEqual(load_order, ['parcel', 'person', 'household'])
+
+    def test_circular_dependency(self):
+        dependencies = {
+            'household': ['person'],
+            'person': ['household']
+        }
+
+        with self.assertRaises(ConfigurationException) as cm:
+            entity_load_order(['household', 'person'], dependencies)
+
+        self.assertIn('household -> person -> household', str(cm.exception))
+
+    def test_load_dependent_entities(self):
+        config = StdmConfiguration.instance()
+
+        fd, path = tempfile.mkstemp(suffix='.stc')
+        with os.fdopen(fd, 'w') as config_file:
+            config_file.write(_dependent_configuration(config.VERSION))
+
+        try:
+            ConfigurationFileSerializer(path).load()
+
+        finally:
+            os.remove(path)
+
+        profile = config.profile(DEPENDENT_PROFILE)
+        for i in range(NUM_DEPENDENT_ENTITIES):
+            self.assertIn('Entity{0}'.format(i), profile.entities)
+
+        config.remove_profile(DEPENDENT_PROFILE)
+
+
 def suite():
     suite = makeSuite(TestConfigurationSerializer, 'test')
+    suite.addTest(makeSuite(TestEntityLoadOrder, 'test'))
 
     return suite
\ No newline at end of file
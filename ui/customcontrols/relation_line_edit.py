@@ -39,20 +39,21 @@ from PyQt4.QtCore import (
 from qgis.utils import (
     iface
 )
-from qgis.core import edit, QgsFeature, QgsExpression, QgsFeatureRequest
 
 from stdm.data.database import AdminSpatialUnitSet
 from stdm.data.configuration.columns import BaseColumn
 from stdm.data.configuration import entity_model
 from stdm.utils.util import entity_id_to_attr, code_columns
 from stdm.data.code_generator import CodeGenerator
+from stdm.data.expression_evaluator import (
+    entity_layer,
+    evaluate_column_value
+)
 from stdm.ui.admin_unit_selector import AdminUnitSelector
 from stdm.ui.admin_unit_manager import SELECT
 from stdm.ui.lookup_value_selector import LookupValueSelector
 from stdm.settings import current_profile
 
-from stdm.data.pg_utils import vector_layer
-
 class ForeignKeyLineEdit(QLineEdit):
     """
     Line edit that enables the browsing of related entities defined through
@@ -585,14 +586,46 @@ class AutoGeneratedLineEdit(ForeignKeyLineEdit):
             result = lookup_selector.exec_()
 
             if result == QDialog.Accepted:
-                self.current_item = lookup_selector
-                self._code = self.code_generator.generate(
+                code = self._generate_code(
                     lookup_selector.selected_code,
                     self.column.separator,
                     self.column.leading_zero
                 )
+                if code is None:
+                    return
+
+                self.current_item = lookup_selector
+                self._code = code
                 self.format_display()
 
+    def _generate_code(self, *args):
+        """
+        Generates the next code using the code generator.
+        :return: Returns the code or None if it could not be generated, in
+        which case the error is shown to the user.
+        :rtype: str
+        """
+        try:
+            return self.code_generator.generate(*args)
+
+        except Exception as ex:
+            QMessageBox.critical(
+                self,
+                QApplication.translate(
+                    'AutoGeneratedLineEdit',
+                    'Code Generation Error'
+                ),
+                u'{0}\n{1}'.format(
+                    QApplication.translate(
+                        'AutoGeneratedLineEdit',
+                        'The code could not be generated.'
+                    ),
+                    unicode(ex)
+                )
+            )
+
+            return None
+
     def set_code_from_code_column(self):
         """
         Creates code using a serial number created from a linked code column.
@@ -652,11 +685,15 @@ class AutoGeneratedLineEdit(ForeignKeyLineEdit):
             self._code = code
         else:
             # The prefix and separator should be '' for a serial.
-            self._code = self.code_generator.generate(
+            code = self._generate_code(
                 code,
                 self.column.column_separators[-1],
                 self.column.leading_zero
             )
+            if code is None:
+                return
+
+            self._code = code
 
         self.format_display()
 
@@ -682,12 +719,16 @@ class AutoGeneratedLineEdit(ForeignKeyLineEdit):
                 self.column.separator
             )
 
-            self._code = self.code_generator.generate(
+            code = self._generate_code(
                 self._admin_hierarchy_code,
                 self.column.separator,
                 self.column.leading_zero,
                 self.column.hide_prefix
             )
+            if code is None:
+                return
+
+            self._code = code
             self.format_display()
 
     def code(self):
@@ -704,12 +745,15 @@ class AutoGeneratedLineEdit(ForeignKeyLineEdit):
         """
         self.current_item = ''
         # The prefix and separator should be '' for a serial.
-        self._code = self.code_generator.generate(
+        code = self._generate_code(
             '',
             '',
             self.column.leading_zero
         )
-        self._code = self._code[1:]
+        if code is None:
+            return
+
+        self._code = code[1:]
         self.format_display()
 
 
@@ -760,45 +804,23 @@ class ExpressionLineEdit(QLineEdit):
         self._current_item = None
 
     def create_layer(self):
-        srid = None
-        column = ''
-        if self.entity.has_geometry_column():
-            geom_cols = [col.name for col in self.entity.columns.values()
-                         if col.TYPE_INFO == 'GEOMETRY']
-            column = geom_cols[0]
-            geom_col_obj = self.entity.columns[column]
-
-            if geom_col_obj.srid >= 100000:
-                srid = geom_col_obj.srid
-        layer = vector_layer(self.entity.name, geom_column=column,
-                             proj_wkt=srid)
-        return layer
+        """
+        :return: Returns the layer of the entity, which is shared by the
+        expression widgets of the entity.
+        :rtype: QgsVectorLayer
+        """
+        return entity_layer(self.entity)
 
     def get_feature_value(self, model=None):
-        self.layer.startEditing()
-        feature = None
-
-        request = QgsFeatureRequest()
+        """
+        :param model: Record whose value is evaluated. Defaults to the model
+        of the host form.
+        :return: Returns the value of the column expression for the record.
+        """
         if model is None:
             model = self.host.model()
-        request.setFilterFid(model.id)
-        feature_itr = self.layer.getFeatures(request)
-        for feat in feature_itr:
-            feature = feat
-            break
-
-        exp = QgsExpression(self.column.expression)
-
-        if exp.hasParserError():
-            raise Exception(exp.parserErrorString())
 
-        exp.prepare(self.layer.pendingFields())
-        if feature is not None:
-            value = exp.evaluate(feature)
-
-            return value
-        else:
-            return None
+        return evaluate_column_value(self.column, model.id)
 
     def set_button_minimum_size(self, button):
         """
@@ -840,8 +862,10 @@ class ExpressionLineEdit(QLineEdit):
         Slot raised to load browser for selecting foreign key entities. To be
         implemented by subclasses.
         """
-        self.format_display(self.get_feature_value(model))
-        return self.get_feature_value()
+        value = self.get_feature_value(model)
+        self.format_display(value)
+
+        return value
 
     def format_display(self, value):
         """
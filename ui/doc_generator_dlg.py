@@ -41,9 +41,14 @@ from PyQt4.QtCore import (
     QTimer
 )
 
+import stdm.data
 from stdm.settings import current_profile
 from stdm.data.configuration import entity_model
 from stdm.composer.document_generator import DocumentGenerator
+from stdm.composer.batch_renderer import (
+    BatchDocumentRenderer,
+    worker_count
+)
 from stdm.ui.progress_dialog import STDMProgressDialog
 from stdm.utils.util import (
     getIndex,
@@ -69,6 +74,9 @@ __all__ = ["DocumentGeneratorDialog", "EntityConfig"]
 
 LOGGER = logging.getLogger('stdm')
 
+#Minimum number of records that are rendered in worker processes
+PARALLEL_RENDER_MIN_RECORDS = 50
+
 class EntityConfig(object):
     """
     Configuration class for specifying
@@ -248,6 +256,9 @@ class DocumentGeneratorDialog(QDialog, Ui_DocumentGeneratorDialog):
 
         self._doc_generator = DocumentGenerator(self._iface, self)
 
+        #Renders large batches in worker processes
+        self._renderer = None
+
         self._data_source = ""
 
         enable_drag_sort(self.lstDocNaming)
@@ -612,64 +623,88 @@ class DocumentGeneratorDialog(QDialog, Ui_DocumentGeneratorDialog):
             self._doc_generator.set_attr_value_formatters(config.formatters())
 
         entity_field_name = "id"
+
+        record_ids = [record.id for record in records]
+
+        #Render large batches of individually named files in parallel
+        if self.chkUseOutputFolder.checkState() == Qt.Checked and \
+                not self.chk_template_datasource.isChecked() and \
+                len(record_ids) >= PARALLEL_RENDER_MIN_RECORDS and \
+                worker_count() > 1:
+            self._generate_in_workers(entity_field_name, record_ids,
+                                      outputMode, documentNamingAttrs,
+                                      fileExtension)
+
+            return
         
         #Iterate through the selected records
         progressDlg = QProgressDialog(self)
         progressDlg.setMaximum(len(records))
 
-        try:
-            QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
+        #Status of the records processed by the document generator
+        gen_state = {'failed': False, 'aborted': False}
+
+        def on_record_generated(index, count, status, msg):
+            progressDlg.setValue(index + 1)
 
-            for i, record in enumerate(records):
-                progressDlg.setValue(i)
+            if progressDlg.wasCanceled():
+                return False
 
-                if progressDlg.wasCanceled():
-                    success_status = False
-                    break
+            if not status:
+                gen_state['failed'] = True
+                result = QMessageBox.warning(self,
+                                             QApplication.translate("DocumentGeneratorDialog",
+                                                                    "Document Generate Error"),
+                                             msg, QMessageBox.Ignore | QMessageBox.Abort)
 
-                #User-defined location
-                if self.chkUseOutputFolder.checkState() == Qt.Unchecked:
-                    status,msg = self._doc_generator.run(self._docTemplatePath, entity_field_name,
-                                                  record.id, outputMode,
-                                                  filePath = self._outputFilePath)
-                    self._doc_generator.clear_temporary_layers()
-                #Output folder location using custom naming
-                else:
+                if result == QMessageBox.Abort:
+                    gen_state['aborted'] = True
 
-                    status, msg = self._doc_generator.run(self._docTemplatePath, entity_field_name,
-                                                    record.id, outputMode,
-                                                    dataFields = documentNamingAttrs,
-                                                    fileExtension = fileExtension,
-                                                    data_source = self.ds_entity.name)
-                    self._doc_generator.clear_temporary_layers()
+                    return False
 
-                if not status:
-                    result = QMessageBox.warning(self,
-                                                 QApplication.translate("DocumentGeneratorDialog",
-                                                                        "Document Generate Error"),
-                                                 msg, QMessageBox.Ignore | QMessageBox.Abort)
+            return True
 
-                    if result == QMessageBox.Abort:
-                        progressDlg.close()
-                        success_status = False
+        try:
+            QApplication.setOverrideCursor(QCursor(Qt.WaitCursor))
+
+            #User-defined location
+            if self.chkUseOutputFolder.checkState() == Qt.Unchecked:
+                status, msg = self._doc_generator.run_batch(
+                    self._docTemplatePath, entity_field_name, record_ids,
+                    outputMode, filePath=self._outputFilePath,
+                    feedback=on_record_generated
+                )
+            #Output folder location using custom naming
+            else:
+                status, msg = self._doc_generator.run_batch(
+                    self._docTemplatePath, entity_field_name, record_ids,
+                    outputMode, dataFields=documentNamingAttrs,
+                    fileExtension=fileExtension,
+                    data_source=self.ds_entity.name,
+                    feedback=on_record_generated
+                )
 
-                        #Restore cursor
-                        QApplication.restoreOverrideCursor()
+            if not status and not progressDlg.wasCanceled() and \
+                    not gen_state['aborted']:
+                QMessageBox.warning(self,
+                                    QApplication.translate("DocumentGeneratorDialog",
+                                                           "Document Generate Error"),
+                                    msg)
 
-                        return
+            if gen_state['failed'] or (not status and
+                                           not progressDlg.wasCanceled()):
+                progressDlg.close()
+                success_status = False
 
-                    #If its the last record and user has selected to ignore
-                    if i+1 == len(records):
-                        progressDlg.close()
-                        success_status = False
+                #Restore cursor
+                QApplication.restoreOverrideCursor()
 
-                        #Restore cursor
-                        QApplication.restoreOverrideCursor()
+                return
 
-                        return
+            if progressDlg.wasCanceled():
+                success_status = False
 
-                else:
-                    progressDlg.setValue(len(records))
+            progressDlg.setValue(len(records))
 
             QApplication.restoreOverrideCursor()
 
@@ -698,6 +733,91 @@ class DocumentGeneratorDialog(QDialog, Ui_DocumentGeneratorDialog):
         #Reset UI
         self.reset(success_status)
 
+    def _generate_in_workers(self, entity_field_name, record_ids,
+                             output_mode, data_fields, file_extension):
+        """
+        Renders the documents in a pool of worker processes. The dialog
+        remains responsive and the results are shown once all the workers
+        have exited.
+        """
+        failures = []
+
+        progress_dlg = QProgressDialog(
+            QApplication.translate('DocumentGeneratorDialog',
+                                   'Generating documents...'),
+            QApplication.translate('DocumentGeneratorDialog', 'Cancel'),
+            0,
+            len(record_ids),
+            self
+        )
+        progress_dlg.setWindowModality(Qt.WindowModal)
+
+        renderer = BatchDocumentRenderer(
+            stdm.data.app_dbconn,
+            getattr(self.plugin, 'config_path', None),
+            self
+        )
+        renderer.progress.connect(
+            lambda processed, total: progress_dlg.setValue(processed)
+        )
+        renderer.record_failed.connect(
+            lambda value, msg: failures.append((value, msg))
+        )
+        renderer.completed.connect(
+            lambda status: self._on_workers_completed(
+                status, failures, progress_dlg
+            )
+        )
+        progress_dlg.canceled.connect(renderer.cancel)
+
+        self._renderer = renderer
+        renderer.render(self._docTemplatePath, entity_field_name, record_ids,
+                        output_mode, dataFields=data_fields,
+                        fileExtension=file_extension,
+                        data_source=self.ds_entity.name)
+        progress_dlg.show()
+
+    def _on_workers_completed(self, status, failures, progress_dlg):
+        """
+        Slot raised when all the worker processes have exited.
+        :param status: False if the generation was cancelled.
+        :type status: bool
+        :param failures: List of tuples containing the record id and error
+        message of the records that could not be generated.
+        :type failures: list
+        """
+        progress_dlg.close()
+        self._renderer = None
+
+        if len(failures) > 0:
+            max_items = 20
+            details = [
+                u'{0}: {1}'.format(value, msg)
+                for value, msg in failures[:max_items]
+            ]
+            if len(failures) > max_items:
+                details.append(u'...')
+
+            QMessageBox.warning(
+                self,
+                QApplication.translate('DocumentGeneratorDialog',
+                                       'Document Generate Error'),
+                QApplication.translate(
+                    'DocumentGeneratorDialog',
+                    '{0} document(s) could not be generated:'
+                ).format(len(failures)) + u'\n' + u'\n'.join(details)
+            )
+
+        elif status:
+            QMessageBox.information(self,
+                QApplication.translate("DocumentGeneratorDialog",
+                                       "Document Generation Complete"),
+                QApplication.translate("DocumentGeneratorDialog",
+                                    "Document generation has successfully completed.")
+                                    )
+
+        self.reset(status and len(failures) == 0)
+
     def _dummy_template_records(self):
         """
         This is applied when records from a template data source are to be
@@ -31,6 +31,7 @@ from qgis.core import (
     QgsMapLayerRegistry,
     QgsCoordinateReferenceSystem
 )
+from sqlalchemy.exc import SQLAlchemyError
 
 from stdm.data.configuration import entity_model
 from stdm.data.configuration.columns import (
@@ -42,12 +43,12 @@ from stdm.data.configuration.entity import Entity
 from stdm.data.pg_utils import(
     table_column_names,
     qgsgeometry_from_wkbelement,
-    export_data,
-    fetch_from_table
+    export_data
 )
 
+from stdm.data.record_cache import clear_entity_record_caches
 from stdm.data.qtmodels import (
-    BaseSTDMTableModel,
+    EntityRecordsTableModel,
     VerticalHeaderSortFilterProxyModel
 )
 
@@ -82,6 +83,9 @@ from stdm.settings import get_entity_browser_record_limit
 __all__ = ["EntityBrowser", "EntityBrowserWithEditor",
            "ContentGroupEntityBrowser"]
 
+#Milliseconds to wait after the filter text has changed before querying
+FILTER_DELAY = 400
+
 class _EntityDocumentViewerHandler(object):
     """
     Class that loads the document viewer to display all documents
@@ -238,6 +242,15 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
         #Connect signals
         self.buttonBox.accepted.connect(self.onAccept)
         self.tbEntity.doubleClicked[QModelIndex].connect(self.onDoubleClickView)
+        self.tbEntity.horizontalHeader().sortIndicatorChanged.connect(
+            self._on_sort_indicator_changed
+        )
+
+        #Filter records in the database once the user stops typing
+        self._filter_timer = QTimer(self)
+        self._filter_timer.setSingleShot(True)
+        self._filter_timer.setInterval(FILTER_DELAY)
+        self._filter_timer.timeout.connect(self._apply_database_filter)
 
 
     def children_entities(self):
@@ -379,6 +392,9 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
             return
         try:
             if not self._dbmodel is None:
+                #Reload the parent and lookup records used by the formatters
+                clear_entity_record_caches(self._entity)
+
                 # cProfile.runctx('self._initializeData()', globals(), locals())
                 self._initializeData()
 
@@ -406,10 +422,21 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
         """
         self._notifBar.clear()
 
+    def _is_lazy_model(self):
+        #True if the records are fetched from the database page by page
+        return isinstance(self._tableModel, EntityRecordsTableModel)
+
     def recomputeRecordCount(self, init_data=False):
         '''
         Get the number of records in the specified table and updates the window title.
         '''
+        if self._is_lazy_model():
+            numRecords = self._tableModel.total_count(refresh=True)
+            self.current_records = self._tableModel.rowCount()
+            self._set_record_count_title(numRecords)
+
+            return numRecords
+
         entity = self._dbmodel()
 
         # Get number of records
@@ -421,17 +448,34 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
                 else:
                     self.current_records = numRecords
 
+        self._set_record_count_title(numRecords)
+
+        return numRecords
+
+    def _set_record_count_title(self, numRecords):
+        #Shows the number of loaded records in the window title
         rowStr = QApplication.translate('EntityBrowser', 'row') \
             if numRecords == 1 \
             else QApplication.translate('EntityBrowser', 'rows')
         showing = QApplication.translate('EntityBrowser', 'Showing')
+
+        #Large search results are estimated
+        if self._is_lazy_model() and self._tableModel.is_count_estimated():
+            numRecords = u'~{0}'.format(numRecords)
+
         windowTitle = u"{0} - {1} {2} of {3} {4}".format(
             self.title(), showing, self.current_records, numRecords, rowStr
         )
 
         self.setWindowTitle(windowTitle)
 
-        return numRecords
+    def _on_records_fetched(self, *args):
+        #Update the record count once a page of records has been fetched
+        if not self._is_lazy_model():
+            return
+
+        self.current_records = self._tableModel.rowCount()
+        self._set_record_count_title(self._tableModel.total_count())
 
     def _init_entity_columns(self):
         """
@@ -569,9 +613,14 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
 
                 self._doc_viewer.load(docs)
 
-    def _initializeData(self, filtered_records=None):
+    def _initializeData(self, filtered_records=None, search_count=None):
         '''
         Set table model and load data into it.
+        :param filtered_records: Search created by the advanced search.
+        :type filtered_records: EntitySearchQuery
+        :param search_count: Number of records matching the search and
+        True if it is an estimate.
+        :type search_count: tuple
         '''
         if self._dbmodel is None:
             msg = QApplication.translate(
@@ -590,87 +639,13 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
             # Load entity data. There might be a better way in future in order
             # to ensure that there is a balance between user data discovery
             # experience and performance.
-            if filtered_records is not None:
-                self.current_records = filtered_records.rowcount
-
-            numRecords = self.recomputeRecordCount(init_data=True)
+            if filtered_records is None:
+                self._load_records_on_demand()
 
-            # Load progress dialog
-            progressLabel = QApplication.translate(
-                "EntityBrowser", "Fetching Records..."
-            )
-            progressDialog = QProgressDialog(
-                progressLabel, None, 0, numRecords, self
-            )
-
-            QApplication.processEvents()
-            progressDialog.show()
-            progressDialog.setValue(0)
-
-            #Add records to nested list for enumeration in table model
-            load_data = True
-            if self.plugin is not None:
-                if self._entity.name in self.plugin.entity_table_model.keys():
-                    if filtered_records is None:
-                        self._tableModel = self.plugin.entity_table_model[
-                            self._entity.name
-                        ]
-                        #load_data = False
-                    #else:
-                        #load_data = True
-
-            if isinstance(self._parent, EntityEditorDialog):
-                load_data = True
-
-            if load_data:
-                # Only one filter is possible.
-                if filtered_records is not None:
-                    entity_records = filtered_records
-                else:
-                    entity_records = fetch_from_table(
-                        self._entity.name, limit=self.record_limit
-                    )
+            elif not self._load_filtered_records(filtered_records,
+                                                 search_count):
+                return
 
-            # if self._tableModel is None:
-                entity_records_collection = []
-                for i,er in enumerate(entity_records):
-                    if i == self.record_limit:
-                        break
-                    QApplication.processEvents()
-                    entity_row_info = []
-                    progressDialog.setValue(i)
-                    try:
-                        # for attr, attr_val in er.items():
-                            # print e
-                        for attr in self._entity_attrs:
-                            # attr_val = getattr(er, attr)
-                            attr_val = er[attr]
-
-                            # Check if there are display formatters and apply if
-                            # one exists for the given attribute.
-                            if attr_val is not None: # No need of formatter for None value
-                                if attr in self._cell_formatters:
-                                    formatter = self._cell_formatters[attr]
-                                    attr_val = formatter.format_column_value(attr_val)
-                            entity_row_info.append(attr_val)
-                    except Exception as ex:
-                        QMessageBox.critical(
-                            self,
-                            QApplication.translate(
-                                'EntityBrowser', 'Loading Records'
-                            ),
-                            unicode(ex.message))
-                        return
-
-                    entity_records_collection.append(entity_row_info)
-
-
-                self._tableModel = BaseSTDMTableModel(
-                    entity_records_collection, self._headers, self
-                )
-                if self.plugin is not None:
-                    self.plugin.entity_table_model[self._entity.name] = \
-                            self._tableModel
             # Add filter columns
             for header, info in self._searchable_columns.iteritems():
                 column_name, index = info['name'], info['header_index']
@@ -688,7 +663,17 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
                 self.set_proxy_model_filter_column(0)
 
             self.tbEntity.setModel(self._proxyModel)
-            if numRecords < self.record_limit:
+            if self._is_lazy_model():
+                #Records are sorted in the database
+                self.tbEntity.setSortingEnabled(False)
+                header = self.tbEntity.horizontalHeader()
+                header.setClickable(True)
+                header.setSortIndicatorShown(True)
+                header.blockSignals(True)
+                header.setSortIndicator(0, Qt.DescendingOrder)
+                header.blockSignals(False)
+
+            elif self._tableModel.rowCount() < self.record_limit:
                 self.tbEntity.setSortingEnabled(True)
                 self.tbEntity.sortByColumn(1, Qt.AscendingOrder)
 
@@ -707,12 +692,70 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
             if not self._select_item is None:
                 self._select_record(self._select_item)
 
+    def _load_records_on_demand(self):
+        """
+        Sets a table model that fetches the records of the entity from the
+        database in pages as the user scrolls through the table.
+        """
+        self._tableModel = EntityRecordsTableModel(
+            self._entity,
+            self._entity_attrs,
+            self._headers,
+            self._cell_formatters,
+            self
+        )
+        self._tableModel.rowsInserted.connect(self._on_records_fetched)
+        self._tableModel.fetchMore()
 
-            if numRecords > 0:
-                # Set maximum value of the progress dialog
-                progressDialog.setValue(numRecords)
-            else:
-                progressDialog.hide()
+        self.recomputeRecordCount()
+
+        if self.plugin is not None:
+            self.plugin.entity_table_model[self._entity.name] = \
+                self._tableModel
+
+    def _load_filtered_records(self, search_query, search_count=None):
+        """
+        Sets a table model that fetches the records matching the advanced
+        search from the database in pages as the user scrolls through the
+        table.
+        :param search_query: Search created by the advanced search.
+        :type search_query: EntitySearchQuery
+        :param search_count: Number of records matching the search and
+        True if it is an estimate, if already counted.
+        :type search_count: tuple
+        :return: Returns False if the records could not be loaded.
+        :rtype: bool
+        """
+        self._tableModel = EntityRecordsTableModel(
+            self._entity,
+            self._entity_attrs,
+            self._headers,
+            self._cell_formatters,
+            self,
+            search_query=search_query,
+            search_count=search_count
+        )
+        self._tableModel.rowsInserted.connect(self._on_records_fetched)
+
+        try:
+            self._tableModel.fetchMore()
+
+        except SQLAlchemyError as db_error:
+            QMessageBox.critical(
+                self,
+                QApplication.translate(
+                    'EntityBrowser', 'Loading Records'
+                ),
+                unicode(db_error)
+            )
+
+            return False
+
+        #Records matching the search are not counted again
+        self.current_records = self._tableModel.rowCount()
+        self._set_record_count_title(self._tableModel.total_count())
+
+        return True
 
     def _header_index_from_filter_combo_index(self, idx):
         col_info = self.cboFilterColumn.itemData(idx)
@@ -722,6 +765,13 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
     def set_proxy_model_filter_column(self, index):
         #Set the filter column for the proxy model using the combo index
         name, header_idx = self._header_index_from_filter_combo_index(index)
+
+        #Records fetched on demand are filtered in the database
+        if self._is_lazy_model():
+            self._proxyModel.setFilterKeyColumn(-1)
+
+            return
+
         self._proxyModel.setFilterKeyColumn(header_idx)
 
     def onFilterColumnChanged(self, index):
@@ -730,6 +780,9 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
         '''
         self.set_proxy_model_filter_column(index)
 
+        if self._is_lazy_model() and self.txtFilterPattern.text():
+            self._apply_database_filter()
+
     def _onFilterRegExpChanged(self,text):
         cProfile.runctx('self._onFilterRegExpChanged(text)', globals(), locals())
 
@@ -737,9 +790,33 @@ class EntityBrowser(SupportsManageMixin, QDialog, Ui_EntityBrowser):
         '''
         Slot raised whenever the filter text changes.
         '''
+        if self._is_lazy_model():
+            self._filter_timer.start()
+
+            return
+
         regExp = QRegExp(text,Qt.CaseInsensitive,QRegExp.FixedString)
         self._proxyModel.setFilterRegExp(regExp)
 
+    def _apply_database_filter(self):
+        #Reload the records that match the filter text from the database
+        if not self._is_lazy_model() or self.cboFilterColumn.count() == 0:
+            return
+
+        name, header_idx = self._header_index_from_filter_combo_index(
+            self.cboFilterColumn.currentIndex()
+        )
+        self._tableModel.set_filter(name, self.txtFilterPattern.text())
+        self._on_records_fetched()
+
+    def _on_sort_indicator_changed(self, section, order):
+        #Sort the records in the database when a header is clicked
+        if not self._is_lazy_model():
+            return
+
+        self._tableModel.sort(section, order)
+        self._on_records_fetched()
+
     def onDoubleClickView(self,modelindex):
         '''
         Slot raised upon double clicking the table view.
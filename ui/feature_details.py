@@ -46,6 +46,10 @@ from qgis.core import (
     NULL,
     QgsFeature
 )
+from sqlalchemy.orm import (
+    class_mapper,
+    subqueryload
+)
 
 from stdm.settings import current_profile
 
@@ -82,6 +86,9 @@ from ui_feature_details import Ui_DetailsDock
 
 DETAILS_DOCK_ON = False
 
+#Number of root nodes added at a time, the rest are added on request
+DETAILS_PAGE_SIZE = 100
+
 class LayerSelectionHandler(object):
     """
      Handles all tasks related to the layer.
@@ -118,22 +125,6 @@ class LayerSelectionHandler(object):
             for feature in selected_features:
                 if 'id' in field_names:
                     features.append(feature)
-            if len(features) > 40:
-                max_error = QApplication.translate(
-                    'LayerSelectionHandler',
-                    'You have exceeded the maximum number of features that \n'
-                    'can be selected and queried by Spatial Entity Details. \n'
-                    'Please select a maximum of 40 features.'
-                )
-
-                QMessageBox.warning(
-                    self.iface.mainWindow(),
-                    QApplication.translate(
-                        'LayerSelectionHandler', 'Maximum Features Error'
-                    ),
-                    max_error
-                )
-                return None
             return features
         else:
             return None
@@ -441,6 +432,121 @@ class DetailsDBHandler:
 
         return result
 
+    def feature_models_by_id(self, entity, ids):
+        """
+        Gets the models of an entity in one query.
+        :param entity: Entity
+        :type entity: Object
+        :param ids: Ids of the records
+        :type ids: List
+        :return: The models indexed by id
+        :rtype: Dictionary
+        """
+        if len(ids) == 0:
+            return {}
+
+        model = entity_model(entity)
+        result = model().queryObject().filter(model.id.in_(ids)).all()
+
+        return dict([(m.id, m) for m in result])
+
+    def _str_links(self, str_column, ids):
+        """
+        Gets the STR records referencing the ids in one query. The related
+        parties and spatial units are loaded together with the STR records
+        instead of one query per record.
+        :param str_column: The STR column referencing the party or
+        spatial unit.
+        :type str_column: String
+        :param ids: The ids of the parties or spatial units
+        :type ids: List
+        :return: The list of STR records indexed by id
+        :rtype: Dictionary
+        """
+        links = dict([(i, []) for i in ids])
+        if len(ids) == 0:
+            return links
+
+        social_tenure = self.current_profile.social_tenure
+        str_model = entity_model(social_tenure)
+        related_names = [
+            e.name for e in
+            social_tenure.parties + social_tenure.spatial_units
+        ]
+        relationships = [
+            name for name in class_mapper(str_model).relationships.keys()
+            if name in related_names
+        ]
+
+        col_obj = getattr(str_model, str_column)
+        result = str_model().queryObject().filter(
+            col_obj.in_(ids)
+        ).options(
+            *[subqueryload(name) for name in relationships]
+        ).order_by(str_model.id).all()
+
+        for record in result:
+            links.setdefault(getattr(record, str_column), []).append(record)
+
+        return links
+
+    def feature_str_links(self, feature_ids, entity=None):
+        """
+        Gets the STR records linked to spatial units in one query.
+        :param feature_ids: The ids of the spatial units
+        :type feature_ids: List
+        :return: The list of social tenure records indexed by feature id
+        :rtype: Dictionary
+        """
+        if entity is None:
+            entity = self._entity
+        spatial_unit_entity_id = '{}_id'.format(
+            entity.short_name.replace(' ', '_').lower())
+
+        return self._str_links(spatial_unit_entity_id, feature_ids)
+
+    def party_str_links(self, party_entity, party_ids):
+        """
+        Gets the STR records linked to parties in one query.
+        :param party_ids: The ids of the parties
+        :type party_ids: List
+        :return: The list of social tenure records indexed by party id
+        :rtype: Dictionary
+        """
+        party_entity_id = u'{}_id'.format(
+            party_entity.name.split(self.current_profile.prefix)[1]
+        ).lstrip('_')
+
+        return self._str_links(party_entity_id, party_ids)
+
+    def custom_attr_models(self, custom_attr_entity, str_ids):
+        """
+        Gets the custom tenure information of STR records in one query.
+        :param custom_attr_entity: The custom attribute entity
+        :type custom_attr_entity: Object
+        :param str_ids: The ids of the STR records
+        :type str_ids: List
+        :return: The first custom attribute model of each STR record, or
+        None, indexed by STR id
+        :rtype: Dictionary
+        """
+        models = dict([(i, None) for i in str_ids])
+        if len(str_ids) == 0:
+            return models
+
+        model = entity_model(custom_attr_entity)
+        str_col_obj = model.social_tenure_relationship_id
+        result = model().queryObject().filter(
+            str_col_obj.in_(str_ids)
+        ).order_by(model.id).all()
+
+        for custom_attr_model in result:
+            str_id = custom_attr_model.social_tenure_relationship_id
+            if models.get(str_id, None) is None:
+                models[str_id] = custom_attr_model
+
+        return models
+
     def column_widget_registry(self, model, entity):
         """
         Registers the column widgets using the model and the entity.
@@ -631,6 +737,14 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
         self.party_items = {}
         self._selected_features = []
         self.spatial_unit_items = {}
+        # Roots whose children are added when they are expanded
+        self._pending_roots = {}
+        # Roots that are added when load more is clicked
+        self._remaining_roots = []
+        self._root_source = None
+        self._load_more_item = None
+        self._root_ids = []
+        self._custom_attr_models = {}
         self.model = QStandardItemModel()
         self.view.setModel(self.model)
         self.view.setUniformRowHeights(True)
@@ -641,6 +755,8 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
         self.view.setEditTriggers(
             QAbstractItemView.NoEditTriggers
         )
+        self.view.expanded.connect(self.on_node_expanded)
+        self.view.clicked.connect(self.on_load_more_clicked)
         self.str_text = QApplication.translate(
             'DetailsTreeView',
             'Social Tenure Relationship'
@@ -852,6 +968,10 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
         """
         # clear feature_ids list, model and highlight
         self.model.clear()
+        self._pending_roots.clear()
+        self._remaining_roots[:] = []
+        self._load_more_item = None
+        self._custom_attr_models.clear()
 
         self.clear_sel_highlight()  # remove sel_highlight
         self.disable_buttons(False)
@@ -890,7 +1010,6 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
         """
         Shows the treeview.
         """
-        str_records = []
         if not DETAILS_DOCK_ON:
             return
         if self._selected_features is None:
@@ -917,35 +1036,11 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
         ### add non entity layer for views.
         if not self.entity is None:
             self.reset_tree_view(self._selected_features)
-            roots = self.add_parent_tree(
-                layer_icon, format_name(self.entity.short_name)
+            self.load_roots(
+                self.entity, self._selected_features, layer_icon,
+                format_name(self.entity.short_name)
             )
 
-            if roots is None:
-                return
-            for id, root in roots.iteritems():
-
-                if isinstance(id, QgsFeature):
-                    id = id.id()
-                if not isinstance(id, long):
-                    continue
-                if self.entity in self.social_tenure.spatial_units:
-                    str_records = self.feature_str_link(id)
-
-                self.spatial_unit_items[root] = self.entity
-                if len(str_records) > 0:
-                    db_model = getattr(str_records[0], self.entity.name)
-
-                else:
-                    data = self.features_data(id)
-
-                    if len(self.features_data(id)) > 0:
-                        db_model = data[0]
-                    else:
-                        db_model = self.feature_model(self.entity, id)
-
-                self.add_root_children(db_model, root, str_records)
-
         else:
             self.reset_tree_view(self._selected_features)
             self.disable_buttons(True)
@@ -953,57 +1048,206 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
 
         self.zoom_to_selected(self.layer)
 
-    def search_spatial_unit(self, entity, spatial_unit_ids):
+    def search_spatial_unit(self, entity, spatial_unit_ids,
+                            valid_str_ids=None):
         """
         Shows the treeview.
+        :param valid_str_ids: Ids of the STR records to show, all the STR
+        records are shown if None.
+        :type valid_str_ids: set
         """
         self.reset_tree_view()
         layer_icon = QIcon(':/plugins/stdm/images/icons/layer.gif')
-        ### add non entity layer for views.
 
-        # self.reset_tree_view(selected_features)
+        self.load_roots(
+            entity, spatial_unit_ids, layer_icon,
+            unicode(entity.short_name), valid_str_ids=valid_str_ids
+        )
+
+    def search_party(self, entity, party_ids, valid_str_ids=None):
+        """
+        Shows the treeview.
+        :param valid_str_ids: Ids of the STR records to show, all the STR
+        records are shown if None.
+        :type valid_str_ids: set
+        """
+        self.reset_tree_view()
+        table_icon = QIcon(':/plugins/stdm/images/icons/table.png')
+
+        self.load_roots(
+            entity, party_ids, table_icon, unicode(entity.short_name),
+            party_query=True, valid_str_ids=valid_str_ids
+        )
+
+    def load_roots(self, entity, records, icon, title, party_query=False,
+                   valid_str_ids=None):
+        """
+        Adds the root items of the records a page at a time. The records of
+        a page are fetched in a few queries and the children of a root are
+        only added when it is expanded.
+        :param entity: The entity of the records.
+        :type entity: Object
+        :param records: The ids or features of the records.
+        :type records: List
+        :param icon: The icon of the root items.
+        :type icon: QIcon
+        :param title: The title of the root items.
+        :type title: String
+        :param party_query: True if the records are parties.
+        :type party_query: Boolean
+        :param valid_str_ids: Ids of the STR records to show, all the STR
+        records are shown if None.
+        :type valid_str_ids: set
+        """
+        self._root_source = entity, icon, title, party_query, valid_str_ids
+        self._remaining_roots = list(records)
+        self._root_ids = [
+            r.id() if isinstance(r, QgsFeature) else r for r in records
+        ]
+
+        self.add_root_page()
+
+        # Show the details of a single record straight away
+        if len(self._root_ids) == 1 and self.model.rowCount() > 0:
+            root = self.model.item(0, 0)
+            if root in self._pending_roots:
+                self.load_root_children(root)
+
+    def add_root_page(self):
+        """
+        Adds the next page of root items followed by the load more item if
+        there are more records.
+        """
+        if self._root_source is None:
+            return
+        entity, icon, title, party_query, valid_str_ids = self._root_source
+
+        if self._load_more_item is not None:
+            self.model.removeRow(self._load_more_item.row())
+            self._load_more_item = None
+
+        page = self._remaining_roots[:DETAILS_PAGE_SIZE]
+        del self._remaining_roots[:DETAILS_PAGE_SIZE]
+
+        ids = [r.id() if isinstance(r, QgsFeature) else r for r in page]
+        models = self.feature_models_by_id(entity, ids)
+
+        if party_query:
+            str_links = self.party_str_links(entity, ids)
+        elif entity in self.social_tenure.spatial_units:
+            str_links = self.feature_str_links(ids, entity)
+        else:
+            str_links = {}
+        self._prefetch_custom_attributes(str_links.values())
 
-        for spu_id in spatial_unit_ids:
+        for record, id in zip(page, ids):
+            db_model = models.get(id, None)
+            if db_model is None:
+                continue
 
-            root = QStandardItem(layer_icon, unicode(entity.short_name))
-            self.spatial_unit_items[root] = entity
-            root.setData(spu_id)
+            root = QStandardItem(icon, title)
+            root.setData(record)
             self.set_bold(root)
             self.model.appendRow(root)
 
-            str_records = self.feature_str_link(spu_id, entity)
+            if party_query:
+                self.party_items[root] = entity
+            else:
+                self.spatial_unit_items[root] = entity
 
+            str_records = self._valid_str_records(
+                str_links.get(id, []), valid_str_ids
+            )
+            self.feature_models[id] = db_model
             if len(str_records) > 0:
-                db_model = getattr(str_records[0], entity.name)
+                self.feature_str_model[id] = [s.id for s in str_records]
 
-            else:
-                db_model = self.feature_model(entity, spu_id)
+            # Placeholder so that the root can be expanded
+            self._pending_roots[root] = db_model, str_records, party_query
+            loading_item = QStandardItem(
+                QApplication.translate('DetailsTreeView', 'Loading...')
+            )
+            loading_item.setSelectable(False)
+            root.appendRow([loading_item])
 
-            self.add_root_children(db_model, root, str_records)
+        if len(self._remaining_roots) > 0:
+            load_more_msg = QApplication.translate(
+                'DetailsTreeView',
+                'Load more... ({0} of {1} records shown)'
+            ).format(
+                len(self._root_ids) - len(self._remaining_roots),
+                len(self._root_ids)
+            )
+            self._load_more_item = QStandardItem(load_more_msg)
+            self._load_more_item.setSelectable(False)
+            self.model.appendRow(self._load_more_item)
 
-    def search_party(self, entity, party_ids):
+    def _prefetch_custom_attributes(self, str_record_lists):
         """
-        Shows the treeview.
+        Fetches the custom tenure information of the STR records, one query
+        per custom attribute entity.
+        :param str_record_lists: Lists of STR records.
+        :type str_record_lists: List
         """
-        self.reset_tree_view()
-        table_icon = QIcon(':/plugins/stdm/images/icons/table.png')
-        ### add non entity layer for views.
+        str_ids = [s.id for records in str_record_lists for s in records]
+        if len(str_ids) == 0:
+            return
 
-        for spu_id in party_ids:
-            str_records = self.party_str_link(entity, spu_id)
+        for spatial_unit in self.spatial_units:
+            custom_attr_entity = self.social_tenure.spu_custom_attribute_entity(
+                spatial_unit
+            )
+            if custom_attr_entity is None or \
+                    len(custom_attr_entity.columns) <= 2:
+                continue
+            try:
+                models = self.custom_attr_models(custom_attr_entity, str_ids)
+            except Exception:
+                continue
 
-            root = QStandardItem(table_icon, unicode(entity.short_name))
-            self.party_items[root] = entity
-            root.setData(spu_id)
-            self.set_bold(root)
-            self.model.appendRow(root)
+            for str_id, custom_attr_model in models.iteritems():
+                self._custom_attr_models[
+                    (custom_attr_entity.name, str_id)
+                ] = custom_attr_model
 
-            if len(str_records) > 0:
-                db_model = getattr(str_records[0], entity.name)
-            else:
-                db_model = self.feature_model(entity, spu_id)
+    def load_root_children(self, root):
+        """
+        Replaces the placeholder of a root item with its children.
+        :param root: The root item.
+        :type root: QStandardItem
+        """
+        db_model, str_records, party_query = self._pending_roots.pop(root)
+        root.removeRows(0, root.rowCount())
+        self.add_root_children(db_model, root, str_records, party_query)
 
-            self.add_root_children(db_model, root, str_records, True)
+    def on_node_expanded(self, index):
+        """
+        A slot raised when an item is expanded. Adds the children of the
+        item if they have not been added.
+        :param index: The index of the expanded item.
+        :type index: QModelIndex
+        """
+        item = self.model.itemFromIndex(index)
+        if item in self._pending_roots:
+            self.load_root_children(item)
+
+    def on_load_more_clicked(self, index):
+        """
+        A slot raised when an item is clicked. Adds the next page of root
+        items if the load more item is clicked.
+        :param index: The index of the clicked item.
+        :type index: QModelIndex
+        """
+        if self._load_more_item is None:
+            return
+        if self.model.itemFromIndex(index) is self._load_more_item:
+            self.add_root_page()
+
+    def _valid_str_records(self, str_records, valid_str_ids):
+        if valid_str_ids is None:
+            return str_records
+
+        return [s for s in str_records if s.id in valid_str_ids]
 
     def add_non_entity_parent(self, layer_icon):
         """
@@ -1285,13 +1529,19 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
                     )
 
                     if custom_attr_entity is not None and len(custom_attr_entity.columns) > 2:
-                        try:
-                            custom_attr_model = entity_attr_to_model(
-                                custom_attr_entity,
-                                'social_tenure_relationship_id', record_dict['id']
-                            )
-                        except Exception:
-                            custom_attr_model = None
+                        custom_attr_key = custom_attr_entity.name, record.id
+                        if custom_attr_key in self._custom_attr_models:
+                            custom_attr_model = self._custom_attr_models[
+                                custom_attr_key
+                            ]
+                        else:
+                            try:
+                                custom_attr_model = entity_attr_to_model(
+                                    custom_attr_entity,
+                                    'social_tenure_relationship_id', record_dict['id']
+                                )
+                            except Exception:
+                                custom_attr_model = None
 
                         if custom_attr_model is not None:
                             custom_attr_root = self.add_custom_attr_child(
@@ -1782,6 +2032,8 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
                     id = id.id()
 
                 del self.feature_models[id]
+                if id in self._root_ids:
+                    self._root_ids.remove(id)
 
             remaining_str = len(self.str_models)
 
@@ -1801,7 +2053,7 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
         # remove rows before adding the updated ones.
         if self.plugin is not None:
             self.layer.selectByIds(
-                self.feature_models.keys()
+                self._root_ids
             )
         root = self.find_root(entity, feature_id)
         if root is None:
@@ -1845,9 +2097,9 @@ class DetailsTreeView(DetailsDBHandler, DetailsDockWidget):
         :type remaining_str: Integer
         """
         if not str_edit:
-            if len(self.feature_models) > 1:
+            if len(self._root_ids) > 1:
                 self.refresh_layers()
-            feature_ids = self.feature_models.keys()
+            feature_ids = list(self._root_ids)
             self.layer.selectByIds(
                 feature_ids
             )
@@ -19,9 +19,14 @@ email                : stdm@unhabitat.org
 """
 from collections import OrderedDict
 import uuid
+import logging
+
 from PyQt4.QtCore import (
     Qt,
-    pyqtSignal
+    pyqtSignal,
+    pyqtSlot,
+    QObject,
+    QThread
 )
 
 from PyQt4.QtGui import (
@@ -46,9 +51,9 @@ from stdm.data.configuration.columns import (
     MultipleSelectColumn,
     VirtualColumn
 )
-from sqlalchemy.sql.expression import text
 from stdm.data.mapping import MapperMixin
-from stdm.data.pg_utils import table_column_names, fetch_with_filter
+from stdm.data.pg_utils import table_column_names
+from stdm.data.search_query import EntitySearchQuery
 from stdm.utils.util import entity_display_columns, format_name, simple_dialog
 from stdm.ui.forms.widgets import (
     ColumnWidgetRegistry,
@@ -60,12 +65,19 @@ from stdm.ui.notification import NotificationBar
 
 from editor_dialog import EntityEditorDialog
 
+LOGGER = logging.getLogger('stdm')
+
+
 class AdvancedSearch(EntityEditorDialog):
     def __init__(self, entity, parent):
 
         EntityEditorDialog.__init__(self, entity, parent=parent)
         self.parent = parent
 
+        # Search waiting for its indexes to be created
+        self._pending_search = None
+        self._index_worker = None
+
     def _init_gui(self):
         # Setup base elements
         self.gridLayout = QGridLayout(self)
@@ -180,64 +192,66 @@ class AdvancedSearch(EntityEditorDialog):
                 value = handler.value()
                 if value != handler.default() and bool(value):
                     search_data[column.name] = value
-        # self.search_db(search_data)
-        result = self.search_db_raw(search_data)
         self.parent._tableModel.removeRows(0, self.parent._tableModel.rowCount())
-        if result is not None:
-            found = QApplication.translate('AdvancedSearch', 'records found')
-            new_title = '{} - {} {}'.format(self.title, result.rowcount, found)
-            if result.rowcount > 3000:
-                title = QApplication.translate(
-                        'AdvancedSearch',
-                        'Advanced Search'
-                )
-                message = QApplication.translate(
-                    'AdvancedSearch',
-                    'The search result returned {0} records, which is above the '
-                    'search result limit. <br>Would you like to see the first 3000 '
-                    'records?'.format("{:,}".format(result.rowcount ))
-                )
-
-                res, chk_result = simple_dialog(self, title, message)
-                if res:
-                    self.setWindowTitle(new_title)
-                    self.parent._initializeData(result)
-                else:
-                    return
 
-            else:
-                self.setWindowTitle(new_title)
-                self.parent._initializeData(result)
-
-    def search_db(self, search_data):
-        ent_model_obj = self.ent_model()
-        # query = ent_model_obj.queryObject()
-        for attr, value in search_data.iteritems():
-            ent_model_obj.queryObject().filter(
-                getattr(self.ent_model(), attr) == value)
-
-        # now we can run the query
-        # print ent_model_obj.queryObject(), vars(ent_model_obj.queryObject())
-        # print str(ent_model_obj.queryObject())
-        results = ent_model_obj.queryObject().all()
-
-    def search_db_raw(self, search_data):
-        sql = u"SELECT * FROM {} WHERE ".format(self._entity.name)
-        # query = ent_model_obj.queryObject()
-        param = []
-        if len(search_data) == 0:
-            return None
-        for attr, value in search_data.iteritems():
-            if isinstance(value, (int, float)):
-                param.append(u'{} = {}'.format(unicode(attr), unicode(value)))
-            if isinstance(value, (unicode, str)):
-                param.append(u"{} = '{}'".format(unicode(attr), unicode(value)))
-        final_sql = u'{} {}'.format(sql, ' AND '.join(param))
-        # sql_text = text(final_sql)
-        results = fetch_with_filter(final_sql)
-        # now we can run the query
-
-        return results
+        search_query = self.search_query(search_data)
+        if search_query.is_empty():
+            return
+
+        # The search runs once its indexes have been created in a worker
+        # thread
+        self.search.setEnabled(False)
+        self._pending_search = search_query
+
+        index_thread = QThread(self)
+        self._index_worker = SearchIndexWorker(search_query)
+        self._index_worker.moveToThread(index_thread)
+
+        index_thread.started.connect(self._index_worker.create_indexes)
+        self._index_worker.error.connect(self._on_index_error)
+        self._index_worker.finished.connect(self._on_indexes_created)
+        self._index_worker.finished.connect(index_thread.quit)
+        index_thread.finished.connect(self._index_worker.deleteLater)
+        index_thread.finished.connect(index_thread.deleteLater)
+
+        index_thread.start()
+
+    def _on_index_error(self, error):
+        # The search still runs without the indexes
+        LOGGER.debug(u'Advanced search indexes could not be created. '
+                     u'{0}'.format(error))
+
+    def _on_indexes_created(self):
+        search_query = self._pending_search
+        self._pending_search = None
+        self.search.setEnabled(True)
+
+        if search_query is None:
+            return
+
+        # Matching records are fetched page by page by the browser, the
+        # count is passed on so that the records are only counted once
+        count, estimated = search_query.count()
+
+        found = QApplication.translate('AdvancedSearch', 'records found')
+        count_text = count
+        if estimated:
+            count_text = u'~{}'.format("{:,}".format(count))
+        new_title = u'{} - {} {}'.format(self.title, count_text, found)
+
+        self.setWindowTitle(new_title)
+        self.parent._initializeData(search_query, (count, estimated))
+
+    def search_query(self, search_data):
+        """
+        Creates the search for records matching the values entered in the
+        form. The values are passed to the database as bound parameters.
+        :param search_data: Search values indexed by column name.
+        :type search_data: dict
+        :return: Returns the search query.
+        :rtype: EntitySearchQuery
+        """
+        return EntitySearchQuery(self._entity, search_data)
 
     def _setup_columns_content_area(self):
         # Only use this if entity supports documents
@@ -324,3 +338,29 @@ class AdvancedSearch(EntityEditorDialog):
         Checks the dirty state first before closing.
         '''
         self.reject()
+
+
+class SearchIndexWorker(QObject):
+    """
+    Worker for creating the indexes used by an advanced search.
+    """
+    finished = pyqtSignal()
+    error = pyqtSignal(unicode)
+
+    def __init__(self, search_query, parent=None):
+        QObject.__init__(self, parent)
+        self._search_query = search_query
+
+    @pyqtSlot()
+    def create_indexes(self):
+        """
+        Creates the indexes used by the search conditions if they do not
+        exist.
+        """
+        try:
+            self._search_query.ensure_indexes()
+
+        except Exception as ex:
+            self.error.emit(unicode(ex))
+
+        self.finished.emit()
@@ -48,6 +48,7 @@ from stdm.data.configuration.columns import (
 )
 from stdm.data.mapping import MapperMixin
 from stdm.data.pg_utils import table_column_names
+from stdm.data.record_cache import clear_entity_record_caches
 from stdm.utils.util import format_name
 from stdm.ui.forms.widgets import (
     ColumnWidgetRegistry,
@@ -149,6 +150,9 @@ class EntityEditorDialog(QDialog, MapperMixin):
 
         self.collect_model = collect_model
 
+        #Reload the parent and lookup records displayed by the widgets
+        clear_entity_record_caches(self._entity)
+
         self.register_column_widgets()
         try:
             if isinstance(parent._parent, EntityEditorDialog):
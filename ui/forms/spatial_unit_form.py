@@ -67,6 +67,7 @@ from stdm.data.database import (
     STDMDb
 )
 from stdm.data.configuration import entity_model
+from stdm.data.expression_evaluator import evaluate_column
 
 from stdm.ui.forms.widgets import ColumnWidgetRegistry
 
@@ -615,15 +616,20 @@ class STDMFieldWidget():
         entity_obj.saveMany(
             self.feature_models.values()
         )
-        for model in self.feature_models.values():
-            STDMDb.instance().session.flush()
-
-            for attrMapper in self.editor._attrMappers:
-                control = attrMapper.valueHandler().control
-                if isinstance(control, ExpressionLineEdit):
-                    value = control.on_expression_triggered(model)
-                    print attrMapper._attrName, value
-                    setattr(model, attrMapper._attrName, value)
+        STDMDb.instance().session.flush()
+        models = self.feature_models.values()
+        model_ids = [model.id for model in models]
+
+        # Evaluate each expression for all the saved features at once
+        for attrMapper in self.editor._attrMappers:
+            control = attrMapper.valueHandler().control
+            if isinstance(control, ExpressionLineEdit):
+                values = evaluate_column(control.column, model_ids)
+                for model in models:
+                    setattr(model, attrMapper._attrName,
+                            values.get(model.id, None))
+
+        for model in models:
             model.update()
 
         # Save child models
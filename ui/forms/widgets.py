@@ -58,7 +58,6 @@ from stdm.data.configuration.columns import (
     AutoGeneratedColumn,
     ExpressionColumn
 )
-from stdm.data.configuration import entity_model
 from stdm.settings import current_profile
 from stdm.ui.customcontrols.relation_line_edit import (
     AdministrativeUnitLineEdit,
@@ -66,9 +65,7 @@ from stdm.ui.customcontrols.relation_line_edit import (
     AutoGeneratedLineEdit,
     ExpressionLineEdit
 )
-from stdm.data.pg_utils import(
-    export_data
-)
+from stdm.data.record_cache import display_record_cache
 
 from stdm.ui.customcontrols.multi_select_view import MultipleSelectTreeView
 
@@ -350,6 +347,15 @@ class ColumnWidgetRegistry(object):
         """
         return unicode(value)
 
+    def prefetch_column_values(self, values):
+        """
+        Loads any data required to format the given column values in as
+        few queries as possible. Default implementation does nothing.
+        :param values: Column values that will be formatted.
+        :type values: list
+        """
+        pass
+
 
 class VarCharWidgetFactory(ColumnWidgetRegistry):
     """
@@ -584,9 +590,6 @@ class RelatedEntityWidgetFactory(ColumnWidgetRegistry):
     def __init__(self, column):
         ColumnWidgetRegistry.__init__(self, column)
 
-        self._parent_entity_cache = {}
-
-        #Query all parent entities. Need for optimization
         p_entity = self._column.entity_relation.parent
 
         if p_entity is None:
@@ -597,13 +600,11 @@ class RelatedEntityWidgetFactory(ColumnWidgetRegistry):
             )
             raise WidgetException(msg)
 
-        self._p_entity_cls = entity_model(p_entity, entity_only=True)
-        self._p_entity_obj = self._p_entity_cls()
-
-        # res = self._p_entity_obj.queryObject().filter().all()
-        res = export_data(p_entity.name)
-        for r in res:
-            self._parent_entity_cache[r.id] = r
+        #Parent records are shared by all factories of the parent entity
+        self._parent_entity_cache = display_record_cache(
+            p_entity.name,
+            self._column.entity_relation.display_cols
+        )
 
     @classmethod
     def _create_widget(cls, c, parent, host=None):
@@ -621,24 +622,21 @@ class RelatedEntityWidgetFactory(ColumnWidgetRegistry):
         :return: Display extracted from the selected parent record.
         :rtype: str
         """
-        if value in self._parent_entity_cache:
-            rec = self._parent_entity_cache[value]
-
-        else:
-            #Query value
-            rec = self._p_entity_obj.queryObject().filter(
-                self._p_entity_cls.id == value
-            ).first()
-
-            if rec is None:
-                return ''
+        rec = self._parent_entity_cache.record(value)
 
-            else:
-                #Add to cache
-                self._parent_entity_cache[rec.id] = rec
+        if rec is None:
+            return ''
 
         return RelatedEntityLineEdit.process_display(self._column, rec)
 
+    def prefetch_column_values(self, values):
+        """
+        Fetches the parent records that are not in the cache in batches.
+        :param values: Primary key values of the parent entity.
+        :type values: list
+        """
+        self._parent_entity_cache.fetch(values)
+
 RelatedEntityWidgetFactory.register()
 
 
@@ -653,17 +651,9 @@ class AdministrativeUnitWidgetFactory(ColumnWidgetRegistry):
 
         ColumnWidgetRegistry.__init__(self, column)
 
-        self._aus_cache = {}
-
-        #Query all admin units on initializing
+        #Admin units are shared by all factories in the profile
         aus = self._column.entity.profile.administrative_spatial_unit
-        self._aus_cls = entity_model(aus, entity_only=True)
-        self._aus_obj = self._aus_cls()
-
-        # res = self._aus_obj.queryObject().filter().all()
-        res = export_data(aus.name)
-        for r in res:
-            self._aus_cache[r.id] = [r.name, r.code]
+        self._aus_cache = display_record_cache(aus.name, ['name', 'code'])
 
     @classmethod
     def _create_widget(cls, c, parent, host=None):
@@ -680,24 +670,13 @@ class AdministrativeUnitWidgetFactory(ColumnWidgetRegistry):
         :return: Name and code corresponding to the given id.
         :rtype: str
         """
-        if value in self._aus_cache:
-            nc = self._aus_cache[value]
-            name, code = nc[0], nc[1]
+        res = self._aus_cache.record(value)
 
-        else:
-            #Query value
-            res = self._aus_obj.queryObject().filter(
-                self._aus_cls.id == value
-            ).first()
+        if res is None:
+            return ''
 
-            if res is None:
-                return ''
+        name, code = res.name, res.code
 
-            else:
-                #Add result to the cache
-                self._aus_cache[res.id] = res
-                name, code = res.name, res.code
-        
         if code:
             if 'code' not in self._column.entity_relation.display_cols:
                 name = u'{0}'.format(name)
@@ -706,6 +685,14 @@ class AdministrativeUnitWidgetFactory(ColumnWidgetRegistry):
 
         return name
 
+    def prefetch_column_values(self, values):
+        """
+        Fetches the admin units that are not in the cache in batches.
+        :param values: Primary key values of the administrative units.
+        :type values: list
+        """
+        self._aus_cache.fetch(values)
+
 AdministrativeUnitWidgetFactory.register()
 
 
@@ -740,16 +727,12 @@ class LookupWidgetFactory(ColumnWidgetRegistry):
     def __init__(self, column):
         ColumnWidgetRegistry.__init__(self, column)
 
-        self._lookups = {}
-
-        #Query all lookups on initializing so as to reduce db roundtrips
+        #Lookup values are shared by all factories of the value list
         lookup = self._column.value_list
-        # lk_cls = entity_model(lookup, entity_only=True)
-        # lk_obj = lk_cls()
-        # res = lk_obj.queryObject().filter().all()
-        res = export_data(lookup.name)
-        for r in res:
-            self._lookups[r.id] = [r.value, r.code]
+        self._lookup_cache = display_record_cache(
+            lookup.name,
+            ['value', 'code']
+        )
 
     def lookups(self):
         """
@@ -758,7 +741,11 @@ class LookupWidgetFactory(ColumnWidgetRegistry):
         first item and code is the second.
         :rtype: dict
         """
-        return self._lookups
+        lookups = OrderedDict()
+        for r in self._lookup_cache.records():
+            lookups[r.id] = [r.value, r.code]
+
+        return lookups
 
     def code_value(self, id):
         """
@@ -769,9 +756,10 @@ class LookupWidgetFactory(ColumnWidgetRegistry):
         otherwise None.
         :rtype: tuple
         """
-        if id in self._lookups:
-            item = self._lookups[id]
-            return item[0], item[1]
+        rec = self._lookup_cache.record(id)
+
+        if not rec is None:
+            return rec.value, rec.code
 
         return None
 
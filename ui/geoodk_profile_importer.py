@@ -20,6 +20,7 @@ email                : stdm@unhabitat.org
 """
 import os
 import shutil
+import time
 from PyQt4 import uic
 from PyQt4.QtCore import *
 from PyQt4.QtGui import (
@@ -49,9 +50,12 @@ from stdm.utils.util import setComboCurrentIndexWithText
 from stdm.settings.config_serializer import ConfigurationFileSerializer
 from stdm.geoodk.importer.uuid_extractor import InstanceUUIDExtractor
 from stdm.ui.wizard.custom_item_model import EntitiesModel
-from stdm.geoodk.importer import EntityImporter
+from stdm.geoodk.importer import BatchEntityImporter
 from stdm.settings.projectionSelector import ProjectionSelector
-from stdm.geoodk.importer import ImportLogger
+from stdm.geoodk.importer import (
+    ImportLedger,
+    ImportLogger
+)
 from stdm import resources_rc
 #from stdm.geoodk.importer.geoodkserver import JSONEXTRACTOR
 
@@ -65,6 +69,9 @@ CONFIG_FILE = HOME + '/.stdm/geoodk/'
 MSG = 'Error creating log'
 GEOODK_FORM_HOME = CONFIG_FILE+'instances'
 
+#Minimum number of seconds between progress updates during import
+PROGRESS_INTERVAL = 0.25
+
 class ProfileInstanceRecords(QDialog, FORM_CLASS):
     """
     class constructor
@@ -86,6 +93,7 @@ class ProfileInstanceRecords(QDialog, FORM_CLASS):
         self.relations = {}
         self.parent_ids = {}
         self.importlogger = ImportLogger()
+        self.import_ledger = ImportLedger()
         self._notif_bar_str = NotificationBar(self.vlnotification)
 
         self.chk_all.setCheckState(Qt.Checked)
@@ -217,6 +225,7 @@ class ProfileInstanceRecords(QDialog, FORM_CLASS):
             directories = self.xform_xpaths()
             for directory in directories:
                 self.extract_guuid_and_rename_file(directory)
+            self.check_previous_import()
 
     def extract_guuid_and_rename_file(self, path):
         """
@@ -345,55 +354,70 @@ class ProfileInstanceRecords(QDialog, FORM_CLASS):
                                        QMessageBox.Ok | QMessageBox.No) == QMessageBox.No:
                 return
         try:
-            parents_info = []
-            counter = 0
             if len(self.instance_list) > 0:
-                self.pgbar.setRange(counter, len(self.instance_list))
+                self.pgbar.setRange(0, len(self.instance_list))
                 self.pgbar.setValue(0)
-                for instance in self.instance_list:
-                    import_status = False
-                    counter = counter + 1
-                    self.parent_ids = {}
-                    entity_importer = EntityImporter(instance)
-                    group_identifier = entity_importer.instance_group_id()
-                    #set the geometry coordinate system
-                    entity_importer.geomsetter(self.on_projection_select())
+
+                #Resolve the tables once for all the instances
+                parents_info = []
+                if has_relations:
+                    instance_entities = self.instance_entities() or []
+                    parents_info = [t for t in self.relations.keys()
+                                    if t in instance_entities]
+                import_str = self.uuid_extractor.has_str_captured_in_instance()
+                cu_obj = ', '.join(
+                    parents_info +
+                    [t for t in entity_info if not t in parents_info]
+                )
+
+                num_instances = len(self.instance_list)
+                progress = {'updated': 0}
+
+                def on_instance_imported(counter, instance, status, msg):
                     self.archive_this_import_file(counter, instance)
-                    if has_relations:
-                        #Import parents table first
-                        for parent_table in self.relations.keys():
-                            cu_obj = parent_table
-                            if parent_table in self.instance_entities():
-                                ref_id, import_status = entity_importer.process_parent_entity_import(parent_table)
-                                if group_identifier:
-                                    self.parent_ids[parent_table] = [ref_id, group_identifier]
-                                else:
-                                    self.parent_ids[parent_table] = [ref_id, parent_table]
-                                log_timestamp = '{0} -- parent table import succeeded: {1}'\
-                                    .format(parent_table, str(import_status))
-                                self.log_table_entry(log_timestamp)
-                                parents_info.append(parent_table)
-                                if parent_table[1] in entity_info:
-                                    entity_info.remove(parent_table)
-                    for table in entity_info:
-                        cu_obj = table
-                        if table not in parents_info:
-                            table_id, status = entity_importer.process_import_to_db(table, self.parent_ids)
-                            if table in self.parent_ids:
-                                continue
-                            else:
-                                self.parent_ids[table] = [table_id, group_identifier]
-                            self.log_table_entry(" -- {0} import succeeded: ".format(cu_obj)+str(status))
-                    self.txt_feedback.append(
-                        'saving record "{0}" to database'.format(counter))
-                    if self.uuid_extractor.has_str_captured_in_instance():
-                         if self.parent_ids is not None:
-                            entity_importer.process_social_tenure(self.parent_ids)
-                            self.log_table_entry(" -- saving social tenure relationship")
-                    self.pgbar.setValue(counter)
+                    if status:
+                        self.log_table_entry(
+                            " -- {0} import succeeded: True {1}".format(
+                                cu_obj, msg).rstrip()
+                        )
+                    else:
+                        self.log_table_entry(
+                            msg + ' -- {0} import succeeded: False'.format(
+                                cu_obj)
+                        )
+                        self.txt_feedback.append(
+                            'record "{0}" could not be saved: {1}'.format(
+                                counter, msg))
+
+                    #Refresh the dialog periodically rather than per record
+                    now = time.time()
+                    if now - progress['updated'] >= PROGRESS_INTERVAL or \
+                            counter == num_instances:
+                        progress['updated'] = now
+                        self.txt_feedback.append(
+                            'saving record "{0}" to database'.format(counter))
+                        self.pgbar.setValue(counter)
+                        QApplication.processEvents()
+
+                importer = BatchEntityImporter(self.on_projection_select())
+                num_imported, failures = importer.import_instances(
+                    self.instance_list,
+                    parents_info,
+                    entity_info,
+                    import_str,
+                    on_instance_imported,
+                    self.import_ledger,
+                    self.profile
+                )
+                import_status = True
 
                 self.txt_feedback.append('Number of record successfully imported:  {}'
-                                                  .format(counter))
+                                                  .format(num_imported))
+                if len(failures) > 0:
+                    self._notif_bar_str.insertErrorNotification(
+                        '{0} record(s) could not be imported, see the import '
+                        'log for details'.format(len(failures))
+                    )
             else:
                 self._notif_bar_str.insertErrorNotification("No user selected entities to import")
                 self.pgbar.setValue(0)
@@ -465,7 +489,6 @@ class ProfileInstanceRecords(QDialog, FORM_CLASS):
         :return:
         """
         try:
-            self.importlogger.logger_sections()
             file_info = 'File instance ' + str(counter)+ ' : \n' + instance
             self.importlogger.onlogger_action(file_info)
         except IOError as io:
@@ -492,19 +515,18 @@ class ProfileInstanceRecords(QDialog, FORM_CLASS):
         :return:
         """
         try:
-            self.importlogger.add_log_info()
-            for files in self.instance_list:
-                current_dir = os.path.basename(files)
-                exist = self.importlogger.check_file_exist(current_dir)
-                if exist:
-                    self.instance_list.remove(files)
-            self.txt_count.setText(str(len(self.instance_list)))
-            if self.record_count() != len(self.instance_list):
+            imported = self.import_ledger.imported_instances(
+                self.instance_list
+            )
+            if len(imported) > 0:
+                self.instance_list = [f for f in self.instance_list
+                                      if not f in imported]
                 msg = 'Some files have been already imported and therefore ' \
                    'not enumerated'
                 self._notif_bar_str.insertErrorNotification(msg)
-        except IOError as io:
-            self._notif_bar_str.insertErrorNotification(MSG + ": "+io.message)
+            self.txt_count.setText(str(len(self.instance_list)))
+        except Exception as ex:
+            self._notif_bar_str.insertErrorNotification(MSG + ": "+unicode(ex))
             pass
 
     def available_records(self):
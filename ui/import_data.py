@@ -44,6 +44,7 @@ from stdm.data.importexport import (
 )
 from stdm.data.importexport.value_translators import ValueTranslatorManager
 from stdm.data.importexport.reader import OGRReader
+from stdm.data.expression_evaluator import update_expression_columns
 from .importexport import (
     ValueTranslatorConfig,
     TranslatorWidgetManager
@@ -478,26 +479,25 @@ class ImportData(QWizard, Ui_frmImport):
                 )
 
                 if del_result == QMessageBox.Yes:
-                    self.dataReader.featToDb(
+                    failed_chunks = self.dataReader.featToDb(
                         self.targetTab, matchCols, False, self, geom_column,
                         translator_manager=value_translator_manager
                     )
+                    self._update_expression_columns()
                     # Update directory info in the registry
                     setVectorFileDir(self.field("srcFile"))
 
-                    self.InfoMessage(
-                        "All features have been imported successfully!")
+                    self._show_import_result(failed_chunks)
 
                 else:
                     success = False
         else:
-            self.dataReader.featToDb(
+            failed_chunks = self.dataReader.featToDb(
                 self.targetTab, matchCols, True, self, geom_column,
                 translator_manager=value_translator_manager
             )
-            self.InfoMessage(
-                "All features have been imported successfully!"
-            )
+            self._update_expression_columns()
+            self._show_import_result(failed_chunks)
             #Update directory info in the registry
             setVectorFileDir(self.field("srcFile"))
             success = True
@@ -506,6 +506,60 @@ class ImportData(QWizard, Ui_frmImport):
 
         return success
 
+    def _update_expression_columns(self):
+        """
+        Evaluates the expression columns of the imported records in bulk
+        since the values are not part of the source data.
+        """
+        entity = self.curr_profile.entity_by_name(self.targetTab)
+        if entity is None:
+            return
+
+        try:
+            update_expression_columns(entity, self.dataReader.inserted_ids)
+
+        except Exception as ex:
+            self.ErrorInfoMessage(u'{0}\n{1}'.format(
+                QApplication.translate(
+                    'ImportData',
+                    'The expression columns could not be updated.'
+                ),
+                unicode(ex)
+            ))
+
+    def _show_import_result(self, failed_chunks):
+        """
+        Notifies the user on the outcome of the import process.
+        :param failed_chunks: Chunks that could not be imported as returned
+        by the data reader.
+        :type failed_chunks: list
+        """
+        if len(failed_chunks) == 0:
+            self.InfoMessage(
+                "All features have been imported successfully!"
+            )
+
+            return
+
+        chunk_msgs = []
+        for feature_ids, error_msg in failed_chunks:
+            ids_str = ', '.join([str(fid) for fid in feature_ids[:20]])
+            if len(feature_ids) > 20:
+                ids_str = u'{0}...'.format(ids_str)
+
+            chunk_msgs.append(
+                u'Feature IDs {0}: {1}'.format(ids_str, error_msg)
+            )
+
+        msg = QApplication.translate(
+            'ImportData',
+            'The import completed but some features could not be imported. '
+            'The following chunks of features were rolled back:'
+        )
+        self.ErrorInfoMessage(u'{0}\n\n{1}'.format(
+            msg, '\n'.join(chunk_msgs)
+        ))
+
     def _clear_dest_table_selections(self, exclude=None):
         #Clears checked items in destination table list view
         if exclude is None:
@@ -40,7 +40,6 @@ from stdm.ui.social_tenure.str_editor import STREditor, EditSTREditor
 import stdm.data
 
 from stdm.data.qtmodels import (
-    BaseSTDMTableModel,
     STRTreeViewModel
 )
 
@@ -60,6 +59,21 @@ from stdm.utils.util import (
 )
 
 from stdm.data.pg_utils import pg_table_count
+from stdm.data.str_validity import (
+    split_valid_str_rows,
+    with_valid_str_ids
+)
+from stdm.data.text_search import (
+    ColumnTextSearch,
+    ensure_search_indexes,
+    folded_value,
+    FUZZY_MATCH,
+    match_clause,
+    MIN_FUZZY_LENGTH,
+    PREFIX_MATCH,
+    similarity,
+    trigram_supported
+)
 
 from stdm.ui.feature_details import DetailsTreeView
 from .notification import (
@@ -76,6 +90,12 @@ from ui_str_view_entity import Ui_frmSTRViewEntity
 
 LOGGER = logging.getLogger('stdm')
 
+#Milliseconds after the last keystroke before suggestions are queried
+SUGGESTION_DELAY = 300
+
+#Maximum number of records returned by prefix and fuzzy searches
+SEARCH_RESULT_LIMIT = 1000
+
 
 class ViewSTRWidget(QMainWindow, Ui_frmManageSTR):
     """
@@ -421,15 +441,16 @@ class ViewSTRWidget(QMainWindow, Ui_frmManageSTR):
             entity = self.curr_profile.entity_by_name(entity_name)
 
             result_ids = [r.id for r in results]
+            valid_str_ids = getattr(entityWidget, 'valid_str_ids', None)
 
             if entity_name in party_names:
 
                 self.details_tree_view.search_party(
-                    entity, result_ids
+                    entity, result_ids, valid_str_ids
                 )
             else:
                 self.details_tree_view.search_spatial_unit(
-                    entity, result_ids
+                    entity, result_ids, valid_str_ids
                 )
             # self._load_root_node(entity_name, formattedNode)
 
@@ -842,14 +863,27 @@ class STRViewEntityWidget(QWidget,Ui_frmSTRViewEntity,EntitySearchItem):
         self.curr_profile = current_profile()
         self.social_tenure = self.curr_profile.social_tenure
         self.str_model = entity_model(self.social_tenure)
-        #Model for storing display and actual mapping values
-        self._completer_model = None
-        self._proxy_completer_model = None
+
+        #Ids of the STR records valid within the validity period of the
+        #last search, None if the period was not specified
+        self.valid_str_ids = None
+
+        #Values suggested as the user types are queried from the database
+        self._column_search = None
+        self._suggestion_model = QStringListModel(self)
+        self._suggestion_timer = QTimer(self)
+        self._suggestion_timer.setSingleShot(True)
+        self._suggestion_timer.setInterval(SUGGESTION_DELAY)
+        self._suggestion_timer.timeout.connect(self._load_suggestions)
+        self._init_completer()
 
         #Hook up signals
         self.cboFilterCol.currentIndexChanged.connect(
             self._on_column_index_changed
         )
+        self.txtFilterPattern.textEdited.connect(
+            self._on_filter_text_edited
+        )
         self.init_validity_dates()
         self.validity_from_date.dateChanged.connect(
             self.set_minimum_to_date
@@ -910,10 +944,46 @@ class STRViewEntityWidget(QWidget,Ui_frmSTRViewEntity,EntitySearchItem):
                     display_name, col_name
                 )
 
+    def _lookup_entity(self):
+        """
+        :return: Returns the lookup entity of the current filter column or
+        None if it is not a lookup column.
+        :rtype: Entity
+        """
+        entity = self.curr_profile.entity_by_name(
+            self.config.data_source_name
+        )
+        col_name = self.currentFieldName()
+        col = entity.columns.get(col_name, None)
+
+        if col is None or col.TYPE_INFO != 'LOOKUP':
+            return None
+
+        return lookup_parent_entity(self.curr_profile, col_name)
+
     def loadAsync(self):
         """
-        Asynchronously loads an entity's attribute values.
+        Sets the source of the suggested values for the current filter
+        column and asynchronously creates the column's search indexes.
         """
+        field_name = self.currentFieldName()
+        if field_name is None:
+            return
+
+        self._suggestion_model.setStringList([])
+
+        #Lookup values are suggested and the entity is filtered by id
+        lookup_entity = self._lookup_entity()
+        if lookup_entity is None:
+            self._column_search = ColumnTextSearch(
+                self.config.data_source_name, field_name
+            )
+
+        else:
+            self._column_search = ColumnTextSearch(
+                lookup_entity.name, 'value'
+            )
+
         self.asyncStarted.emit()
 
         #Create model worker
@@ -924,8 +994,10 @@ class STRViewEntityWidget(QWidget,Ui_frmSTRViewEntity,EntitySearchItem):
         #Connect signals
         modelWorker.error.connect(self.errorHandler)
         workerThread.started.connect(
-            lambda: modelWorker.fetch(
-                self.config.STRModel, self.currentFieldName()
+            lambda: modelWorker.create_indexes(
+                self.config.data_source_name,
+                field_name,
+                lookup_entity is None
             )
         )
         modelWorker.retrieved.connect(self._asyncFinished)
@@ -971,124 +1043,135 @@ class STRViewEntityWidget(QWidget,Ui_frmSTRViewEntity,EntitySearchItem):
             0, 10
         )
         search_term = self._searchTerm()
+        self.valid_str_ids = None
 
         prog_dialog.setValue(2)
-        #Try to get the corresponding search term value from the completer model
-        if not self._completer_model is None:
-            reg_exp = QRegExp("^%s$"%(search_term), Qt.CaseInsensitive,
-                              QRegExp.RegExp2)
-            self._proxy_completer_model.setFilterRegExp(reg_exp)
-
-            if self._proxy_completer_model.rowCount() > 0:
-                #Get corresponding actual value from the first matching item
-                value_model_idx  = self._proxy_completer_model.index(0, 1)
-                source_model_idx = self._proxy_completer_model.mapToSource(
-                    value_model_idx
-                )
-                prog_dialog.setValue(4)
-                search_term = self._completer_model.data(
-                    source_model_idx, Qt.DisplayRole
-                )
 
         modelInstance = self.config.STRModel()
 
-
         modelQueryObj = modelInstance.queryObject()
 
+        #Records without valid STRs are excluded in the search query
+        filter_validity = self.validity.isEnabled()
+        if filter_validity:
+            modelQueryObj = self.str_validity_period_filter(modelQueryObj)
+
         queryObjProperty = getattr(
             self.config.STRModel, self.currentFieldName()
         )
 
-        entity_name = modelQueryObj._primary_entity._label_name
-
-        entity = self.curr_profile.entity_by_name(entity_name)
-
         prog_dialog.setValue(6)
-        # Get property type so that the filter can
-        # be applied according to the appropriate type
-        propType = queryObjProperty.property.columns[0].type
         results = []
         try:
-            if not isinstance(propType, String):
+            lookup_entity = self._lookup_entity()
 
-                col_name = self.currentFieldName()
-                col = entity.columns[self.currentFieldName()]
-
-                if col.TYPE_INFO == 'LOOKUP':
-                    lookup_entity = lookup_parent_entity(
-                        self.curr_profile, col_name
-                    )
-                    lkp_model = entity_model(lookup_entity)
-                    lkp_obj = lkp_model()
-                    value_obj = getattr(
-                        lkp_model, 'value'
-                    )
+            if not lookup_entity is None:
+                lkp_model = entity_model(lookup_entity)
+                lkp_obj = lkp_model()
+                value_obj = getattr(
+                    lkp_model, 'value'
+                )
 
-                    result  = lkp_obj.queryObject().filter(
-                        func.lower(value_obj) == func.lower(search_term)
+                result = lkp_obj.queryObject().filter(
+                    match_clause(value_obj, search_term)
+                ).first()
+                if result is None:
+                    result = lkp_obj.queryObject().filter(
+                        match_clause(value_obj, search_term, PREFIX_MATCH)
                     ).first()
-                    if result is None:
-                        result = lkp_obj.queryObject().filter(
-                            func.lower(value_obj).like(search_term+'%')
-                        ).first()
 
-                    if not result is None:
-                        results = modelQueryObj.filter(
-                            queryObjProperty == result.id
-                        ).all()
-
-                    else:
-                        results = []
+                if not result is None:
+                    results = modelQueryObj.filter(
+                        queryObjProperty == result.id
+                    ).all()
 
             else:
-                results = modelQueryObj.filter(
-                    func.lower(queryObjProperty) == func.lower(search_term)
-                ).all()
+                results = self._matching_records(
+                    modelQueryObj, queryObjProperty, search_term
+                )
 
-            if self.validity.isEnabled():
-                valid_str_ids = self.str_validity_period_filter(results)
-            else:
-                valid_str_ids = None
+            if filter_validity:
+                results, self.valid_str_ids = split_valid_str_rows(results)
 
             prog_dialog.setValue(7)
-        except exc.StatementError:
-            return model_root_node, [], search_term
+        except exc.StatementError as db_error:
+            LOGGER.debug(unicode(db_error))
+            prog_dialog.hide()
+
+            return [], search_term
 
         # if self.formatter is not None:
             # self.formatter.setData(results)
-            # model_root_node = self.formatter.root(valid_str_ids)
+            # model_root_node = self.formatter.root(self.valid_str_ids)
         prog_dialog.setValue(10)
         prog_dialog.hide()
 
         return results, search_term
 
-    def str_validity_period_filter(self, results):
-        """
-        Filter the entity results using validity period in STR table.
-        :param results: Entity result
-        :type results: SQLAlchemy result proxy
-        :return: Valid list of STR ids
-        :rtype: List
-        """
-        self.str_model_obj = self.str_model()
-        valid_str_ids = []
-        for result in results:
-            from_date = self.validity_from_date.date().toPyDate()
-            to_date = self.validity_to_date.date().toPyDate()
-            entity_id = '{}_id'.format(result.__table__.name[3:])
-            str_column_obj = getattr(self.str_model, entity_id)
-            str_result = self.str_model_obj.queryObject().filter(
-                self.str_model.validity_start >= from_date).filter(
-                self.str_model.validity_end <= to_date
-            ).filter(str_column_obj==result.id).all()
-
-            for res in str_result:
-                valid_str_ids.append(res.id)
-
-        return valid_str_ids
-
-
-
+    def _matching_records(self, query, column_property, search_term):
+        """
+        Searches for exact matches and, if there are none, for values
+        starting with the search term followed by similar values. The
+        matching is case-insensitive and uses the search indexes.
+        :param query: Query of the entity records.
+        :type query: Query
+        :param column_property: Attribute of the filter column.
+        :param search_term: Search term.
+        :type search_term: str
+        :return: Returns the matching records.
+        :rtype: list
+        """
+        results = query.filter(
+            match_clause(column_property, search_term)
+        ).all()
+
+        if len(results) == 0:
+            results = query.filter(
+                match_clause(column_property, search_term, PREFIX_MATCH)
+            ).order_by(
+                folded_value(column_property)
+            ).limit(SEARCH_RESULT_LIMIT).all()
+
+        if len(results) == 0 and len(search_term) >= MIN_FUZZY_LENGTH and \
+                trigram_supported():
+            results = query.filter(
+                match_clause(column_property, search_term, FUZZY_MATCH)
+            ).order_by(
+                similarity(column_property, search_term).desc()
+            ).limit(SEARCH_RESULT_LIMIT).all()
+
+        return results
+
+    def str_validity_period_filter(self, query):
+        """
+        Filters the entity query using the validity period of the records
+        in the STR table. The ids of the valid STR records are returned
+        with each entity record.
+        :param query: Entity query.
+        :type query: Query
+        :return: Returns the query whose rows contain the entity record
+        and the list of its valid STR ids.
+        :rtype: Query
+        """
+        from_date = self.validity_from_date.date().toPyDate()
+        to_date = self.validity_to_date.date().toPyDate()
+
+        entity = self.curr_profile.entity_by_name(
+            self.config.data_source_name
+        )
+        entity_id = u'{0}_id'.format(
+            entity.short_name.replace(' ', '_').lower()
+        )
+        str_column_obj = getattr(self.str_model, entity_id)
+
+        return with_valid_str_ids(
+            query,
+            self.config.STRModel,
+            self.str_model,
+            str_column_obj,
+            from_date,
+            to_date
+        )
 
     def reset(self):
         """
@@ -1117,61 +1200,51 @@ class STRViewEntityWidget(QWidget,Ui_frmSTRViewEntity,EntitySearchItem):
         """
         return self.txtFilterPattern.text()
 
-    def _asyncFinished(self, model_values):
+    def _asyncFinished(self, result=None):
         """
-        Slot raised when worker has finished retrieving items.
+        Slot raised when the worker has finished creating the indexes.
         """
-        #Create QCompleter and add values to it.
-        self._update_completer(model_values)
         self.asyncFinished.emit()
 
-    def _update_completer(self, values):
-        #Get the items in a tuple and put them in a list
-        field_formatter = self.config.LookupFormatters.get(
-            self.currentFieldName(), None
+    def _init_completer(self):
+        #Values are filtered in the database hence shown as they are
+        mod_completer = QCompleter(self._suggestion_model, self)
+        mod_completer.setCaseSensitivity(Qt.CaseInsensitive)
+        mod_completer.setCompletionMode(
+            QCompleter.UnfilteredPopupCompletion
         )
 
-        # Store display and actual values in a
-        # model for easier mapping and
-        # retrieval when carrying out searches
-
-        model_attr_mapping = []
-
-        # Check if there are formaters specified
-        # for the current field name
-        for mv in values:
-            f_model_values = []
-
-            m_val = mv[0]
+        self.txtFilterPattern.setCompleter(mod_completer)
 
-            #2-column model - display (0) and actual(1)
-            if field_formatter is None:
-                f_model_values.append(m_val)
-                f_model_values.append(m_val)
+    def _on_filter_text_edited(self, text):
+        """
+        Slot raised when the user types in the search box. Suggestions are
+        queried once the user pauses typing.
+        """
+        self._suggestion_timer.start()
 
-            else:
-                f_model_values.append(field_formatter(m_val))
-                f_model_values.append(m_val)
+    def _load_suggestions(self):
+        """
+        Queries the values matching the search term and shows them in the
+        completer.
+        """
+        if self._column_search is None:
+            return
 
-            model_attr_mapping.append(f_model_values)
+        try:
+            values = self._column_search.suggestions(self._searchTerm())
 
-        self._completer_model = BaseSTDMTableModel(model_attr_mapping, ["",""], self)
+        except exc.SQLAlchemyError as db_error:
+            self.errorHandler(unicode(db_error))
 
-        #We will use the QSortFilterProxyModel for filtering purposes
-        self._proxy_completer_model = QSortFilterProxyModel()
-        self._proxy_completer_model.setDynamicSortFilter(True)
-        self._proxy_completer_model.setSourceModel(self._completer_model)
-        self._proxy_completer_model.setSortCaseSensitivity(Qt.CaseInsensitive)
-        self._proxy_completer_model.setFilterKeyColumn(0)
+            return
 
-        #Configure completer
-        mod_completer = QCompleter(self._completer_model, self)
-        mod_completer.setCaseSensitivity(Qt.CaseInsensitive)
-        mod_completer.setCompletionMode(QCompleter.PopupCompletion)
-        mod_completer.setCompletionColumn(0)
-        mod_completer.setCompletionRole(Qt.DisplayRole)
+        self._suggestion_model.setStringList(
+            [unicode(v) for v in values if not v is None]
+        )
 
-        self.txtFilterPattern.setCompleter(mod_completer)
+        if len(values) > 0 and self.txtFilterPattern.hasFocus():
+            self.txtFilterPattern.completer().complete()
 
     def _on_column_index_changed(self,int):
         """
@@ -1208,27 +1281,21 @@ class EntityConfiguration(object):
 
 class ModelWorker(QObject):
     """
-    Worker for retrieving model attribute
-    values stored in the database.
+    Worker for preparing the database
+    for searching an entity column.
     """
     retrieved = pyqtSignal(object)
     error = pyqtSignal(unicode)
 
-    pyqtSlot(object, unicode)
-    def fetch(self, model, fieldname):
+    pyqtSlot(unicode, unicode, bool)
+    def create_indexes(self, table_name, column_name, text_search):
         """
-        Fetch attribute values from the
-        database for the specified model
-        and corresponding column name.
+        Creates the indexes used when searching the specified column, if
+        they do not exist.
         """
         try:
-            if hasattr(model, fieldname):
-                modelInstance = model()
-                obj_property = getattr(model, fieldname)
-                model_values = modelInstance.queryObject(
-                    [obj_property]
-                ).distinct()
-                self.retrieved.emit(model_values)
+            ensure_search_indexes(table_name, column_name, text_search)
+            self.retrieved.emit(None)
 
         except Exception as ex:
             self.error.emit(unicode(ex))
@@ -2481,6 +2481,7 @@ class ConfigWizard(QWizard, Ui_STDMWizard):
             profile.entities[tmp_short_name] = editor.lookup
             profile.entities[editor.lookup.short_name] = \
                 profile.entities.pop(tmp_short_name)
+            profile.reset_entity_name_index()
 
         self.lvLookups.setFocus()
 